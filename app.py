@@ -1,15 +1,27 @@
-from flask import Flask, request, redirect, url_for, render_template, flash, session, jsonify
+from flask import Flask, request, redirect, url_for, render_template, flash, session, jsonify, Response, stream_with_context, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_mail import Mail, Message
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 import random
+import re
 import string
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from route_optimizer import optimize_delivery_route, RouteOptimizer
+from spatial_index import SpatialIndex
+from batch_optimizer import solve_batch
+from maps_client import get_default_client
+from metrics import REGISTRY
+from location_import import chunked, import_format, location_key, parse_locations
+import polyline
 
 # Load environment variables
 load_dotenv()
@@ -58,7 +70,7 @@ class DeliveryBoy(UserMixin, db.Model):
 # Delivery Location model
 class DeliveryLocation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    address = db.Column(db.String(255), nullable=False)
+    address = db.Column(db.String(255), nullable=False, index=True)  # Bulk imports look up duplicates by address
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -73,10 +85,28 @@ class Delivery(db.Model):
     status = db.Column(db.String(50), default="Pending")  # Pending, In Progress, Completed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime, nullable=True)
-    order_number = db.Column(db.String(50), nullable=False)
+    order_number = db.Column(db.String(50), nullable=False, index=True)
     customer_name = db.Column(db.String(100), nullable=False)
     customer_phone = db.Column(db.String(20), nullable=True)
     notes = db.Column(db.Text, nullable=True)
+    # Optional delivery window and time spent at the stop
+    window_start = db.Column(db.DateTime, nullable=True)
+    window_end = db.Column(db.DateTime, nullable=True)
+    service_minutes = db.Column(db.Integer, nullable=True)
+
+    # The dashboard counts and lists one delivery boy's deliveries by status and by date
+    __table_args__ = (
+        db.Index("ix_delivery_boy_status", "delivery_boy_id", "status"),
+        db.Index("ix_delivery_boy_created", "delivery_boy_id", "created_at"),
+        # The admin delivery list pages through everything, or one status, newest first
+        db.Index("ix_delivery_created", "created_at", "id"),
+        db.Index("ix_delivery_status_created", "status", "created_at"),
+    )
+
+# Counter behind generated order numbers; each call reserves a block of values
+class OrderSequence(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False, default=1)
 
 # Add this new model for depot locations
 class DeliveryDepot(db.Model):
@@ -95,23 +125,202 @@ class Assignment(db.Model):
     source_lng = db.Column(db.Float, nullable=False)
     dest_lat = db.Column(db.Float, nullable=False)
     dest_lng = db.Column(db.Float, nullable=False)
-    waypoints = db.Column(db.Text, nullable=True)  # "lat1,lng1;lat2,lng2"
+    waypoints = db.Column(db.Text, nullable=True)  # Old "lat1,lng1;lat2,lng2" text, moved to route_polyline by upgrade_schema()
+    route_polyline = db.Column(db.Text, nullable=True)  # Waypoints as a Google encoded polyline
+    stop_order = db.Column(db.Text, nullable=True)  # JSON list of location ids in visiting order
+    route_metadata = db.Column(db.Text, nullable=True)  # JSON, e.g. solver_used and total_distance
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(50), default="Active")
     delivery_boy = db.relationship('DeliveryBoy', backref='assignments')
 
+# Columns added after the first release; create_all() does not alter existing tables
+SCHEMA_UPGRADES = [
+    ("delivery", "window_start", "DATETIME"),
+    ("delivery", "window_end", "DATETIME"),
+    ("delivery", "service_minutes", "INTEGER"),
+    ("assignment", "route_polyline", "TEXT"),
+    ("assignment", "stop_order", "TEXT"),
+    ("assignment", "route_metadata", "TEXT"),
+]
+
+def upgrade_schema():
+    """Add any missing columns and indexes to an existing database."""
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table, column, column_type in SCHEMA_UPGRADES:
+            if not inspector.has_table(table):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            if column not in existing:
+                connection.execute(db.text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+        for table in db.Model.metadata.sorted_tables:
+            if inspector.has_table(table.name):
+                for index in table.indexes:
+                    index.create(bind=connection, checkfirst=True)
+        if inspector.has_table("assignment"):
+            migrate_assignment_waypoints(connection)
+        if inspector.has_table("order_sequence"):
+            seed_order_sequence(connection)
+
+def migrate_assignment_waypoints(connection):
+    """
+    Encode the old text waypoints of each assignment as a polyline, once. Rows whose
+    text cannot be parsed are left as they are and reported.
+    """
+    rows = connection.execute(db.text(
+        "SELECT id, waypoints FROM assignment WHERE waypoints IS NOT NULL AND route_polyline IS NULL"
+    )).fetchall()
+    updates = []
+    for assignment_id, waypoints in rows:
+        try:
+            updates.append({"id": assignment_id, "route_polyline": polyline.encode(polyline.parse_waypoints(waypoints))})
+        except ValueError as e:
+            print(f"Could not migrate waypoints of assignment {assignment_id}: {e}")
+    if updates:
+        connection.execute(db.text(
+            "UPDATE assignment SET route_polyline = :route_polyline, waypoints = NULL WHERE id = :id"
+        ), updates)
+
+# Background route optimization job
+class OptimizationJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(20), default="queued", index=True)  # queued, running, cancelling, completed, failed, cancelled
+    progress = db.Column(db.Float, default=0.0)
+    message = db.Column(db.String(255), nullable=True)
+    params = db.Column(db.Text, nullable=False)  # JSON
+    result = db.Column(db.Text, nullable=True)  # JSON
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
 # User loader for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
     return DeliveryBoy.query.get(int(user_id))
 
+# Request latency per endpoint, exposed on /metrics
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        REGISTRY.observe('http_request_duration_seconds', time.perf_counter() - started,
+                         help='Flask request latency by endpoint', endpoint=request.endpoint or 'unmatched',
+                         method=request.method, status=response.status_code)
+    return response
+
+# Delivery statuses are written both as "Pending"/"In Progress" and "pending"/"in_progress",
+# sometimes with stray spaces around them; compare them in this form
+def normalized_status(column):
+    return db.func.lower(db.func.replace(db.func.trim(column), " ", "_"))
+
+# Every spelling a status is stored with, so status filters can use the status indexes
+DELIVERY_STATUS_SPELLINGS = {
+    "pending": ["pending", "Pending"],
+    "in_progress": ["in_progress", "In Progress"],
+    "completed": ["completed", "Completed"],
+}
+DELIVERIES_PER_PAGE = 50
+
+# Keyset pagination cursor for the delivery list: "<created_at ISO>_<id>" of the last row shown
+def delivery_cursor(delivery):
+    return f"{delivery.created_at.isoformat()}_{delivery.id}"
+
+def parse_delivery_cursor(value):
+    try:
+        created_at, delivery_id = value.rsplit("_", 1)
+        return datetime.fromisoformat(created_at), int(delivery_id)
+    except (AttributeError, ValueError):
+        return None
+
+# Helper function to load one page of deliveries older than the cursor, newest first,
+# with their delivery boy and location joined into the same query
+def delivery_page(status, delivery_boy_id, cursor, limit):
+    def newest(spelling=None):
+        query = Delivery.query.options(db.joinedload(Delivery.delivery_boy), db.joinedload(Delivery.location))
+        if spelling:
+            query = query.filter(Delivery.status == spelling)
+        if delivery_boy_id:
+            query = query.filter(Delivery.delivery_boy_id == delivery_boy_id)
+        if cursor:
+            query = query.filter(db.tuple_(Delivery.created_at, Delivery.id) < cursor)
+        return query.order_by(Delivery.created_at.desc(), Delivery.id.desc()).limit(limit).all()
+
+    if status is None:
+        return newest()
+    # One index-ordered query per spelling merged here, instead of sorting every match
+    deliveries = [d for spelling in DELIVERY_STATUS_SPELLINGS[status] for d in newest(spelling)]
+    return sorted(deliveries, key=lambda d: (d.created_at, d.id), reverse=True)[:limit]
+
 # Helper function to generate a random verification code
 def generate_verification_code():
     return ''.join(random.choices(string.ascii_letters + string.digits, k=6))
 
-# Helper function to generate a random order number
+# Helper function to read a datetime-local form value ("2024-05-01T14:30")
+def parse_window_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M")
+    except ValueError:
+        return None
+
+# Helper function to turn the delivery windows at each location into hours after departure
+def delivery_windows(location_ids, departure):
+    deliveries = Delivery.query.filter(
+        Delivery.location_id.in_(location_ids),
+        normalized_status(Delivery.status) != "completed"
+    ).all()
+    windows = {}
+    for delivery in deliveries:
+        if delivery.window_start is None and delivery.window_end is None and delivery.service_minutes is None:
+            continue
+        window = windows.setdefault(delivery.location_id, {})
+        # Several open deliveries at one stop: keep the tightest window and add up service time
+        if delivery.window_start is not None:
+            start = (delivery.window_start - departure).total_seconds() / 3600
+            window['window_start'] = max(window.get('window_start', start), start)
+        if delivery.window_end is not None:
+            end = (delivery.window_end - departure).total_seconds() / 3600
+            window['window_end'] = min(window.get('window_end', end), end)
+        if delivery.service_minutes is not None:
+            window['service_minutes'] = window.get('service_minutes', 0) + delivery.service_minutes
+    return windows
+
+GENERATED_ORDER_NUMBER = re.compile(r"ORD-\d{8,}")  # What reserve_order_numbers() hands out
+
+# Helper function to reserve count consecutive order numbers in the current transaction.
+# The counter row is updated first, which locks it, so concurrent callers get disjoint blocks.
+def reserve_order_numbers(count):
+    if count <= 0:
+        return []
+    if not advance_order_sequence(count):
+        # First use on a database upgrade_schema() has not seeded yet
+        seed_order_sequence(db.session)
+        advance_order_sequence(count)
+    first = db.session.query(OrderSequence.next_value).filter_by(name="order").scalar() - count
+    return [f"ORD-{number:08d}" for number in range(first, first + count)]
+
+# Helper function to move the order counter on; returns whether the counter row exists
+def advance_order_sequence(count):
+    return OrderSequence.query.filter_by(name="order").update(
+        {OrderSequence.next_value: OrderSequence.next_value + count}, synchronize_session=False
+    )
+
+# Helper function to create the order counter row unless it exists; concurrent callers may both run it
+def seed_order_sequence(connection):
+    connection.execute(db.text(
+        "INSERT INTO order_sequence (name, next_value) SELECT 'order', 1 "
+        "WHERE NOT EXISTS (SELECT 1 FROM order_sequence WHERE name = 'order')"
+    ))
+
+# Helper function to generate a new order number
 def generate_order_number():
-    return f"ORD-{random.randint(1000, 9999)}"
+    return reserve_order_numbers(1)[0]
 
 # Route to register a new delivery boy
 @app.route("/register", methods=["GET", "POST"])
@@ -267,14 +476,18 @@ def dashboard():
     current_time = now.strftime("%I:%M %p")
     current_date = now.strftime("%A, %B %d, %Y")
     
-    # Get user's deliveries
-    user_deliveries = Delivery.query.filter_by(delivery_boy_id=current_user.id).all()
-    
-    # Count deliveries by status
-    total_deliveries = len(user_deliveries)
-    active_deliveries = len([d for d in user_deliveries if d.status == "In Progress"])
-    pending_orders = len([d for d in user_deliveries if d.status == "Pending"])
-    completed_deliveries = len([d for d in user_deliveries if d.status == "Completed"])
+    # Count the user's deliveries by status in one query (served from the status index)
+    status = normalized_status(Delivery.status)
+    counts = dict(
+        db.session.query(status, db.func.count(Delivery.id))
+        .filter(Delivery.delivery_boy_id == current_user.id)
+        .group_by(status)
+        .all()
+    )
+    total_deliveries = sum(counts.values())
+    active_deliveries = counts.get("in_progress", 0)
+    pending_orders = counts.get("pending", 0)
+    completed_deliveries = counts.get("completed", 0)
     
     # Calculate earnings (example: $10 per delivery)
     total_earnings = completed_deliveries * 10
@@ -305,6 +518,7 @@ def manage_locations():
         new_location = DeliveryLocation(address=address, latitude=latitude, longitude=longitude)
         db.session.add(new_location)
         db.session.commit()
+        invalidate_location_index()
         return redirect(url_for("manage_locations"))
     locations = DeliveryLocation.query.all()
     locations_dicts = [
@@ -325,6 +539,76 @@ def manage_locations():
         google_maps_api_key=GOOGLE_MAPS_API_KEY
     )
 
+LOCATION_IMPORT_CHUNK = 500  # Rows inserted and committed together by the bulk import
+MAX_REPORTED_IMPORT_ERRORS = 100
+
+@app.route("/admin/locations/import", methods=["POST"])
+@login_required
+def import_locations():
+    """
+    Bulk-add locations from a CSV (address, latitude, longitude columns) or NDJSON upload,
+    sent as a "file" form field or as the request body. The upload is read as a stream and
+    inserted in chunks, one transaction each. Rows with the same address and coordinates
+    as an existing location, or an earlier row, are skipped.
+    """
+    upload = request.files.get("file")
+    fmt = import_format(request.args.get("format") or request.form.get("format"),
+                        upload.filename if upload else None, None if upload else request.mimetype)
+    if fmt is None:
+        return jsonify({"success": False, "message": "Upload a .csv or .ndjson file, or pass format=csv|ndjson"}), 400
+
+    inserted = duplicates = error_count = 0
+    errors = []
+    seen = set()
+    for chunk in chunked(parse_locations(upload.stream if upload else request.stream, fmt), LOCATION_IMPORT_CHUNK):
+        valid = []
+        for line, location, error in chunk:
+            if error is None:
+                valid.append(location)
+                continue
+            error_count += 1
+            if len(errors) < MAX_REPORTED_IMPORT_ERRORS:
+                errors.append({"line": line, "error": error})
+
+        # One query per chunk for existing locations at any of its addresses
+        existing = set()
+        addresses = {location["address"] for location in valid}
+        if addresses:
+            existing = {
+                location_key(*row)
+                for row in db.session.query(DeliveryLocation.address, DeliveryLocation.latitude, DeliveryLocation.longitude)
+                .filter(DeliveryLocation.address.in_(addresses))
+            }
+        rows = []
+        for location in valid:
+            key = location_key(location["address"], location["latitude"], location["longitude"])
+            if key in existing or key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            rows.append(location)
+
+        if rows:
+            try:
+                db.session.execute(DeliveryLocation.__table__.insert(), rows)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Location import failed: {e}")
+                return jsonify({"success": False, "message": str(e), "inserted": inserted,
+                                "duplicates": duplicates, "error_count": error_count, "errors": errors}), 500
+            inserted += len(rows)
+
+    if inserted:
+        invalidate_location_index()
+    return jsonify({
+        "success": True,
+        "inserted": inserted,
+        "duplicates": duplicates,
+        "error_count": error_count,
+        "errors": errors
+    })
+
 @app.route("/admin/locations/<int:location_id>", methods=["DELETE"])
 @login_required
 def delete_location(location_id):
@@ -336,9 +620,48 @@ def delete_location(location_id):
     
     db.session.delete(location)
     db.session.commit()
+    invalidate_location_index()
     
     return jsonify({"success": True})
 
+# Spatial index over all delivery locations, rebuilt lazily after locations change
+_location_index = None
+
+def get_location_index():
+    global _location_index
+    if _location_index is None:
+        _location_index = SpatialIndex.from_rows(
+            db.session.query(DeliveryLocation.id, DeliveryLocation.latitude, DeliveryLocation.longitude).all()
+        )
+    return _location_index
+
+def invalidate_location_index():
+    global _location_index
+    _location_index = None
+
+@app.route("/admin/locations/nearby", methods=["GET"])
+@login_required
+def nearby_locations():
+    latitude = request.args.get("lat", type=float)
+    longitude = request.args.get("lng", type=float)
+    if latitude is None or longitude is None:
+        return jsonify({"success": False, "message": "lat and lng are required"}), 400
+
+    index = get_location_index()
+    radius_km = request.args.get("radius_km", type=float)
+    if radius_km is not None:
+        matches = index.within(latitude, longitude, radius_km)
+    else:
+        matches = index.nearest(latitude, longitude, request.args.get("k", 5, type=int))
+
+    return jsonify({
+        "success": True,
+        "locations": [
+            {"id": index.ids[position], "distance_km": round(distance, 3)}
+            for position, distance in matches
+        ]
+    })
+
 @app.route("/admin/assign-delivery", methods=["GET", "POST"])
 @login_required
 def assign_delivery():
@@ -349,6 +672,9 @@ def assign_delivery():
         customer_name = request.form["customer_name"]
         customer_phone = request.form["customer_phone"]
         notes = request.form.get("notes")
+        window_start = parse_window_time(request.form.get("window_start"))
+        window_end = parse_window_time(request.form.get("window_end"))
+        service_minutes = request.form.get("service_minutes", type=int)
         
         # Create new delivery
         new_delivery = Delivery(
@@ -358,7 +684,10 @@ def assign_delivery():
             customer_name=customer_name,
             customer_phone=customer_phone,
             notes=notes,
-            status="pending"
+            status="pending",
+            window_start=window_start,
+            window_end=window_end,
+            service_minutes=service_minutes
         )
         
         db.session.add(new_delivery)
@@ -370,12 +699,154 @@ def assign_delivery():
     # Get active delivery boys and locations for the form
     delivery_boys = DeliveryBoy.query.filter_by(status="Confirmed").all()
     locations = DeliveryLocation.query.all()
-    deliveries = Delivery.query.order_by(Delivery.created_at.desc()).all()
+
+    # One page of deliveries, newest first
+    status = request.args.get("status")
+    if status not in DELIVERY_STATUS_SPELLINGS:
+        status = None
+    delivery_boy_id = request.args.get("delivery_boy_id", type=int)
+    cursor = parse_delivery_cursor(request.args.get("before"))
+    deliveries = delivery_page(status, delivery_boy_id, cursor, DELIVERIES_PER_PAGE + 1)
+    next_cursor = None
+    if len(deliveries) > DELIVERIES_PER_PAGE:
+        deliveries = deliveries[:DELIVERIES_PER_PAGE]
+        next_cursor = delivery_cursor(deliveries[-1])
     
     return render_template("admin/assign_delivery.html",
                          delivery_boys=delivery_boys,
                          locations=locations,
-                         deliveries=deliveries)
+                         deliveries=deliveries,
+                         status=status,
+                         delivery_boy_id=delivery_boy_id,
+                         next_cursor=next_cursor,
+                         first_page=cursor is None)
+
+MAX_BULK_DELIVERIES = 20000  # Rows accepted by one bulk assignment request
+BULK_INSERT_BATCH = 1000  # Rows per executemany insert
+
+# Helper function to read an optional text field from a bulk assignment row
+def parse_text(value, field, max_length=None):
+    if value is None:
+        return None
+    if isinstance(value, (dict, list, bool)):
+        raise ValueError(f"{field} must be text")
+    text = str(value).strip()
+    if max_length is not None and len(text) > max_length:
+        raise ValueError(f"{field} is longer than {max_length} characters")
+    return text or None
+
+# Helper function to read an integer field from a bulk assignment row; bools and floats are refused
+def parse_integer(value, field):
+    if isinstance(value, str) and re.fullmatch(r"\s*[+-]?\d+\s*", value):
+        return int(value)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"{field} must be an integer")
+    return value
+
+# Helper function to read an optional ISO 8601 time from a bulk assignment row
+def parse_iso_time(value, field):
+    if value in (None, ""):
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f"{field} must be an ISO 8601 date and time")
+
+@app.route("/admin/deliveries/bulk", methods=["POST"])
+@login_required
+def bulk_assign_deliveries():
+    """
+    Create many deliveries from a JSON list (or {"deliveries": [...]}) of objects with
+    delivery_boy_id, location_id and customer_name, and optionally customer_phone, notes,
+    order_number, window_start/window_end (ISO 8601) and service_minutes.
+    Either every row is created, in one transaction, or none is and the response lists
+    the problems by row. Order numbers are generated for rows that do not bring one;
+    supplied numbers may not use the generated ORD-00000000 form.
+    """
+    data = request.get_json(silent=True)
+    rows = data.get("deliveries") if isinstance(data, dict) else data
+    if not isinstance(rows, list) or not rows:
+        return jsonify({"success": False, "message": "Send a non-empty list of deliveries"}), 400
+    if len(rows) > MAX_BULK_DELIVERIES:
+        return jsonify({"success": False, "message": f"At most {MAX_BULK_DELIVERIES} deliveries per request"}), 400
+
+    errors = []
+    deliveries = []
+    for position, row in enumerate(rows):
+        try:
+            if not isinstance(row, dict):
+                raise ValueError("Each delivery must be an object")
+            customer_name = parse_text(row.get("customer_name"), "customer_name", 100)
+            if not customer_name:
+                raise ValueError("customer_name is required")
+            service_minutes = row.get("service_minutes")
+            order_number = parse_text(row.get("order_number"), "order_number", 50)
+            if order_number and GENERATED_ORDER_NUMBER.fullmatch(order_number):
+                raise ValueError(f"Order number {order_number} is in the range kept for generated numbers")
+            deliveries.append({
+                "delivery_boy_id": parse_integer(row["delivery_boy_id"], "delivery_boy_id"),
+                "location_id": parse_integer(row["location_id"], "location_id"),
+                "order_number": order_number,
+                "customer_name": customer_name,
+                "customer_phone": parse_text(row.get("customer_phone"), "customer_phone", 20),
+                "notes": parse_text(row.get("notes"), "notes"),
+                "status": "pending",
+                "window_start": parse_iso_time(row.get("window_start"), "window_start"),
+                "window_end": parse_iso_time(row.get("window_end"), "window_end"),
+                "service_minutes": parse_integer(service_minutes, "service_minutes") if service_minutes not in (None, "") else None
+            })
+        except KeyError as e:
+            errors.append({"row": position, "error": f"{e.args[0]} is required"})
+        except (TypeError, ValueError) as e:
+            errors.append({"row": position, "error": str(e)})
+    if errors:
+        return jsonify({"success": False, "message": "Invalid deliveries", "errors": errors}), 400
+
+    # One IN query each for the referenced delivery boys, locations and supplied order numbers
+    boy_ids = {d["delivery_boy_id"] for d in deliveries}
+    location_ids = {d["location_id"] for d in deliveries}
+    known_boys = {row.id for row in db.session.query(DeliveryBoy.id).filter(
+        DeliveryBoy.id.in_(boy_ids), DeliveryBoy.status == "Confirmed")}
+    known_locations = {row.id for row in db.session.query(DeliveryLocation.id).filter(
+        DeliveryLocation.id.in_(location_ids))}
+    supplied = [d["order_number"] for d in deliveries if d["order_number"]]
+    taken = set()
+    if supplied:
+        taken = {row.order_number for row in db.session.query(Delivery.order_number).filter(
+            Delivery.order_number.in_(set(supplied)))}
+
+    seen_numbers = set()
+    for position, delivery in enumerate(deliveries):
+        if delivery["delivery_boy_id"] not in known_boys:
+            errors.append({"row": position, "error": f"Unknown or unconfirmed delivery boy {delivery['delivery_boy_id']}"})
+        if delivery["location_id"] not in known_locations:
+            errors.append({"row": position, "error": f"Unknown location {delivery['location_id']}"})
+        number = delivery["order_number"]
+        if number:
+            if number in taken or number in seen_numbers:
+                errors.append({"row": position, "error": f"Order number {number} is already used"})
+            seen_numbers.add(number)
+    if errors:
+        return jsonify({"success": False, "message": "Invalid deliveries", "errors": errors}), 400
+
+    try:
+        generated = iter(reserve_order_numbers(sum(1 for d in deliveries if not d["order_number"])))
+        for delivery in deliveries:
+            delivery["order_number"] = delivery["order_number"] or next(generated)
+            delivery["created_at"] = datetime.utcnow()
+        for start in range(0, len(deliveries), BULK_INSERT_BATCH):
+            db.session.execute(Delivery.__table__.insert(), deliveries[start:start + BULK_INSERT_BATCH])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Bulk assignment failed: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+    return jsonify({
+        "success": True,
+        "created": len(deliveries),
+        "order_numbers": [d["order_number"] for d in deliveries]
+    })
 
 @app.route("/admin/deliveries/<int:delivery_id>", methods=["GET"])
 @login_required
@@ -397,7 +868,10 @@ def get_delivery(delivery_id):
         "customer_phone": delivery.customer_phone,
         "status": delivery.status,
         "created_at": delivery.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-        "notes": delivery.notes
+        "notes": delivery.notes,
+        "window_start": delivery.window_start.strftime("%Y-%m-%d %H:%M") if delivery.window_start else None,
+        "window_end": delivery.window_end.strftime("%Y-%m-%d %H:%M") if delivery.window_end else None,
+        "service_minutes": delivery.service_minutes
     })
 
 @app.route("/admin/deliveries/<int:delivery_id>", methods=["DELETE"])
@@ -437,55 +911,7 @@ def optimize_route():
     depot_locations = DeliveryLocation.query.all()
     
     if request.method == "POST":
-        start_location_id = int(request.form["start_location"])
-        delivery_points = request.form.getlist("delivery_points")
-        algorithm = request.form["algorithm"]
-        return_to_depot = bool(request.form.get("return_to_depot", True))
-        
-        # Convert delivery points to integers
-        delivery_points = [int(point_id) for point_id in delivery_points]
-        
-        # Get location objects for all selected points
-        selected_locations = DeliveryLocation.query.filter(DeliveryLocation.id.in_(delivery_points)).all()
-        start_location = DeliveryLocation.query.get(start_location_id)
-        
-        # Convert locations to dictionary format for the optimizer
-        locations_data = [
-            {
-                'id': start_location.id,
-                'latitude': start_location.latitude,
-                'longitude': start_location.longitude,
-                'address': start_location.address,
-                'is_depot': True
-            }
-        ]
-        
-        # Add delivery points
-        locations_data.extend([
-            {
-                'id': loc.id,
-                'latitude': loc.latitude,
-                'longitude': loc.longitude,
-                'address': loc.address,
-                'is_depot': False
-            }
-            for loc in selected_locations
-        ])
-        
-        # If return to depot is enabled, add the depot as the final destination
-        if return_to_depot:
-            locations_data.append({
-                'id': start_location.id,
-                'latitude': start_location.latitude,
-                'longitude': start_location.longitude,
-                'address': start_location.address,
-                'is_depot': True
-            })
-        
-        # Create optimizer instance and get optimized route
-        optimizer = RouteOptimizer(locations_data)
-        optimized_route = optimizer.optimize_route(start_location_id, algorithm)
-        optimized_route['return_to_depot'] = return_to_depot
+        optimized_route = run_route_optimization(route_request_params(request.form))
         
         return render_template(
             "admin/optimize_route.html",
@@ -502,19 +928,374 @@ def optimize_route():
         google_maps_api_key=GOOGLE_MAPS_API_KEY
     )
 
+# Helper function to read the optimize-route form into plain job parameters
+def route_request_params(form):
+    return {
+        "start_location": int(form["start_location"]),
+        "delivery_points": [int(point_id) for point_id in form.getlist("delivery_points")],
+        "algorithm": form.get("algorithm", "auto"),
+        "time_budget": form.get("time_budget", type=float),
+        "return_to_depot": bool(form.get("return_to_depot", True)),
+        "departure_time": form.get("departure_time")
+    }
+
+class JobCancelled(Exception):
+    pass
+
+def run_route_optimization(params, progress=None):
+    """
+    Build the optimizer for the selected stops and solve the route.
+    progress(fraction, message) is called between phases and may raise JobCancelled.
+    """
+    progress = progress or (lambda fraction, message: None)
+    start_location_id = params["start_location"]
+    delivery_points = params["delivery_points"]
+    return_to_depot = params["return_to_depot"]
+    
+    # Get location objects for all selected points
+    selected_locations = DeliveryLocation.query.filter(DeliveryLocation.id.in_(delivery_points)).all()
+    start_location = DeliveryLocation.query.get(start_location_id)
+    
+    # Convert locations to dictionary format for the optimizer
+    locations_data = [location_dict(start_location, is_depot=True)]
+    
+    # Add delivery points, with any delivery windows at them
+    departure = parse_window_time(params.get("departure_time")) or datetime.now()
+    windows = delivery_windows(delivery_points, departure)
+    locations_data.extend([
+        {**location_dict(loc), **windows.get(loc.id, {})}
+        for loc in selected_locations
+    ])
+    
+    # If return to depot is enabled, add the depot as the final destination
+    if return_to_depot:
+        locations_data.append(location_dict(start_location, is_depot=True))
+    
+    # Create optimizer instance and get optimized route
+    progress(0.1, "Fetching distance matrix")
+    optimizer = RouteOptimizer(locations_data)
+    progress(0.7, "Solving route")
+    optimized_route = optimizer.optimize_route(start_location_id, params["algorithm"], params.get("time_budget"))
+    optimized_route['return_to_depot'] = return_to_depot
+    optimized_route['route_key'] = remember_optimizer(optimizer)
+    for stop in optimized_route.get('schedule', []):
+        stop['arrival_time'] = (departure + timedelta(hours=stop['arrival'])).strftime("%H:%M")
+        stop['service_start_time'] = (departure + timedelta(hours=stop['service_start'])).strftime("%H:%M")
+    return optimized_route
+
+# Background optimization jobs: a small worker pool, with job state kept in the database
+OPTIMIZATION_WORKERS = int(os.getenv("OPTIMIZATION_WORKERS", 2))
+MAX_ACTIVE_JOBS = int(os.getenv("MAX_ACTIVE_OPTIMIZATION_JOBS", 10))
+ACTIVE_JOB_STATUSES = ("queued", "running", "cancelling")
+_job_executor = ThreadPoolExecutor(max_workers=OPTIMIZATION_WORKERS, thread_name_prefix="optimize")
+
+def update_job(job_id, **fields):
+    OptimizationJob.query.filter_by(id=job_id).update(fields)
+    db.session.commit()
+
+def move_job(job_id, from_status, **fields):
+    """
+    Update a job only while it is still in from_status. Returns False if it has moved on,
+    e.g. a cancel request changed a running job to "cancelling".
+    """
+    moved = OptimizationJob.query.filter_by(id=job_id, status=from_status).update(fields, synchronize_session=False)
+    db.session.commit()
+    return moved == 1
+
+def run_optimization_job(job_id):
+    with app.app_context():
+        job = OptimizationJob.query.get(job_id)
+        if job is None or not move_job(job_id, "queued", status="running", started_at=datetime.utcnow(), message="Starting"):
+            db.session.remove()
+            return
+        params = json.loads(job.params)
+
+        # The cancel request is stored in the job row, so every progress update checks it
+        def progress(fraction, message):
+            if not move_job(job_id, "running", progress=fraction, message=message):
+                raise JobCancelled()
+
+        try:
+            result = run_route_optimization(params, progress)
+            if not move_job(job_id, "running", status="completed", progress=1.0, message="Done",
+                            result=json.dumps(result), finished_at=datetime.utcnow()):
+                raise JobCancelled()
+        except JobCancelled:
+            db.session.rollback()
+            update_job(job_id, status="cancelled", message="Cancelled", finished_at=datetime.utcnow())
+        except Exception as e:
+            db.session.rollback()
+            print(f"Optimization job {job_id} failed: {str(e)}")
+            update_job(job_id, status="failed", error=str(e), finished_at=datetime.utcnow())
+        finally:
+            db.session.remove()
+
+def fail_interrupted_jobs():
+    """Jobs that were queued or running when the process stopped will never finish."""
+    OptimizationJob.query.filter(OptimizationJob.status.in_(ACTIVE_JOB_STATUSES)).update(
+        {"status": "failed", "error": "Interrupted by a server restart", "finished_at": datetime.utcnow()},
+        synchronize_session=False
+    )
+    db.session.commit()
+
+def job_status(job):
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "progress": job.progress,
+        "message": job.message,
+        "error": job.error,
+        "created_at": job.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "started_at": job.started_at.strftime("%Y-%m-%d %H:%M:%S") if job.started_at else None,
+        "finished_at": job.finished_at.strftime("%Y-%m-%d %H:%M:%S") if job.finished_at else None
+    }
+
+@app.route("/admin/optimize-route/jobs", methods=["POST"])
+@login_required
+def submit_optimization_job():
+    active = OptimizationJob.query.filter(OptimizationJob.status.in_(ACTIVE_JOB_STATUSES)).count()
+    if active >= MAX_ACTIVE_JOBS:
+        return jsonify({"success": False, "message": "Too many optimization jobs in progress, try again shortly"}), 429
+
+    params = route_request_params(request.form) if request.form else request.get_json()
+    job = OptimizationJob(id=uuid.uuid4().hex, status="queued", progress=0.0, message="Queued", params=json.dumps(params))
+    db.session.add(job)
+    db.session.commit()
+
+    _job_executor.submit(run_optimization_job, job.id)
+    return jsonify({
+        "success": True,
+        "job_id": job.id,
+        "status_url": url_for("optimization_job_status", job_id=job.id),
+        "result_url": url_for("optimization_job_result", job_id=job.id)
+    }), 202
+
+@app.route("/admin/optimize-route/jobs/<job_id>", methods=["GET"])
+@login_required
+def optimization_job_status(job_id):
+    job = OptimizationJob.query.get_or_404(job_id)
+    return jsonify(job_status(job))
+
+@app.route("/admin/optimize-route/jobs/<job_id>/result", methods=["GET"])
+@login_required
+def optimization_job_result(job_id):
+    job = OptimizationJob.query.get_or_404(job_id)
+    if job.status != "completed":
+        return jsonify({"success": False, **job_status(job)}), 409
+    return jsonify({"success": True, "job_id": job.id, "optimized_route": json.loads(job.result)})
+
+@app.route("/admin/optimize-route/jobs/<job_id>/cancel", methods=["POST"])
+@login_required
+def cancel_optimization_job(job_id):
+    job = OptimizationJob.query.get_or_404(job_id)
+    # A queued job is cancelled right away; a running one reports "cancelling" until
+    # its runner sees the request and stops
+    cancelled = move_job(job.id, "queued", status="cancelled", message="Cancelled", finished_at=datetime.utcnow())
+    if not cancelled:
+        move_job(job.id, "running", status="cancelling", message="Cancelling")
+    db.session.refresh(job)
+    if not cancelled and job.status != "cancelling":
+        return jsonify({"success": False, "message": f"Job is already {job.status}"})
+    return jsonify({"success": True, **job_status(job)})
+
+# Recently used optimizers, so route updates only fetch matrix entries for new stops.
+# Each is stored with its own lock, since an update changes the optimizer in place.
+LIVE_OPTIMIZER_LIMIT = 32
+_live_optimizers = OrderedDict()
+_live_optimizers_lock = threading.Lock()
+
+def remember_optimizer(optimizer, route_key=None):
+    route_key = route_key or uuid.uuid4().hex
+    with _live_optimizers_lock:
+        entry = _live_optimizers.get(route_key)
+        if entry is None or entry[0] is not optimizer:
+            entry = (optimizer, threading.Lock())
+        _live_optimizers[route_key] = entry
+        _live_optimizers.move_to_end(route_key)
+        while len(_live_optimizers) > LIVE_OPTIMIZER_LIMIT:
+            _live_optimizers.popitem(last=False)
+    return route_key
+
+def location_dict(location, is_depot=False):
+    return {
+        'id': location.id,
+        'latitude': location.latitude,
+        'longitude': location.longitude,
+        'address': location.address,
+        'is_depot': is_depot
+    }
+
+@app.route("/admin/optimize-route/update", methods=["POST"])
+@login_required
+def update_route():
+    data = request.get_json()
+    try:
+        route_ids = [int(location_id) for location_id in data["route"]]
+        added_ids = [int(location_id) for location_id in data.get("added", [])]
+        removed_ids = [int(location_id) for location_id in data.get("removed", [])]
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify({"success": False, "message": "Expected route, added and removed lists of location ids"}), 400
+    if not route_ids:
+        return jsonify({"success": False, "message": "The route is empty"}), 400
+    route_key = data.get("route_key")
+
+    with _live_optimizers_lock:
+        entry = _live_optimizers.get(route_key)
+    if entry is None:
+        # Unknown or expired route: rebuild from the current stops (legs come from the leg cache)
+        rows = {loc.id: loc for loc in DeliveryLocation.query.filter(DeliveryLocation.id.in_(route_ids)).all()}
+        if route_ids[0] not in rows:
+            return jsonify({"success": False, "message": "The start of the route no longer exists"}), 404
+        # Stops deleted since the route was planned are dropped from it
+        returns_to_depot = len(route_ids) > 1 and route_ids[-1] == route_ids[0]
+        stops = [i for i in (route_ids[1:-1] if returns_to_depot else route_ids[1:]) if i in rows]
+        route_ids = route_ids[:1] + stops + (route_ids[:1] if returns_to_depot else [])
+        locations_data = [location_dict(rows[route_ids[0]], is_depot=True)]
+        locations_data.extend(location_dict(rows[i]) for i in stops)
+        if returns_to_depot:
+            locations_data.append(location_dict(rows[route_ids[0]], is_depot=True))
+        entry = (RouteOptimizer(locations_data), threading.Lock())
+    optimizer, lock = entry
+
+    added = [location_dict(loc) for loc in DeliveryLocation.query.filter(DeliveryLocation.id.in_(added_ids)).all()]
+    with lock:
+        try:
+            updated_route = optimizer.update_route(route_ids, added, removed_ids)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+    updated_route['route_key'] = remember_optimizer(optimizer, route_key)
+    updated_route['success'] = True
+    return jsonify(updated_route)
+
+@app.route("/admin/optimize-route/batch", methods=["POST"])
+@login_required
+def optimize_route_batch():
+    data = request.get_json()
+    problems = data.get("problems") if isinstance(data, dict) else None
+    if not isinstance(problems, list):
+        return jsonify({"success": False, "message": "Expected a JSON object with a list of problems"}), 400
+    matrix_client = get_default_client() if data.get("road_distances", True) else None
+
+    # One JSON line per problem, sent as soon as that problem is solved
+    def generate():
+        for result in solve_batch(problems, matrix_client):
+            yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.route("/admin/optimize-fleet", methods=["POST"])
+@login_required
+def optimize_fleet():
+    data = request.get_json(silent=True)
+    try:
+        start_id = int(data["start_location"])
+        delivery_points = [int(point_id) for point_id in data.get("delivery_points", [])]
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify({"success": False, "message": "Expected a start_location id and a list of delivery_points"}), 400
+    start_location = DeliveryLocation.query.get_or_404(start_id)
+    selected_locations = DeliveryLocation.query.filter(DeliveryLocation.id.in_(delivery_points)).all()
+    delivery_boys = DeliveryBoy.query.filter_by(status="Confirmed").all()
+    if not delivery_boys:
+        return jsonify({"success": False, "message": "No confirmed delivery boys available"})
+
+    depot = {
+        'id': start_location.id,
+        'latitude': start_location.latitude,
+        'longitude': start_location.longitude,
+        'address': start_location.address,
+        'is_depot': True
+    }
+    locations_data = [depot]
+    locations_data.extend([
+        {
+            'id': loc.id,
+            'latitude': loc.latitude,
+            'longitude': loc.longitude,
+            'address': loc.address,
+            'is_depot': False
+        }
+        for loc in selected_locations
+        if loc.id != start_location.id
+    ])
+    if data.get("return_to_depot", True):
+        locations_data.append(dict(depot))
+
+    # Caps may be a single number for everyone or a {delivery_boy_id: cap} mapping
+    def rider_caps(value):
+        if isinstance(value, dict):
+            return [value.get(str(boy.id)) for boy in delivery_boys]
+        return value
+
+    optimizer = RouteOptimizer(locations_data)
+    fleet = optimizer.optimize_fleet(
+        start_location.id,
+        [{'id': boy.id, 'name': boy.name} for boy in delivery_boys],
+        max_stops=rider_caps(data.get("max_stops")),
+        max_distance=rider_caps(data.get("max_distance")),
+        time_budget=data.get("time_budget")
+    )
+    fleet["success"] = True
+    return jsonify(fleet)
+
+# Helper function to read route waypoints given as "lat1,lng1;lat2,lng2" text, or as a
+# list of {"lat": ..., "lng": ...} objects or [lat, lng] pairs
+def route_points(waypoints):
+    if not waypoints:
+        return []
+    if isinstance(waypoints, str):
+        points = polyline.parse_waypoints(waypoints)
+    elif isinstance(waypoints, list):
+        try:
+            points = [
+                (float(wp["lat"]), float(wp["lng"])) if isinstance(wp, dict) else (float(wp[0]), float(wp[1]))
+                for wp in waypoints
+            ]
+        except (KeyError, IndexError, TypeError):
+            raise ValueError("Each waypoint needs a lat and lng")
+    else:
+        raise ValueError("waypoints must be text or a list")
+    for lat, lng in points:
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError(f"Waypoint {lat},{lng} is outside the valid coordinate range")
+    return points
+
+# Helper function to read the encoded polyline, stop order and metadata of a saved route
+def assignment_route(assignment):
+    route_polyline = assignment.route_polyline
+    if route_polyline is None and assignment.waypoints:
+        # Row not migrated yet (or its text could not be parsed); encode it on the fly
+        try:
+            route_polyline = polyline.encode(polyline.parse_waypoints(assignment.waypoints))
+        except ValueError as e:
+            print(f"Invalid waypoints on assignment {assignment.id}: {e}")
+    return {
+        "polyline": route_polyline or "",
+        "stop_order": json.loads(assignment.stop_order) if assignment.stop_order else [],
+        "metadata": json.loads(assignment.route_metadata) if assignment.route_metadata else {}
+    }
+
 @app.route("/admin/view-route/<int:assignment_id>")
 @login_required
 def view_route(assignment_id):
     assignment = Assignment.query.get_or_404(assignment_id)
-    waypoints = []
-    if assignment.waypoints:
-        for wp in assignment.waypoints.split(";"):
-            lat, lng = map(float, wp.split(","))
-            waypoints.append({"lat": lat, "lng": lng})
+    route = assignment_route(assignment)
+    if request.args.get("format") == "json":
+        return jsonify({
+            "success": True,
+            "assignment_id": assignment.id,
+            "delivery_boy_id": assignment.delivery_boy_id,
+            "source": {"lat": assignment.source_lat, "lng": assignment.source_lng},
+            "destination": {"lat": assignment.dest_lat, "lng": assignment.dest_lng},
+            "status": assignment.status,
+            **route
+        })
+    # The page decodes the polyline itself (google.maps.geometry.encoding.decodePath)
     return render_template(
         "admin/view_route.html",
         assignment=assignment,
-        waypoints=waypoints,
+        route_polyline=route["polyline"],
+        stop_order=route["stop_order"],
+        route_metadata=route["metadata"],
         google_maps_api_key=GOOGLE_MAPS_API_KEY
     )
 
@@ -527,14 +1308,18 @@ def assign_route():
         source_lng = float(request.form.get("source_lng"))
         dest_lat = float(request.form.get("dest_lat"))
         dest_lng = float(request.form.get("dest_lng"))
-        waypoints = request.form.get("waypoints")  # e.g., "lat1,lng1;lat2,lng2"
+        try:
+            waypoints = route_points(request.form.get("waypoints"))  # e.g., "lat1,lng1;lat2,lng2"
+        except ValueError as e:
+            flash(f"Invalid waypoints: {e}", "danger")
+            return redirect(url_for("assign_route"))
         new_assignment = Assignment(
             delivery_boy_id=delivery_boy_id,
             source_lat=source_lat,
             source_lng=source_lng,
             dest_lat=dest_lat,
             dest_lng=dest_lng,
-            waypoints=waypoints
+            route_polyline=polyline.encode(waypoints)
         )
         db.session.add(new_assignment)
         db.session.commit()
@@ -546,19 +1331,35 @@ def assign_route():
 @app.route("/admin/save-assignment", methods=["POST"])
 @login_required
 def save_assignment():
+    """
+    Save a route for a delivery boy. The waypoints come as an encoded "polyline", or as
+    "waypoints" text or a list; "stop_order" (location ids) and "metadata" (e.g. the
+    optimizer's solver_used and total_distance) are stored alongside.
+    """
     data = request.get_json()
     try:
+        if data.get('polyline'):
+            route_polyline = str(data['polyline'])
+            polyline.decode(route_polyline)  # Reject malformed input before it is stored
+        else:
+            route_polyline = polyline.encode(route_points(data.get('waypoints')))
+        stop_order = [int(location_id) for location_id in data.get('stop_order') or []]
+        metadata = data.get('metadata') or {}
+        if not isinstance(metadata, dict):
+            raise ValueError("metadata must be an object")
         assignment = Assignment(
             delivery_boy_id=int(data['delivery_boy_id']),
             source_lat=float(data['source_lat']),
             source_lng=float(data['source_lng']),
             dest_lat=float(data['dest_lat']),
             dest_lng=float(data['dest_lng']),
-            waypoints=data['waypoints']
+            route_polyline=route_polyline,
+            stop_order=json.dumps(stop_order) if stop_order else None,
+            route_metadata=json.dumps(metadata) if metadata else None
         )
         db.session.add(assignment)
         db.session.commit()
-        return jsonify({"success": True, "assignment_id": assignment.id})
+        return jsonify({"success": True, "assignment_id": assignment.id, "polyline": route_polyline})
     except Exception as e:
         db.session.rollback()
         return jsonify({"success": False, "message": str(e)})
@@ -573,8 +1374,15 @@ def route_planner():
         google_maps_api_key=GOOGLE_MAPS_API_KEY
     )
 
+# Prometheus text format: request latency per endpoint, optimizer phase times and counters
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 # Run the app
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
+        upgrade_schema()
+        fail_interrupted_jobs()
     app.run(debug=True)
@@ -0,0 +1,152 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
+
+AVERAGE_CITY_SPEED_KMH = 20  # Used to estimate travel time when no road data is available
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Return the process-wide worker pool, created on first use.
+    Workers are spawned rather than forked, since the web app runs threads of its own.
+    BATCH_OPTIMIZER_WORKERS sets the pool size (default: one per CPU core).
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            workers = int(os.getenv('BATCH_OPTIMIZER_WORKERS', 0)) or os.cpu_count() or 1
+            _process_pool = ProcessPoolExecutor(max_workers=workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        return _process_pool
+
+def _point(location: Dict) -> Tuple[float, float]:
+    return (float(location['latitude']), float(location['longitude']))
+
+def problem_matrices(problem: Dict, matrix_client=None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Distance/time matrices of one problem, with rows depot, stops, then the depot again if
+    the route returns to it. Only the problem's own distinct points are fetched; legs
+    shared with other problems (a common depot, say) come from the client's leg cache.
+    """
+    from route_optimizer import MATRIX_DTYPE, fill_missing_legs, haversine_matrix
+
+    index: Dict[Tuple[float, float], int] = {}
+    rows = [index.setdefault(_point(location), len(index)) for location in [problem['depot']] + problem['stops']]
+    return_to_depot = problem.get('return_to_depot', True)
+    if return_to_depot:
+        rows.append(rows[0])
+    points = list(index)
+    lats = [p[0] for p in points]
+    lons = [p[1] for p in points]
+
+    if matrix_client is not None and matrix_client.api_key:
+        distances, times = matrix_client.fetch_matrix(points, dtype=MATRIX_DTYPE)
+        fill_missing_legs(lats, lons, distances, times)
+    else:
+        distances = haversine_matrix(lats, lons).astype(MATRIX_DTYPE)
+        times = distances / MATRIX_DTYPE(AVERAGE_CITY_SPEED_KMH)
+    if len(rows) == len(points):
+        return distances, times
+    if return_to_depot and len(rows) == len(points) + 1:
+        # Only the returning depot repeats a point: copy its row and column onto the end
+        return _repeat_depot(distances), _repeat_depot(times)
+    rows = np.array(rows)
+    return distances[np.ix_(rows, rows)], times[np.ix_(rows, rows)]
+
+def _repeat_depot(matrix: np.ndarray) -> np.ndarray:
+    n = len(matrix)
+    out = np.empty((n + 1, n + 1), dtype=matrix.dtype)
+    out[:n, :n] = matrix
+    out[n, :n] = matrix[0]
+    out[:n, n] = matrix[:, 0]
+    out[n, n] = matrix[0, 0]
+    return out
+
+def solve_problem(problem: Dict, dist_matrix: np.ndarray, time_matrix: np.ndarray) -> Dict:
+    """
+    Solve one route problem on its own matrices (rows: depot, stops, then the depot
+    again if the route returns to it). Runs in a worker process.
+    """
+    from route_optimizer import SOLVERS, route_length, select_solver
+
+    started = time.perf_counter()
+    return_to_depot = problem.get('return_to_depot', True)
+    n = len(problem['stops']) + 1
+    end = n if return_to_depot else None
+    time_budget = problem.get('time_budget')
+    solver = problem.get('algorithm', 'auto')
+    if solver not in SOLVERS:
+        solver = select_solver(n - 1, time_budget, parallel=False)  # Already in a pool worker
+
+    route = SOLVERS[solver](dist_matrix, 0, end, time_budget)
+    total_distance = route_length(dist_matrix, route)
+    # 3 minutes per stop plus 10 minutes loading/unloading, as in RouteOptimizer.optimize_route
+    total_time = route_length(time_matrix, route) + ((n - 1) * 3 + 10) / 60
+    hours = int(total_time)
+    minutes = int((total_time - hours) * 60)
+
+    locations = [problem['depot']] + problem['stops'] + ([problem['depot']] if return_to_depot else [])
+    return {
+        'id': problem.get('id'),
+        'route': [locations[i].get('id', i) for i in route],
+        'locations': [locations[i] for i in route],
+        'total_distance': round(total_distance, 2),
+        'estimated_time': f"{hours}h {minutes}m",
+        'solver_used': solver,
+        'solve_time_ms': round((time.perf_counter() - started) * 1000, 2)
+    }
+
+def validate_problem(problem: Dict):
+    if 'depot' not in problem or 'stops' not in problem:
+        raise ValueError("Each problem needs a depot and a list of stops")
+    for location in [problem['depot']] + list(problem['stops']):
+        latitude, longitude = _point(location)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError(f"Invalid coordinates: {latitude}, {longitude}")
+
+def solve_batch(problems: List[Dict], matrix_client=None,
+                executor: Optional[ProcessPoolExecutor] = None) -> Iterator[Dict]:
+    """
+    Solve many independent route problems in parallel and yield each result as soon as
+    it finishes (so not in input order). Each problem gets a matrix over its own points only.
+    Each problem is a dict with a depot and stops (dicts with latitude, longitude and
+    optionally id) and optional id, algorithm, time_budget and return_to_depot.
+    With a matrix client the matrices use road distances, otherwise Haversine.
+    Invalid problems yield {'id': ..., 'error': ...} instead of stopping the batch.
+    """
+    executor = executor or get_process_pool()
+    valid = []
+    for position, problem in enumerate(problems):
+        try:
+            validate_problem(problem)
+            valid.append(position)
+        except (ValueError, TypeError, KeyError) as e:
+            yield {'id': problem.get('id', position) if isinstance(problem, dict) else position, 'error': str(e)}
+
+    futures = {}
+    for i in valid:
+        problem = problems[i]
+        distances, times = problem_matrices(problem, matrix_client)
+        futures[executor.submit(solve_problem, problem, distances, times)] = problem.get('id', i)
+
+        # Stream whatever has already finished while the next problem's matrix is prepared
+        for future in [f for f in futures if f.done()]:
+            yield _result(future, futures.pop(future))
+
+    while futures:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield _result(future, futures.pop(future))
+
+def _result(future, problem_id) -> Dict:
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"Batch optimization of {problem_id} failed: {e}")
+        return {'id': problem_id, 'error': str(e)}
@@ -0,0 +1 @@
+# Performance benchmarks for the route optimizer; run modules with `python -m benchmarks.<name>`
@@ -0,0 +1,52 @@
+"""
+Compare sequential and concurrent Distance Matrix fetching against a local mock
+server that injects latency into every response.
+
+    python -m benchmarks.bench_matrix_fetch --stops 50 --latency 0.02 --concurrency 32
+"""
+import argparse
+import random
+import time
+
+from maps_client import DistanceMatrixClient
+from benchmarks.mock_distance_matrix import FakeDistanceMatrixServer
+
+def random_points(n: int, seed: int):
+    rng = random.Random(seed)
+    return [(12.9 + rng.uniform(-0.1, 0.1), 77.5 + rng.uniform(-0.1, 0.1)) for _ in range(n)]
+
+def run(points, latency: float, concurrency: int, max_elements: int, rate_limit=None):
+    with FakeDistanceMatrixServer(latency=latency) as server:
+        client = DistanceMatrixClient(
+            api_key='benchmark',
+            base_url=server.url,
+            max_elements=max_elements,
+            concurrency=concurrency,
+            rate_limit=rate_limit
+        )
+        start = time.perf_counter()
+        client.fetch_matrix(points)
+        elapsed = time.perf_counter() - start
+        return elapsed, len(server.calls)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stops', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every response')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--rate-limit', type=float, default=None, help='requests per second')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--skip-sequential', action='store_true')
+    args = parser.parse_args()
+
+    points = random_points(args.stops, args.seed)
+    print(f"{args.stops} stops, {args.latency * 1000:.0f} ms latency per request")
+    for label, max_elements in (('per-pair', 1), ('batched', 100)):
+        if not args.skip_sequential:
+            elapsed, requests_made = run(points, args.latency, 1, max_elements)
+            print(f"  {label:9s} sequential      {elapsed:8.3f} s  {requests_made:5d} requests")
+        elapsed, requests_made = run(points, args.latency, args.concurrency, max_elements, args.rate_limit)
+        print(f"  {label:9s} concurrency={args.concurrency:<3d} {elapsed:8.3f} s  {requests_made:5d} requests")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Time each phase of the route optimizer on seeded synthetic cities and report tour
+quality against the best route known for each instance. Distances are Haversine, so
+no network access is needed.
+
+    python -m benchmarks.bench_route_optimizer --output results.json
+    python -m benchmarks.bench_route_optimizer --baseline results.json
+
+With --baseline the run fails (exit status 1) when any solver is slower or returns a
+longer route than in the stored results, beyond the given tolerances. Every solver is
+deterministic, so tour lengths only change when the code does.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from local_search import anytime_optimize, fast_two_opt, or_opt
+from route_optimizer import RouteOptimizer, _nearest_neighbor_path, held_karp, route_length
+from benchmarks.synthetic_cities import LAYOUTS
+from benchmarks.mock_distance_matrix import HaversineMatrixClient
+
+DEFAULT_SIZES = [10, 50, 200, 1000]
+EXACT_MAX_STOPS = 12  # Held-Karp only runs on instances this small
+ANYTIME_ITERATIONS = 200  # Kicks for the anytime solver; a count rather than a time budget keeps it repeatable
+
+def timed(func: Callable, repeat: int):
+    """Run func repeat times and return its last result and the median wall-clock seconds."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+    return result, statistics.median(times)
+
+def bench_instance(locations: List[Dict], repeat: int) -> List[Dict]:
+    """Benchmark every phase on one instance: a round trip from the depot (locations[0])."""
+    round_trip = locations + [dict(locations[0])]
+    optimizer, build_time = timed(lambda: RouteOptimizer(round_trip, matrix_client=HaversineMatrixClient()), repeat)
+    dist = optimizer.dist_matrix
+    end = len(round_trip) - 1
+    results = [{'phase': 'matrix', 'solver': 'build_matrix', 'seconds': build_time}]
+
+    construction, seconds = timed(lambda: _nearest_neighbor_path(dist, 0, end), repeat)
+    results.append({'phase': 'construction', 'solver': 'nearest_neighbor', 'seconds': seconds, 'route': construction})
+
+    improvements = {
+        'two_opt': lambda: fast_two_opt(dist, construction, closed=False, fixed_end=True),
+        'or_opt': lambda: or_opt(dist, construction, closed=False, fixed_end=True),
+        'local_search': lambda: anytime_optimize(dist, construction, closed=False, fixed_end=True),
+        'anytime': lambda: anytime_optimize(dist, construction, closed=False, fixed_end=True,
+                                            max_iterations=ANYTIME_ITERATIONS, seed=0)
+    }
+    for solver, run in improvements.items():
+        route, seconds = timed(run, repeat)
+        results.append({'phase': 'improvement', 'solver': solver, 'seconds': seconds, 'route': route})
+
+    if len(locations) - 1 <= EXACT_MAX_STOPS:
+        route, seconds = timed(lambda: held_karp(dist, start=0, end=end, return_to_start=False), repeat)
+        results.append({'phase': 'exact', 'solver': 'held_karp', 'seconds': seconds, 'route': route})
+
+    for result in results:
+        route = result.pop('route', None)
+        if route is not None:
+            if sorted(route) != list(range(len(round_trip))) or route[0] != 0 or route[-1] != end:
+                raise AssertionError(f"{result['solver']} returned an invalid route")
+            result['length'] = route_length(dist, route)
+    return results
+
+def run_suite(layouts: List[str], sizes: List[int], seed: int, repeat: int,
+              best_known: Optional[Dict[str, float]] = None) -> Dict:
+    """
+    Benchmark every layout and size. Each solver's gap is its tour length relative to
+    the shortest route known for the instance: from this run, or from best_known
+    (e.g. a stored baseline) if that is shorter.
+    """
+    best_known = dict(best_known or {})
+    results = []
+    for layout in layouts:
+        for size in sizes:
+            instance = f'{layout}-{size}'
+            print(f"{instance} ...", file=sys.stderr)
+            instance_results = bench_instance(LAYOUTS[layout](size, seed), repeat)
+            lengths = [r['length'] for r in instance_results if 'length' in r]
+            best_known[instance] = min(lengths + ([best_known[instance]] if instance in best_known else []))
+            for result in instance_results:
+                result.update({'instance': instance, 'layout': layout, 'stops': size})
+                if 'length' in result:
+                    result['gap'] = result['length'] / best_known[instance] - 1 if best_known[instance] else 0.0
+                results.append(result)
+
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'seed': seed,
+        'repeat': repeat,
+        'best_known': best_known,
+        'results': results
+    }
+
+def compare(current: Dict, baseline: Dict, time_tolerance: float = 0.5, min_seconds: float = 0.005,
+            length_tolerance: float = 1e-6) -> List[str]:
+    """
+    Return one message per solver that got slower or worse than in the baseline.
+    A solver is slower when its time grew by more than time_tolerance (a fraction) and by
+    more than min_seconds, so timer noise on fast phases is ignored; it is worse when its
+    route grew by more than length_tolerance (a fraction).
+    """
+    previous = {(r['instance'], r['solver']): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        before = previous.get((result['instance'], result['solver']))
+        if before is None:
+            continue
+        label = f"{result['instance']} {result['solver']}"
+        slower = result['seconds'] - before['seconds']
+        if slower > min_seconds and result['seconds'] > before['seconds'] * (1 + time_tolerance):
+            regressions.append(f"{label}: {before['seconds']:.4f} s -> {result['seconds']:.4f} s")
+        if 'length' in result and 'length' in before and result['length'] > before['length'] * (1 + length_tolerance):
+            regressions.append(f"{label}: {before['length']:.3f} km -> {result['length']:.3f} km")
+    return regressions
+
+def print_table(report: Dict):
+    print(f"{'instance':16s} {'phase':13s} {'solver':16s} {'seconds':>10s} {'km':>10s} {'gap':>8s}")
+    for r in report['results']:
+        length = f"{r['length']:10.3f}" if 'length' in r else ' ' * 10
+        gap = f"{r['gap'] * 100:7.2f}%" if 'gap' in r else ''
+        print(f"{r['instance']:16s} {r['phase']:13s} {r['solver']:16s} {r['seconds']:10.4f} {length} {gap}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--layouts', nargs='+', choices=sorted(LAYOUTS), default=sorted(LAYOUTS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per phase; the median time is reported')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results to compare against; exit 1 on regressions')
+    parser.add_argument('--time-tolerance', type=float, default=0.5,
+                        help='allowed slowdown as a fraction of the baseline time')
+    parser.add_argument('--min-seconds', type=float, default=0.005,
+                        help='slowdowns smaller than this are ignored as timer noise')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    report = run_suite(args.layouts, args.sizes, args.seed, args.repeat,
+                       baseline['best_known'] if baseline else None)
+    print_table(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if baseline:
+        regressions = compare(report, baseline, args.time_tolerance, args.min_seconds)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Offline stand-ins for the Distance Matrix API, shared by the benchmarks and the tests:
+a local HTTP server that answers in the API's JSON shape, and an in-process matrix
+client. Both compute Haversine distances, so no network access or API key is needed.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from route_optimizer import calculate_haversine_distance, haversine_matrix
+
+class HaversineMatrixClient:
+    """
+    Matrix client that answers from the Haversine formula instead of the network, at
+    20 km/h. It counts the matrix elements requested, and leaves the (origin, destination)
+    position pairs in missing unanswered, like a failed API block.
+    """
+
+    api_key = 'test-key'
+    cache = None
+    mode = 'driving'
+
+    def __init__(self, missing=()):
+        self.missing = list(missing)
+        self.elements = 0
+
+    def fetch_matrix(self, points, concurrency=None, dtype=np.float64):
+        self.elements += len(points) ** 2
+        return self._answer(haversine_matrix([p[0] for p in points], [p[1] for p in points]).astype(dtype))
+
+    def fetch_rectangle(self, origins, destinations, concurrency=None, dtype=np.float64):
+        self.elements += len(origins) * len(destinations)
+        points = list(origins) + list(destinations)
+        dist = haversine_matrix([p[0] for p in points], [p[1] for p in points])
+        return self._answer(dist[:len(origins), len(origins):].astype(dtype))
+
+    def _answer(self, dist):
+        for i, j in self.missing:
+            dist[i, j] = np.nan
+        return dist, dist / 20
+
+class FakeDistanceMatrixHandler(BaseHTTPRequestHandler):
+    """Answers Distance Matrix requests with Haversine distances in the API's JSON shape."""
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        origins = [tuple(map(float, p.split(','))) for p in query['origins'][0].split('|')]
+        destinations = [tuple(map(float, p.split(','))) for p in query['destinations'][0].split('|')]
+        with self.server.lock:
+            self.server.calls.append((len(origins), len(destinations)))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        rows = []
+        for origin in origins:
+            elements = []
+            for destination in destinations:
+                meters = round(calculate_haversine_distance(origin, destination) * 1000)
+                elements.append({
+                    'status': 'OK',
+                    'distance': {'value': meters},
+                    'duration': {'value': meters // 10},
+                    'duration_in_traffic': {'value': meters // 8}
+                })
+            rows.append({'elements': elements})
+
+        body = json.dumps({'status': 'OK', 'rows': rows}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeDistanceMatrixServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Distance Matrix API that sleeps for latency seconds before each
+    answer and records the (origins, destinations) size of every request in calls.
+    Use it as a context manager to serve from a background thread.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, latency=0.0):
+        super().__init__(('127.0.0.1', 0), FakeDistanceMatrixHandler)
+        self.latency = latency
+        self.calls = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"http://{host}:{port}/maps/api/distancematrix/json"
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,56 @@
+"""
+Seeded synthetic delivery instances. Every generator returns the depot (id 0, at the
+city centre) followed by n stops, as location dictionaries like the app passes to
+RouteOptimizer. The same layout, size and seed always give the same instance.
+"""
+import math
+import random
+from typing import Dict, List
+
+CITY_CENTRE = (12.97, 77.59)
+KM_PER_DEGREE = 111.32
+
+def _location(location_id: int, north_km: float, east_km: float) -> Dict:
+    latitude = CITY_CENTRE[0] + north_km / KM_PER_DEGREE
+    longitude = CITY_CENTRE[1] + east_km / (KM_PER_DEGREE * math.cos(math.radians(CITY_CENTRE[0])))
+    return {'id': location_id, 'latitude': latitude, 'longitude': longitude, 'address': f'Stop {location_id}'}
+
+def _depot() -> Dict:
+    depot = _location(0, 0.0, 0.0)
+    depot['address'] = 'Depot'
+    return depot
+
+def uniform_city(n: int, seed: int = 0, radius_km: float = 10.0) -> List[Dict]:
+    """Stops spread evenly over a square around the centre."""
+    rng = random.Random(f'uniform-{n}-{seed}')
+    return [_depot()] + [
+        _location(i, rng.uniform(-radius_km, radius_km), rng.uniform(-radius_km, radius_km))
+        for i in range(1, n + 1)
+    ]
+
+def clustered_city(n: int, seed: int = 0, radius_km: float = 10.0, spread_km: float = 0.8) -> List[Dict]:
+    """Stops bunched around a few neighbourhood centres, one per 25 stops."""
+    rng = random.Random(f'clustered-{n}-{seed}')
+    centres = [(rng.uniform(-radius_km, radius_km), rng.uniform(-radius_km, radius_km))
+               for _ in range(max(2, n // 25))]
+    stops = []
+    for i in range(1, n + 1):
+        north, east = rng.choice(centres)
+        stops.append(_location(i, rng.gauss(north, spread_km), rng.gauss(east, spread_km)))
+    return [_depot()] + stops
+
+def ring_city(n: int, seed: int = 0, radius_km: float = 8.0, width_km: float = 0.5) -> List[Dict]:
+    """Stops along a ring road around the centre, so the depot is far from every stop."""
+    rng = random.Random(f'ring-{n}-{seed}')
+    stops = []
+    for i in range(1, n + 1):
+        angle = rng.uniform(0, 2 * math.pi)
+        radius = radius_km + rng.uniform(-width_km, width_km)
+        stops.append(_location(i, radius * math.sin(angle), radius * math.cos(angle)))
+    return [_depot()] + stops
+
+LAYOUTS = {
+    'uniform': uniform_city,
+    'clustered': clustered_city,
+    'ring': ring_city
+}
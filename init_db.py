@@ -1,7 +1,8 @@
-from app import app, db
+from app import app, db, upgrade_schema
 
 # Create an application context
 with app.app_context():
     # Create all database tables
     db.create_all()
+    upgrade_schema()
     print("Database tables created successfully!") 
\ No newline at end of file
@@ -0,0 +1,303 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from itertools import repeat
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'leg_cache.db')
+DEFAULT_TTL_SECONDS = 3600      # Durations include live traffic, so they go stale quickly
+DEFAULT_MAX_ENTRIES = 200000
+COORDINATE_PRECISION = 5        # 5 decimal places is roughly one meter
+EVICTION_INTERVAL_SECONDS = 60  # How often put_many drops expired legs and rechecks the size bound
+LOOKUP_BATCH_LEGS = 10000       # Legs covered by one fill_matrix query
+
+Point = Tuple[float, float]
+
+class LegCache:
+    """
+    Persistent cache of road distances and travel times between coordinate pairs.
+    Entries live in a SQLite table so every worker process shares them. Coordinates are
+    quantized so the same stop always maps to the same key, entries expire after a TTL,
+    and the least recently used legs are evicted once the table exceeds its size bound.
+    Eviction runs from put_many when its running size estimate passes the bound, or at most
+    every eviction_interval seconds otherwise, not on every write.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, precision: int = COORDINATE_PRECISION,
+                 eviction_interval: float = EVICTION_INTERVAL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.eviction_interval = eviction_interval
+        self.scale = 10 ** precision
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._create_schema()
+        self._last_eviction = time.time()
+        # Legs in the table, give or take: inserts that replace an entry are counted too
+        self._size_estimate = len(self)
+
+    def _create_schema(self):
+        with self._lock, self._conn:
+            if self.path != ':memory:':
+                self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS leg_cache (
+                    origin_lat INTEGER NOT NULL,
+                    origin_lng INTEGER NOT NULL,
+                    dest_lat INTEGER NOT NULL,
+                    dest_lng INTEGER NOT NULL,
+                    mode TEXT NOT NULL,
+                    distance_km REAL NOT NULL,
+                    duration_hours REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (origin_lat, origin_lng, dest_lat, dest_lng, mode)
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS ix_leg_cache_last_used ON leg_cache (last_used)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS ix_leg_cache_created_at ON leg_cache (created_at)')
+            # Per-connection scratch tables for batched lookups: pairs for get_many, and the
+            # origin and destination points of a fill_matrix call
+            for table in ('leg_origins', 'leg_destinations'):
+                self._conn.execute(f'''
+                    CREATE TEMP TABLE IF NOT EXISTS {table} (
+                        lat INTEGER NOT NULL,
+                        lng INTEGER NOT NULL,
+                        idx INTEGER NOT NULL,
+                        PRIMARY KEY (lat, lng)
+                    ) WITHOUT ROWID
+                ''')
+            self._conn.execute('''
+                CREATE TEMP TABLE IF NOT EXISTS leg_lookup (
+                    idx INTEGER PRIMARY KEY,
+                    origin_lat INTEGER NOT NULL,
+                    origin_lng INTEGER NOT NULL,
+                    dest_lat INTEGER NOT NULL,
+                    dest_lng INTEGER NOT NULL
+                )
+            ''')
+
+    def _key(self, origin: Point, destination: Point, mode: str) -> Tuple[int, int, int, int, str]:
+        return (
+            int(round(float(origin[0]) * self.scale)),
+            int(round(float(origin[1]) * self.scale)),
+            int(round(float(destination[0]) * self.scale)),
+            int(round(float(destination[1]) * self.scale)),
+            mode
+        )
+
+    def _keys(self, pairs: List[Tuple[Point, Point]]) -> List[List[int]]:
+        """Quantized (origin_lat, origin_lng, dest_lat, dest_lng) of many pairs at once, as _key rounds them."""
+        coords = np.asarray(pairs, dtype=np.float64).reshape(len(pairs), 4)
+        return np.rint(coords * self.scale).astype(np.int64).tolist()
+
+    def _point_keys(self, points: Sequence[Point]) -> np.ndarray:
+        """Quantized (lat, lng) of each point as an (n, 2) integer array, rounded as _key rounds them."""
+        return np.rint(np.asarray(points, dtype=np.float64).reshape(len(points), 2) * self.scale).astype(np.int64)
+
+    def get(self, origin: Point, destination: Point, mode: str = 'driving') -> Optional[Tuple[float, float]]:
+        """
+        Look up a single leg.
+        Returns (distance in km, time in hours), or None if the leg is missing or expired.
+        """
+        return self.get_many([(origin, destination)], mode).get(0)
+
+    def get_many(self, pairs: List[Tuple[Point, Point]], mode: str = 'driving') -> Dict[int, Tuple[float, float]]:
+        """
+        Look up many legs at once: the keys go into a temporary table and are joined
+        against the cache in one query, and the hits are touched in one UPDATE.
+        Returns a dict mapping the position of each cached pair to its (distance, time).
+        """
+        if not pairs:
+            return {}
+        now = time.time()
+        oldest = now - self.ttl_seconds
+        keys = [[idx] + key for idx, key in enumerate(self._keys(pairs))]
+        join = '''FROM leg_lookup k JOIN leg_cache c
+                    ON c.origin_lat = k.origin_lat AND c.origin_lng = k.origin_lng
+                   AND c.dest_lat = k.dest_lat AND c.dest_lng = k.dest_lng
+                 WHERE c.mode = ? AND c.created_at >= ?'''
+
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO leg_lookup VALUES (?, ?, ?, ?, ?)', keys)
+            try:
+                found = {
+                    idx: (distance_km, duration_hours)
+                    for idx, distance_km, duration_hours in self._conn.execute(
+                        f'SELECT k.idx, c.distance_km, c.duration_hours {join}', (mode, oldest)
+                    )
+                }
+                if found:
+                    self._conn.execute(
+                        f'UPDATE leg_cache SET last_used = ? WHERE rowid IN (SELECT c.rowid {join})',
+                        (now, mode, oldest)
+                    )
+            finally:
+                self._conn.execute('DELETE FROM leg_lookup')
+            self.hits += len(found)
+            self.misses += len(pairs) - len(found)
+        return found
+
+    def fill_matrix(self, origins: Sequence[Point], destinations: Sequence[Point],
+                    distances: np.ndarray, times: np.ndarray, mode: str = 'driving') -> int:
+        """
+        Fill the NaN entries of an origins x destinations matrix in place from the cache.
+        The points go into two indexed scratch tables, so each batch of origins is one
+        query that reads the cached legs of those origins and keeps those whose destination
+        is in the matrix; the cost follows what is cached, not the matrix size. Batches
+        cover about LOOKUP_BATCH_LEGS legs, and hits are touched unless they were touched
+        within the last eviction_interval seconds.
+        Returns how many entries were filled.
+        """
+        if not len(origins) or not len(destinations):
+            return 0
+        now = time.time()
+        params = (mode, now - self.ttl_seconds)
+        join = '''FROM leg_origins o CROSS JOIN leg_cache c CROSS JOIN leg_destinations d
+                 WHERE c.origin_lat = o.lat AND c.origin_lng = o.lng
+                   AND d.lat = c.dest_lat AND d.lng = c.dest_lng
+                   AND c.mode = ? AND c.created_at >= ? AND o.idx >= ? AND o.idx < ?'''
+        step = max(1, LOOKUP_BATCH_LEGS // len(destinations))
+        missing = int(np.isnan(distances).sum())
+        filled = 0
+
+        with self._lock, self._conn:
+            # Points that quantize to the same key as an earlier one are left to the caller
+            for table, points in (('leg_origins', origins), ('leg_destinations', destinations)):
+                keys = self._point_keys(points).T.tolist()
+                self._conn.executemany(f'INSERT OR IGNORE INTO {table} VALUES (?, ?, ?)',
+                                       zip(keys[0], keys[1], range(len(points))))
+            try:
+                for lo in range(0, len(origins), step):
+                    found = self._conn.execute(
+                        f'SELECT o.idx, d.idx, c.distance_km, c.duration_hours {join}', params + (lo, lo + step)
+                    ).fetchall()
+                    if not found:
+                        continue
+                    found = np.array(found)
+                    i, j = found[:, 0].astype(np.intp), found[:, 1].astype(np.intp)
+                    empty = np.isnan(distances[i, j])
+                    distances[i[empty], j[empty]] = found[empty, 2]
+                    times[i[empty], j[empty]] = found[empty, 3]
+                    filled += int(empty.sum())
+                    self._conn.execute(
+                        f'UPDATE leg_cache SET last_used = ? WHERE rowid IN (SELECT c.rowid {join} AND c.last_used < ?)',
+                        (now,) + params + (lo, lo + step, now - self.eviction_interval)
+                    )
+            finally:
+                self._conn.execute('DELETE FROM leg_origins')
+                self._conn.execute('DELETE FROM leg_destinations')
+            self.hits += filled
+            self.misses += missing - filled
+        return filled
+
+    def put(self, origin: Point, destination: Point, distance_km: float, duration_hours: float,
+            mode: str = 'driving'):
+        """Store a single leg."""
+        self.put_many([(origin, destination, distance_km, duration_hours)], mode)
+
+    def put_many(self, legs: Iterable[Tuple[Point, Point, float, float]], mode: str = 'driving'):
+        """Store many legs in one transaction and evict old entries if the cache is over its bound."""
+        legs = list(legs)
+        if not legs:
+            return
+        keys = np.array(self._keys([(origin, destination) for origin, destination, _, _ in legs]), dtype=np.int64)
+        self._store(keys, [float(leg[2]) for leg in legs], [float(leg[3]) for leg in legs], mode)
+
+    def put_blocks(self, blocks: Iterable[Tuple[Sequence[Point], Sequence[Point], np.ndarray, np.ndarray]],
+                   mode: str = 'driving'):
+        """
+        Store the answered legs of (origins, destinations, distances, times) blocks in one
+        transaction. NaN entries and legs from a point to itself are skipped.
+        """
+        keys, distances, times = [], [], []
+        for origins, destinations, block_distances, block_times in blocks:
+            origin_keys, destination_keys = self._point_keys(origins), self._point_keys(destinations)
+            answered = ~(np.isnan(block_distances) | np.isnan(block_times))
+            answered &= (origin_keys[:, None, :] != destination_keys[None, :, :]).any(axis=2)
+            i, j = np.nonzero(answered)
+            keys.append(np.hstack([origin_keys[i], destination_keys[j]]))
+            distances.append(np.asarray(block_distances, dtype=np.float64)[i, j])
+            times.append(np.asarray(block_times, dtype=np.float64)[i, j])
+        if keys:
+            self._store(np.vstack(keys), np.concatenate(distances).tolist(), np.concatenate(times).tolist(), mode)
+
+    def _store(self, keys: np.ndarray, distances: List[float], times: List[float], mode: str):
+        """
+        Insert legs given as an (n, 4) array of quantized keys. At most max_entries legs are
+        written: more than the bound would only be evicted again in the same call.
+        """
+        if not len(keys):
+            return
+        if len(keys) > self.max_entries:
+            keys, distances, times = keys[-self.max_entries:], distances[-self.max_entries:], times[-self.max_entries:]
+        now = time.time()
+        rows = zip(*keys.T.tolist(), repeat(mode), distances, times, repeat(now), repeat(now))
+
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO leg_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self._size_estimate += len(keys)
+            if self._size_estimate > self.max_entries or now - self._last_eviction >= self.eviction_interval:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        """
+        Drop expired legs, then the least recently used ones until the table is back to
+        its low-water mark (a tenth under the bound), so the next eviction is not due
+        on the very next write. Called with the lock held, inside a transaction.
+        """
+        self._conn.execute('DELETE FROM leg_cache WHERE created_at < ?', (now - self.ttl_seconds,))
+        size = self._conn.execute('SELECT COUNT(*) FROM leg_cache').fetchone()[0]
+        if size > self.max_entries:
+            overflow = size - (self.max_entries - self.max_entries // 10)
+            self._conn.execute(
+                '''DELETE FROM leg_cache WHERE rowid IN (
+                       SELECT rowid FROM leg_cache ORDER BY last_used LIMIT ?)''',
+                (overflow,)
+            )
+            self.evictions += overflow
+            size -= overflow
+        self._size_estimate = size
+        self._last_eviction = now
+
+    def clear(self):
+        """Remove every cached leg."""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM leg_cache')
+            self._size_estimate = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM leg_cache').fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit, miss and eviction counters along with the current size."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self)
+        }
+
+_default_cache: Optional[LegCache] = None
+
+def get_default_cache() -> LegCache:
+    """Return the process-wide leg cache, configured from the environment."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = LegCache(
+            path=os.getenv('LEG_CACHE_PATH', DEFAULT_CACHE_PATH),
+            ttl_seconds=float(os.getenv('LEG_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS)),
+            max_entries=int(os.getenv('LEG_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+        )
+    return _default_cache
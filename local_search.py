@@ -0,0 +1,432 @@
+from typing import Iterable, List, Optional, Set
+from collections import deque
+import random
+import time
+import numpy as np
+from metrics import count
+
+NEIGHBOR_LIST_SIZE = 10  # Candidate partners per city in local search
+NEIGHBOR_BLOCK_ROWS = 256  # Rows ranked at a time by neighbor_lists, bounding its temporaries
+OR_OPT_MAX_SEGMENT = 3   # Longest run of stops Or-opt will relocate
+LK_MAX_DEPTH = 5         # Longest chain of 2-opt steps in one Lin-Kernighan move
+IMPROVEMENT_EPSILON = 1e-10
+
+def neighbor_lists(dist_matrix: np.ndarray, k: int = NEIGHBOR_LIST_SIZE) -> List[List[int]]:
+    """
+    Return the k nearest other nodes of every node, closest first.
+    Rows are ranked NEIGHBOR_BLOCK_ROWS at a time in the matrix's own precision, so the
+    matrix is never copied whole.
+    """
+    dist = _float_matrix(dist_matrix)
+    n = len(dist)
+    k = min(k, n - 1)
+    if k <= 0:
+        return [[] for _ in range(n)]
+    neighbors: List[List[int]] = []
+    for lo in range(0, n, NEIGHBOR_BLOCK_ROWS):
+        rows = np.arange(lo, min(lo + NEIGHBOR_BLOCK_ROWS, n))
+        block = dist[lo:rows[-1] + 1].copy()
+        block[rows - lo, rows] = np.inf
+        nearest = np.argpartition(block, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(block, nearest, axis=1).argsort(axis=1)
+        neighbors.extend(np.take_along_axis(nearest, order, axis=1).tolist())
+    return neighbors
+
+def _float_matrix(dist_matrix) -> np.ndarray:
+    # float32 matrices stay float32; anything else becomes float64
+    dist = np.asarray(dist_matrix)
+    return dist if np.issubdtype(dist.dtype, np.floating) else dist.astype(float)
+
+class LocalSearchTour:
+    """
+    Array-based tour shared by the local search moves.
+
+    The route is stored as a cycle over local indices 0..m-1 (tour[position] = node,
+    pos[node] = position). Paths are turned into cycles with a locked edge from the last
+    node back to the start that no move may break; a path with a free end gets a zero-cost
+    dummy node as its last node. Moves assume a symmetric matrix, use neighbor lists to
+    limit candidates, and keep a queue of "active" cities in place of don't-look bits.
+    Distances are read through per-row memoryviews of one sub-matrix in the input's
+    precision, which index like nested lists without boxing every entry up front.
+    evaluated and accepted count candidate moves tried and applied, for instrumentation.
+    """
+
+    def __init__(self, dist_matrix: np.ndarray, route: List[int], closed: bool = False,
+                 fixed_end: bool = True, neighbor_k: int = NEIGHBOR_LIST_SIZE,
+                 deadline: Optional[float] = None):
+        self.nodes = list(route)
+        sub = _float_matrix(dist_matrix)[np.ix_(self.nodes, self.nodes)]
+        m = len(self.nodes)
+        self.locked = None
+        if not closed and m:
+            if not fixed_end:
+                # A zero-cost dummy node after the path lets the end move freely
+                sub = np.pad(sub, ((0, 1), (0, 1)))
+                m += 1
+            # The edge from the last node back to the start must never be broken
+            self.locked = (m - 1, 0)
+        self.m = m
+        self.matrix = sub
+        self.dist = [memoryview(row) for row in sub]
+        self.neighbors = neighbor_lists(sub, neighbor_k)
+        self.tour = list(range(m))
+        self.pos = list(range(m))
+        self.deadline = deadline
+        self.evaluated = 0  # Candidate moves whose gain was computed
+        self.accepted = 0   # Moves applied to the tour
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def next(self, x: int, step: int = 1) -> int:
+        return self.tour[(self.pos[x] + step) % self.m]
+
+    def is_locked(self, x: int, y: int) -> bool:
+        return self.locked is not None and (x, y) in (self.locked, self.locked[::-1])
+
+    def length(self) -> float:
+        dist, tour = self.dist, self.tour
+        return sum(dist[tour[i - 1]][tour[i]] for i in range(self.m))
+
+    def reverse(self, i: int, j: int):
+        """Reverse tour positions i..j (inclusive, wrapping); flip the complement if it is shorter."""
+        m, tour, pos = self.m, self.tour, self.pos
+        length = (j - i) % m + 1
+        if 2 * length > m:
+            i, j = (j + 1) % m, (i - 1) % m
+            length = m - length
+        for _ in range(length // 2):
+            x, y = tour[i], tour[j]
+            tour[i], tour[j] = y, x
+            pos[x], pos[y] = j, i
+            i = (i + 1) % m
+            j = (j - 1) % m
+
+    def linear(self) -> List[int]:
+        """The cycle read from the start node, walking away from the locked edge for paths."""
+        step = 1
+        if self.locked is not None and self.next(0) == self.locked[0]:
+            step = -1
+        start = self.pos[0]
+        return [self.tour[(start + step * k) % self.m] for k in range(self.m)]
+
+    def load(self, cycle: List[int]):
+        """Replace the tour with the given cyclic order of local indices."""
+        self.tour = list(cycle)
+        for position, node in enumerate(self.tour):
+            self.pos[node] = position
+
+    def route(self) -> List[int]:
+        """The current route in terms of the original node indices."""
+        return [self.nodes[x] for x in self.linear() if x < len(self.nodes)]
+
+    def two_opt(self, active: Iterable[int]) -> Set[int]:
+        """
+        Run 2-opt from the active cities until none of them has an improving move.
+        Each city takes its best move among neighbor-list candidates; every move is
+        evaluated in constant time. Returns the set of cities touched by accepted moves.
+        """
+        dist, neighbors = self.dist, self.neighbors
+        queue = deque(active)
+        queued = [False] * self.m
+        for x in queue:
+            queued[x] = True
+        touched: Set[int] = set()
+        evaluated = 0
+
+        while queue and not self.expired():
+            a = queue.popleft()
+            queued[a] = False
+
+            best_delta, best_move = -IMPROVEMENT_EPSILON, None
+            for step in (1, -1):
+                b = self.next(a, step)
+                if self.is_locked(a, b):
+                    continue
+                d_ab = dist[a][b]
+                for c in neighbors[a]:
+                    d_ac = dist[a][c]
+                    if d_ac >= d_ab:
+                        break
+                    d = self.next(c, step)
+                    if c == b or d == a or self.is_locked(c, d):
+                        continue
+                    evaluated += 1
+                    delta = d_ac + dist[b][d] - d_ab - dist[c][d]
+                    if delta < best_delta:
+                        best_delta, best_move = delta, (step, b, c, d)
+
+            if best_move is None:
+                continue
+            self.accepted += 1
+            step, b, c, d = best_move
+            if step == 1:
+                self.reverse(self.pos[b], self.pos[c])   # a b ... c d  ->  a c ... b d
+            else:
+                self.reverse(self.pos[a], self.pos[d])   # b a ... d c  ->  b d ... a c
+            for x in (a, b, c, d):
+                touched.add(x)
+                if not queued[x]:
+                    queued[x] = True
+                    queue.append(x)
+        self.evaluated += evaluated
+        return touched
+
+    def or_opt(self, active: Iterable[int], max_segment: int = OR_OPT_MAX_SEGMENT) -> Set[int]:
+        """
+        Relocate runs of 1..max_segment consecutive cities next to one of their nearest
+        neighbours, inserted as-is or reversed (the reversed case is the Or-3opt move).
+        Returns the set of cities touched by accepted moves.
+        """
+        dist, neighbors, m = self.dist, self.neighbors, self.m
+        queue = deque(active)
+        queued = [False] * m
+        for x in queue:
+            queued[x] = True
+        touched: Set[int] = set()
+        evaluated = 0
+
+        while queue and not self.expired():
+            a = queue.popleft()
+            queued[a] = False
+
+            best_delta, best_move = -IMPROVEMENT_EPSILON, None
+            for length in range(1, min(max_segment, m - 3) + 1):
+                # Segments that start at a and segments that end at a
+                for first_offset in (0, -(length - 1)) if length > 1 else (0,):
+                    start = self.pos[a] + first_offset
+                    segment = [self.tour[(start + k) % m] for k in range(length)]
+                    f, l = segment[0], segment[-1]
+                    p, q = self.next(f, -1), self.next(l, 1)
+                    if self.is_locked(p, f) or self.is_locked(l, q):
+                        continue
+                    removal_gain = dist[p][f] + dist[l][q] - dist[p][q]
+                    if removal_gain <= IMPROVEMENT_EPSILON:
+                        continue
+
+                    inside = set(segment)
+                    for x in (f, l):
+                        for c in neighbors[x]:
+                            if dist[x][c] >= removal_gain:
+                                break
+                            if c in inside:
+                                continue
+                            for u, v in ((c, self.next(c, 1)), (self.next(c, -1), c)):
+                                if u in inside or v in inside or self.is_locked(u, v):
+                                    continue
+                                evaluated += 1
+                                forward = dist[u][f] + dist[l][v] - dist[u][v]
+                                backward = dist[u][l] + dist[f][v] - dist[u][v]
+                                reverse = backward < forward
+                                delta = min(forward, backward) - removal_gain
+                                if delta < best_delta:
+                                    best_delta, best_move = delta, (segment, p, q, u, v, reverse)
+
+            if best_move is None:
+                continue
+            self.accepted += 1
+            segment, p, q, u, v, reverse = best_move
+            # Walk from q round to p to get the tour without the segment, then splice it in after u
+            start = self.pos[q]
+            rest = [self.tour[(start + k) % m] for k in range(m - len(segment))]
+            at = rest.index(u) + 1
+            self.load(rest[:at] + (segment[::-1] if reverse else segment) + rest[at:])
+            for x in (p, q, u, v, segment[0], segment[-1]):
+                touched.add(x)
+                if not queued[x]:
+                    queued[x] = True
+                    queue.append(x)
+        self.evaluated += evaluated
+        return touched
+
+    def lin_kernighan(self, active: Iterable[int], max_depth: int = LK_MAX_DEPTH) -> Set[int]:
+        """
+        Lin-Kernighan-style chained moves. Starting from edge (t1, t2), repeatedly add an
+        edge (t2, t3) to a near neighbour, break (t3, t4) and close the tour with (t4, t1)
+        while the running gain stays positive, then keep the prefix of the chain with the
+        largest closed gain. Each step is a segment reversal, so the chain is undone by
+        replaying the reversals. Returns the set of cities touched by accepted moves.
+        """
+        dist, neighbors = self.dist, self.neighbors
+        queue = deque(active)
+        queued = [False] * self.m
+        for x in queue:
+            queued[x] = True
+        touched: Set[int] = set()
+        evaluated = 0
+
+        while queue and not self.expired():
+            t1 = queue.popleft()
+            queued[t1] = False
+
+            for step in (1, -1):
+                t2 = self.next(t1, step)
+                if self.is_locked(t1, t2):
+                    continue
+                open_gain = dist[t1][t2]
+                reversals, chain = [], [t2]
+                best_gain, best_depth = IMPROVEMENT_EPSILON, 0
+
+                for _ in range(max_depth):
+                    choice, choice_score = None, -1.0
+                    for t3 in neighbors[t2]:
+                        g1 = open_gain - dist[t2][t3]
+                        if g1 <= 0:
+                            break
+                        t4 = self.next(t3, -step)
+                        if t3 in (t1, self.next(t2, step)) or t4 == t2 or self.is_locked(t3, t4):
+                            continue
+                        evaluated += 1
+                        score = g1 + dist[t3][t4]
+                        if score > choice_score:
+                            choice, choice_score = (t3, t4), score
+                    if choice is None:
+                        break
+
+                    t3, t4 = choice
+                    if step == 1:
+                        span = (self.pos[t2], self.pos[t4])   # t1 t2 ... t4 t3  ->  t1 t4 ... t2 t3
+                    else:
+                        span = (self.pos[t4], self.pos[t2])   # t3 t4 ... t2 t1  ->  t3 t2 ... t4 t1
+                    self.reverse(*span)
+                    reversals.append(span)
+                    chain.extend((t3, t4))
+                    # Reversing the shorter side may have flipped the tour's direction
+                    step = 1 if self.next(t1, 1) == t4 else -1
+
+                    closed_gain = choice_score - dist[t4][t1]
+                    if closed_gain > best_gain:
+                        best_gain, best_depth = closed_gain, len(reversals)
+                    open_gain = choice_score
+                    t2 = t4
+
+                for span in reversed(reversals[best_depth:]):
+                    self.reverse(*span)
+                if best_depth:
+                    self.accepted += 1
+                    for x in [t1] + chain[:2 * best_depth + 1]:
+                        touched.add(x)
+                        if not queued[x]:
+                            queued[x] = True
+                            queue.append(x)
+                    break
+        self.evaluated += evaluated
+        return touched
+
+    def local_search(self, active: Optional[Iterable[int]] = None, moves: Iterable[str] = ('2opt', 'oropt', 'lk')):
+        """Apply the requested move types in turn until none of them finds an improvement."""
+        pending = set(range(self.m) if active is None else active)
+        while pending and not self.expired():
+            touched: Set[int] = set()
+            if '2opt' in moves:
+                touched |= self.two_opt(pending | touched)
+            if 'oropt' in moves:
+                touched |= self.or_opt(pending | touched)
+            if 'lk' in moves:
+                touched |= self.lin_kernighan(pending | touched)
+            pending = touched
+
+    def double_bridge(self, rng: random.Random) -> Set[int]:
+        """
+        Perturb the tour with a random double-bridge kick (A B C D -> A C B D) that keeps the
+        start and any locked end in place. Returns the cities next to the changed edges.
+        """
+        order = self.linear()
+        inner = order[1:] if self.locked is None else order[1:-1]
+        if len(inner) < 8:
+            return set()
+        a, b, c = sorted(rng.sample(range(1, len(inner)), 3))
+        kicked = inner[:a] + inner[b:c] + inner[a:b] + inner[c:]
+        self.load([order[0]] + kicked + ([] if self.locked is None else [order[-1]]))
+        ends = {a - 1, a, b - 1, b, c - 1, c % len(inner)}
+        return {inner[i] for i in ends} | {order[0], order[-1]}
+
+    def record_moves(self):
+        """Add this tour's move counters to the optimization being measured, if any."""
+        count('moves_evaluated', self.evaluated)
+        count('moves_accepted', self.accepted)
+
+def fast_two_opt(dist_matrix: np.ndarray, route: List[int], closed: bool = False, fixed_end: bool = True,
+                 neighbor_k: int = NEIGHBOR_LIST_SIZE) -> List[int]:
+    """
+    2-opt local search using neighbor lists and don't-look bits.
+    Each move is evaluated in constant time from the matrix, only the k nearest neighbours
+    of a city are tried as new partners, and accepted moves reverse a segment of an
+    array-based tour in place (whichever side of the tour is shorter).
+    With closed=True the route is a tour and the edge back to the first stop is optimized too.
+    Otherwise it is a path from the first stop that ends at the current last stop
+    (fixed_end=True) or wherever is cheapest (fixed_end=False).
+    Assumes a symmetric matrix. Returns the improved route, still starting at route[0].
+    """
+    if len(route) < 3:
+        return list(route)
+    tour = LocalSearchTour(dist_matrix, route, closed, fixed_end, neighbor_k)
+    tour.two_opt(range(tour.m))
+    tour.record_moves()
+    return tour.route()
+
+def or_opt(dist_matrix: np.ndarray, route: List[int], closed: bool = False, fixed_end: bool = True,
+           max_segment: int = OR_OPT_MAX_SEGMENT, neighbor_k: int = NEIGHBOR_LIST_SIZE) -> List[int]:
+    """
+    Or-opt local search: move runs of up to max_segment stops, optionally reversed,
+    to a cheaper place in the route. Takes the same route options as fast_two_opt.
+    """
+    if len(route) < 3:
+        return list(route)
+    tour = LocalSearchTour(dist_matrix, route, closed, fixed_end, neighbor_k)
+    tour.or_opt(range(tour.m), max_segment)
+    tour.record_moves()
+    return tour.route()
+
+def lin_kernighan(dist_matrix: np.ndarray, route: List[int], closed: bool = False, fixed_end: bool = True,
+                  max_depth: int = LK_MAX_DEPTH, neighbor_k: int = NEIGHBOR_LIST_SIZE) -> List[int]:
+    """
+    Lin-Kernighan-style local search built from chains of up to max_depth 2-opt steps.
+    Takes the same route options as fast_two_opt.
+    """
+    if len(route) < 3:
+        return list(route)
+    tour = LocalSearchTour(dist_matrix, route, closed, fixed_end, neighbor_k)
+    tour.lin_kernighan(range(tour.m), max_depth)
+    tour.record_moves()
+    return tour.route()
+
+def anytime_optimize(dist_matrix: np.ndarray, route: List[int], closed: bool = False, fixed_end: bool = True,
+                     time_budget: Optional[float] = None, max_iterations: Optional[int] = None,
+                     seed: Optional[int] = None, neighbor_k: int = NEIGHBOR_LIST_SIZE) -> List[int]:
+    """
+    Improve a route for as long as the budget allows and return the best route found.
+    The route is first taken to a local optimum of 2-opt, Or-opt and Lin-Kernighan moves,
+    then repeatedly kicked with a double bridge and re-optimized (iterated local search),
+    keeping a kicked route only when it is shorter. time_budget is in seconds and also
+    bounds the initial descent; max_iterations caps the number of kicks. With neither
+    budget the result is the first local optimum.
+    """
+    if len(route) < 3:
+        return list(route)
+
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    tour = LocalSearchTour(dist_matrix, route, closed, fixed_end, neighbor_k, deadline)
+    tour.local_search()
+    best_cycle, best_length = list(tour.tour), tour.length()
+    if time_budget is None and max_iterations is None:
+        tour.record_moves()
+        return tour.route()
+
+    rng = random.Random(seed)
+    iteration = 0
+    while not tour.expired() and (max_iterations is None or iteration < max_iterations):
+        iteration += 1
+        kicked = tour.double_bridge(rng)
+        if not kicked:
+            break
+        tour.local_search(kicked)
+        length = tour.length()
+        if length < best_length - IMPROVEMENT_EPSILON:
+            best_cycle, best_length = list(tour.tour), length
+        else:
+            tour.load(best_cycle)
+
+    tour.load(best_cycle)
+    tour.record_moves()
+    return tour.route()
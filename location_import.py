@@ -0,0 +1,109 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import csv
+import io
+import json
+import math
+
+MAX_ADDRESS_LENGTH = 255  # DeliveryLocation.address column size
+COORDINATE_DECIMALS = 6  # Coordinates equal to this many decimals (about 0.1 m) count as the same place
+
+# Accepted column / key names for each field
+FIELD_ALIASES = {
+    'address': ('address',),
+    'latitude': ('latitude', 'lat'),
+    'longitude': ('longitude', 'lng', 'lon')
+}
+
+def import_format(requested: Optional[str] = None, filename: Optional[str] = None,
+                  mimetype: Optional[str] = None) -> Optional[str]:
+    """
+    Work out whether an upload is 'csv' or 'ndjson', from an explicit format, then the
+    file extension, then the content type. Returns None when none of them says.
+    """
+    if requested:
+        requested = requested.lower()
+        return requested if requested in ('csv', 'ndjson') else None
+    if filename:
+        extension = filename.rsplit('.', 1)[-1].lower()
+        if extension == 'csv':
+            return 'csv'
+        if extension in ('ndjson', 'jsonl'):
+            return 'ndjson'
+    if mimetype in ('text/csv', 'application/csv'):
+        return 'csv'
+    if mimetype in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        return 'ndjson'
+    return None
+
+def validate_location(record: Dict) -> Dict:
+    """
+    Check one record and return it as {'address', 'latitude', 'longitude'}.
+    Raises ValueError with a message for the caller's per-row error report.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("Expected an object with address, latitude and longitude")
+    values = {}
+    for field, aliases in FIELD_ALIASES.items():
+        value = next((record[name] for name in aliases if record.get(name) not in (None, '')), None)
+        if value is None:
+            raise ValueError(f"Missing {field}")
+        values[field] = value
+
+    address = str(values['address']).strip()
+    if not address:
+        raise ValueError("Missing address")
+    if len(address) > MAX_ADDRESS_LENGTH:
+        raise ValueError(f"Address is longer than {MAX_ADDRESS_LENGTH} characters")
+    try:
+        latitude = float(values['latitude'])
+        longitude = float(values['longitude'])
+    except (TypeError, ValueError):
+        raise ValueError("Latitude and longitude must be numbers")
+    if not (math.isfinite(latitude) and -90 <= latitude <= 90):
+        raise ValueError(f"Latitude {values['latitude']} is outside -90..90")
+    if not (math.isfinite(longitude) and -180 <= longitude <= 180):
+        raise ValueError(f"Longitude {values['longitude']} is outside -180..180")
+    return {'address': address, 'latitude': latitude, 'longitude': longitude}
+
+def parse_locations(stream, fmt: str) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """
+    Read locations from a binary stream one line at a time, without loading the file.
+    Yields (line number, location, None) for valid rows and (line number, None, error)
+    for rows that cannot be used, so one bad row does not stop the import.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='' if fmt == 'csv' else None)
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        if reader.fieldnames is not None:
+            reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+        for record in reader:
+            try:
+                yield reader.line_num, validate_location(record), None
+            except ValueError as e:
+                yield reader.line_num, None, str(e)
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if isinstance(record, dict):
+                record = {str(key).lower(): value for key, value in record.items()}
+            yield line_number, validate_location(record), None
+        except ValueError as e:  # Includes json.JSONDecodeError
+            yield line_number, None, str(e)
+
+def location_key(address: str, latitude: float, longitude: float) -> Tuple[str, float, float]:
+    """Key under which two locations count as duplicates: same address and coordinates."""
+    return address.strip(), round(latitude, COORDINATE_DECIMALS), round(longitude, COORDINATE_DECIMALS)
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,288 @@
+from typing import Dict, List, Optional, Tuple
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+import numpy as np
+from leg_cache import LegCache, get_default_cache
+from metrics import count
+
+load_dotenv()
+
+DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+
+# Distance Matrix API limits for a single request
+MAX_ELEMENTS_PER_REQUEST = 100
+MAX_LOCATIONS_PER_SIDE = 25
+
+CACHE_BATCH_ELEMENTS = 10000  # Fetched legs written to the leg cache per transaction
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that keeps request rates under a provider's QPS quota.
+    Tokens refill continuously at `rate` per second up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("Rate limit must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until `tokens` are available, then take them."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+class DistanceMatrixClient:
+    """
+    Client for the Google Maps Distance Matrix API that fetches many origin/destination
+    pairs per HTTP request and keeps its connections alive between calls.
+    With concurrency above 1 the requests for one matrix are spread over a thread pool,
+    throttled by an optional requests-per-second limit.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: str = DISTANCE_MATRIX_URL,
+                 session: Optional[requests.Session] = None, mode: str = 'driving',
+                 max_elements: int = MAX_ELEMENTS_PER_REQUEST,
+                 max_per_side: int = MAX_LOCATIONS_PER_SIDE,
+                 timeout: float = 10.0, pool_size: int = 10,
+                 cache: Optional[LegCache] = None, concurrency: int = 1,
+                 rate_limit: Optional[float] = None):
+        self.api_key = api_key if api_key is not None else os.getenv('GOOGLE_MAPS_API_KEY')
+        self.base_url = base_url
+        self.mode = mode
+        self.max_elements = max_elements
+        self.max_per_side = max_per_side
+        self.timeout = timeout
+        self.cache = cache
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = TokenBucket(rate_limit) if rate_limit else None
+        self.requests_made = 0
+        self._counter_lock = threading.Lock()
+
+        if session is None:
+            session = requests.Session()
+            pool_size = max(pool_size, self.concurrency)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+    def block_shape(self, n_origins: int, n_destinations: int) -> Tuple[int, int]:
+        """
+        Pick how many origins and destinations go into one request.
+        Blocks are kept close to square so the request count stays low.
+        """
+        side = max(1, min(self.max_per_side, math.isqrt(self.max_elements)))
+        dest_block = max(1, min(n_destinations, side))
+        origin_block = max(1, min(n_origins, self.max_per_side, self.max_elements // dest_block))
+        return origin_block, dest_block
+
+    def chunks(self, n_origins: int, n_destinations: int) -> List[Tuple[range, range]]:
+        """Split an origins x destinations matrix into request-sized blocks."""
+        origin_block, dest_block = self.block_shape(n_origins, n_destinations)
+        return [
+            (range(i, min(i + origin_block, n_origins)), range(j, min(j + dest_block, n_destinations)))
+            for i in range(0, n_origins, origin_block)
+            for j in range(0, n_destinations, dest_block)
+        ]
+
+    def build_params(self, origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]]) -> Dict:
+        """Build the query parameters for one Distance Matrix request."""
+        return {
+            'origins': '|'.join(f"{lat},{lng}" for lat, lng in origins),
+            'destinations': '|'.join(f"{lat},{lng}" for lat, lng in destinations),
+            'key': self.api_key,
+            'mode': self.mode,
+            'traffic_model': 'best_guess',
+            'departure_time': 'now'
+        }
+
+    def fetch_block(self, origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]],
+                    timeout: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Fetch one block of the matrix in a single request.
+        Returns (distances in km, times in hours); elements the API could not route are NaN.
+        """
+        distances = np.full((len(origins), len(destinations)), np.nan)
+        times = np.full((len(origins), len(destinations)), np.nan)
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        with self._counter_lock:
+            self.requests_made += 1
+        response = self.session.get(
+            self.base_url,
+            params=self.build_params(origins, destinations),
+            timeout=self.timeout if timeout is None else timeout
+        )
+        data = response.json()
+        if data.get('status') != 'OK':
+            raise ValueError(f"Distance Matrix request failed with status {data.get('status')}")
+
+        for i, row in enumerate(data['rows']):
+            for j, element in enumerate(row['elements']):
+                if element.get('status') != 'OK':
+                    continue
+                duration = element.get('duration_in_traffic') or element['duration']
+                distances[i, j] = element['distance']['value'] / 1000  # Convert meters to km
+                times[i, j] = duration['value'] / 3600  # Convert seconds to hours
+        return distances, times
+
+    def _fill_blocks(self, origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]],
+                     distances: np.ndarray, times: np.ndarray, concurrency: Optional[int]):
+        """
+        Fill the NaN entries of an origins x destinations matrix in place, first from the
+        cache and then with batched requests for every block that still has gaps.
+        Fetched blocks are written back to the cache CACHE_BATCH_ELEMENTS legs at a time,
+        until the matrix holds as many cached legs as the cache's size bound: a larger
+        matrix would only evict its own legs.
+        Blocks that fail or time out are left as NaN.
+        """
+        store_budget = 0
+        if self.cache is not None:
+            missing = int(np.isnan(distances).sum())
+            hits = self.cache.fill_matrix(origins, destinations, distances, times, self.mode)
+            count('cache_hits', hits)
+            count('cache_misses', missing - hits)
+            store_budget = self.cache.max_entries - hits
+
+        pending = []
+        for origin_range, dest_range in self.chunks(len(origins), len(destinations)):
+            rows = slice(origin_range.start, origin_range.stop)
+            cols = slice(dest_range.start, dest_range.stop)
+            if np.isnan(distances[rows, cols]).any():
+                pending.append((origin_range, dest_range))
+
+        def fetch(block):
+            origin_range, dest_range = block
+            try:
+                return self.fetch_block(
+                    [origins[i] for i in origin_range],
+                    [destinations[j] for j in dest_range]
+                )
+            except Exception as e:
+                print(f"Error using Google Maps API: {e}")
+                return None
+
+        workers = self.concurrency if concurrency is None else max(1, concurrency)
+
+        def fetched():
+            # Yield blocks as they arrive, so finished results are not held until the end
+            if workers > 1 and len(pending) > 1:
+                with ThreadPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+                    futures = {executor.submit(fetch, block): block for block in pending}
+                    for future in as_completed(futures):
+                        yield futures.pop(future), future.result()
+            else:
+                for block in pending:
+                    yield block, fetch(block)
+
+        batch, batch_elements, failures = [], 0, 0
+        for (origin_range, dest_range), result in fetched():
+            if result is None:
+                failures += 1
+                continue
+            block_distances, block_times = result
+            rows = slice(origin_range.start, origin_range.stop)
+            cols = slice(dest_range.start, dest_range.stop)
+            answered = ~np.isnan(block_distances)
+            np.copyto(distances[rows, cols], block_distances, where=answered)
+            np.copyto(times[rows, cols], block_times, where=answered)
+            if store_budget > 0:
+                batch.append((origins[rows], destinations[cols], block_distances, block_times))
+                batch_elements += block_distances.size
+                store_budget -= block_distances.size
+                if batch_elements >= CACHE_BATCH_ELEMENTS:
+                    self.cache.put_blocks(batch, self.mode)
+                    batch, batch_elements = [], 0
+        if batch:
+            self.cache.put_blocks(batch, self.mode)
+        count('api_calls', len(pending))
+        count('api_failures', failures)
+
+    @staticmethod
+    def _unique(points: List[Tuple[float, float]]) -> Tuple[List[Tuple[float, float]], np.ndarray]:
+        unique_index: Dict[Tuple[float, float], int] = {}
+        positions = np.empty(len(points), dtype=int)
+        for idx, point in enumerate(points):
+            positions[idx] = unique_index.setdefault(point, len(unique_index))
+        return list(unique_index), positions
+
+    def fetch_matrix(self, points: List[Tuple[float, float]], concurrency: Optional[int] = None,
+                     dtype=np.float64) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Fetch the full distance and time matrices between all points.
+        Duplicate coordinates are requested once, legs found in the cache are not
+        requested at all, and blocks that fail or time out are left as NaN so the
+        caller can fill them from a fallback. `concurrency` overrides the client's
+        worker count for this call; the matrices are allocated once in `dtype` and
+        filled block by block.
+        """
+        unique_points, positions = self._unique(points)
+        m = len(unique_points)
+        distances = np.full((m, m), np.nan, dtype=dtype)
+        times = np.full((m, m), np.nan, dtype=dtype)
+        np.fill_diagonal(distances, 0.0)
+        np.fill_diagonal(times, 0.0)
+
+        self._fill_blocks(unique_points, unique_points, distances, times, concurrency)
+
+        np.fill_diagonal(distances, 0.0)
+        np.fill_diagonal(times, 0.0)
+        if m == len(points):
+            return distances, times
+        return distances[np.ix_(positions, positions)], times[np.ix_(positions, positions)]
+
+    def fetch_rectangle(self, origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]],
+                        concurrency: Optional[int] = None, dtype=np.float64) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Fetch distances and times from every origin to every destination, with the same
+        deduplication, caching, allocation and NaN-on-failure behaviour as fetch_matrix.
+        Used to add rows and columns for new stops without refetching the rest of the matrix.
+        """
+        unique_origins, origin_positions = self._unique(origins)
+        unique_destinations, destination_positions = self._unique(destinations)
+        distances = np.full((len(unique_origins), len(unique_destinations)), np.nan, dtype=dtype)
+        times = np.full_like(distances, np.nan)
+        destination_index = {point: j for j, point in enumerate(unique_destinations)}
+        for i, point in enumerate(unique_origins):
+            j = destination_index.get(point)
+            if j is not None:
+                distances[i, j] = times[i, j] = 0.0
+
+        self._fill_blocks(unique_origins, unique_destinations, distances, times, concurrency)
+        if len(unique_origins) == len(origins) and len(unique_destinations) == len(destinations):
+            return distances, times
+        return (distances[np.ix_(origin_positions, destination_positions)],
+                times[np.ix_(origin_positions, destination_positions)])
+
+_default_client: Optional[DistanceMatrixClient] = None
+
+def get_default_client() -> DistanceMatrixClient:
+    """Return the process-wide client so its connection pool is reused across requests."""
+    global _default_client
+    if _default_client is None:
+        rate_limit = os.getenv('MAPS_API_QPS')
+        _default_client = DistanceMatrixClient(
+            cache=get_default_cache(),
+            concurrency=int(os.getenv('MATRIX_FETCH_CONCURRENCY', 1)),
+            rate_limit=float(rate_limit) if rate_limit else None
+        )
+    return _default_client
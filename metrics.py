@@ -0,0 +1,142 @@
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Counters collected during an optimization, with their /metrics help text
+OPTIMIZATION_COUNTERS = {
+    'api_calls': 'Distance Matrix API requests sent',
+    'api_failures': 'Distance Matrix API requests that failed or timed out',
+    'cache_hits': 'Legs answered by the leg cache',
+    'cache_misses': 'Legs looked up in the leg cache but not found',
+    'fallback_legs': 'Legs estimated with Haversine because the API gave no answer',
+    'moves_evaluated': 'Local search moves evaluated',
+    'moves_accepted': 'Local search moves applied'
+}
+
+_local = threading.local()
+
+class OptimizationStats:
+    """
+    Wall time per phase and event counters for one optimization.
+    While a phase is running, count() calls made from the same thread (API client,
+    leg cache lookups, local search) are added to these stats.
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator['OptimizationStats']:
+        previous = getattr(_local, 'stats', None)
+        _local.stats = self
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+            _local.stats = previous
+
+    def add(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + int(amount)
+
+    def merge(self, other: 'OptimizationStats'):
+        for name, seconds in other.phases.items():
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+        for name, amount in other.counters.items():
+            self.add(name, amount)
+
+    def as_dict(self) -> Dict:
+        return {
+            'phases_ms': {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()},
+            'counters': {name: self.counters.get(name, 0) for name in OPTIMIZATION_COUNTERS}
+        }
+
+def count(name: str, amount: int = 1):
+    """Add to a counter of the optimization running in this thread; a no-op outside one."""
+    stats = getattr(_local, 'stats', None)
+    if stats is not None and amount:
+        stats.add(name, amount)
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class MetricsRegistry:
+    """
+    Process-wide counters and histograms, rendered in the Prometheus text format.
+    Each metric may have several label sets; all methods are thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._histograms: Dict[str, Dict[Tuple, list]] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+
+    def inc(self, name: str, amount: float = 1, help: str = '', **labels):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self._help.setdefault(name, ('counter', help))
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, help: str = '', buckets: Sequence[float] = DEFAULT_BUCKETS, **labels):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self._help.setdefault(name, ('histogram', help))
+            buckets = self._buckets.setdefault(name, tuple(buckets))
+            # Per-bucket counts (the last one is +Inf), then the sum of observed values
+            series = self._histograms.setdefault(name, {})
+            counts = series.setdefault(key, [0] * (len(buckets) + 1) + [0.0])
+            counts[bisect.bisect_left(buckets, value)] += 1
+            counts[-1] += value
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted(self._help):
+                kind, help = self._help[name]
+                if help:
+                    lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                if kind == 'counter':
+                    for key, value in sorted(self._counters[name].items()):
+                        lines.append(f'{name}{_format_labels(key)} {_format_value(value)}')
+                    continue
+                buckets = self._buckets[name]
+                for key, counts in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, bucket_count in zip(list(buckets) + [math.inf], counts):
+                        cumulative += bucket_count
+                        le = key + (('le', _format_value(bound)),)
+                        lines.append(f'{name}_bucket{_format_labels(le)} {cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {_format_value(counts[-1])}')
+                    lines.append(f'{name}_count{_format_labels(key)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+def record_optimization(stats: OptimizationStats, solver: str, registry: Optional[MetricsRegistry] = None):
+    """Add one finished optimization's phase times and counters to the process-wide metrics."""
+    registry = registry or REGISTRY
+    registry.inc('route_optimizer_runs_total', help='Route optimizations finished', solver=solver)
+    for name, seconds in stats.phases.items():
+        registry.observe('route_optimizer_phase_seconds', seconds,
+                         help='Wall time of each route optimization phase', phase=name)
+    for name, help in OPTIMIZATION_COUNTERS.items():
+        registry.inc(f'route_optimizer_{name}_total', stats.counters.get(name, 0), help=help)
@@ -0,0 +1,144 @@
+from typing import Dict, List, Optional, Tuple
+import multiprocessing
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+import numpy as np
+from local_search import anytime_optimize, fast_two_opt
+
+GRASP_CANDIDATES = 3  # Randomized construction picks among this many nearest unvisited stops
+RESULT_GRACE_SECONDS = 0.05  # Extra wait for workers finishing right at the deadline
+
+# Shared-memory matrix attached in this worker process, kept across tasks of the same call
+_attached: Dict[str, Tuple[shared_memory.SharedMemory, np.ndarray]] = {}
+
+def _attach(name: str, shape: Tuple[int, int]) -> Optional[np.ndarray]:
+    """The call's shared matrix, or None if the call has already returned and removed it."""
+    if name not in _attached:
+        for old_segment, _ in _attached.values():
+            old_segment.close()
+        _attached.clear()
+        try:
+            segment = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            return None
+        _attached[name] = (segment, np.ndarray(shape, dtype=np.float64, buffer=segment.buf))
+    return _attached[name][1]
+
+def randomized_nearest_neighbor(dist_matrix: np.ndarray, start: int, end: Optional[int],
+                                rng: random.Random, candidates: int = GRASP_CANDIDATES) -> List[int]:
+    """
+    Nearest-neighbour construction that moves to a random one of the few nearest
+    unvisited stops at each step, so every seed gives a different starting tour.
+    """
+    n = len(dist_matrix)
+    unvisited = np.ones(n, dtype=bool)
+    unvisited[start] = False
+    if end is not None:
+        unvisited[end] = False
+    route = [start]
+    remaining = int(unvisited.sum())
+    for _ in range(remaining):
+        row = np.where(unvisited, dist_matrix[route[-1]], np.inf)
+        k = min(candidates, remaining)
+        nearest = np.argpartition(row, k - 1)[:k] if k < n else np.argsort(row)[:k]
+        next_loc = int(nearest[rng.randrange(k)])
+        route.append(next_loc)
+        unvisited[next_loc] = False
+        remaining -= 1
+    if end is not None:
+        route.append(end)
+    return route
+
+def _run_start(name: str, shape: Tuple[int, int], start: int, end: Optional[int], seed: int,
+               randomize: bool, deadline: Optional[float]) -> Optional[Tuple[float, List[int]]]:
+    """
+    One (randomized) start plus iterated local search, in a worker process. Returns None
+    at once if the worker only got to it after its call had returned.
+    """
+    dist = _attach(name, shape)
+    if dist is None:
+        return None
+    route = randomized_nearest_neighbor(dist, start, end, random.Random(seed), GRASP_CANDIDATES if randomize else 1)
+    budget = None if deadline is None else max(0.0, deadline - time.time())
+    route = anytime_optimize(dist, route, closed=False, fixed_end=end is not None, time_budget=budget, seed=seed)
+    length = float(sum(dist[a][b] for a, b in zip(route, route[1:])))
+    return length, route
+
+def multi_start_optimize(dist_matrix: np.ndarray, start: int = 0, end: Optional[int] = None,
+                         time_budget: Optional[float] = None, workers: Optional[int] = None,
+                         starts: Optional[int] = None, seed: Optional[int] = None, executor=None) -> List[int]:
+    """
+    Run randomized starts in parallel and return the shortest route found.
+    The first start is the plain nearest-neighbour tour and the others are randomized;
+    each is improved by iterated local search with its own random kicks.
+    Workers read the matrix from shared memory, so it is copied once instead of pickled
+    per task. With time_budget (wall-clock seconds) every start searches until the
+    deadline and results not in by then are dropped; without one each start stops at
+    its first local optimum. workers caps how many starts run at once (default: the pool
+    size) and starts is how many to run in total (default: workers).
+    The parent's own nearest neighbour + 2-opt route is kept as a fallback, so a result
+    is returned even if no worker finishes in time.
+    Called without an executor from inside a worker process (e.g. a batch problem), it
+    searches from the plain start in that process instead of opening a pool per worker.
+    """
+    from batch_optimizer import get_process_pool
+    from route_optimizer import _nearest_neighbor_path
+
+    dist = np.ascontiguousarray(dist_matrix, dtype=np.float64)
+    n = len(dist)
+    if n < 4:
+        return _nearest_neighbor_path(dist, start, end)
+    if executor is None and multiprocessing.parent_process() is not None:
+        return anytime_optimize(dist, _nearest_neighbor_path(dist, start, end), closed=False,
+                                fixed_end=end is not None, time_budget=time_budget, seed=seed)
+
+    executor = executor or get_process_pool()
+    workers = workers or getattr(executor, '_max_workers', 1)
+    starts = starts or workers
+    deadline = None if time_budget is None else time.time() + time_budget
+    base_seed = random.Random(seed).randrange(2 ** 31)
+
+    segment = shared_memory.SharedMemory(create=True, size=dist.nbytes)
+    try:
+        np.ndarray(dist.shape, dtype=np.float64, buffer=segment.buf)[:] = dist
+        pending = set()
+        submitted = 0
+        while submitted < min(workers, starts):
+            pending.add(executor.submit(_run_start, segment.name, dist.shape, start, end, base_seed + submitted,
+                                        submitted > 0, deadline))
+            submitted += 1
+
+        # Deterministic baseline while the workers run
+        best_route = fast_two_opt(dist, _nearest_neighbor_path(dist, start, end), closed=False, fixed_end=end is not None)
+        best_length = float(sum(dist[a][b] for a, b in zip(best_route, best_route[1:])))
+
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - time.time()) + RESULT_GRACE_SECONDS
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Multi-start worker failed: {e}")
+                    continue
+                if result is None:
+                    continue
+                length, route = result
+                if length < best_length:
+                    best_length, best_route = length, route
+                if submitted < starts and (deadline is None or time.time() < deadline):
+                    pending.add(executor.submit(_run_start, segment.name, dist.shape, start, end,
+                                                base_seed + submitted, True, deadline))
+                    submitted += 1
+        # Starts a worker has already taken cannot be cancelled; once the segment is
+        # unlinked below they find it gone and return without searching
+        for future in pending:
+            future.cancel()
+        return best_route
+    finally:
+        segment.close()
+        segment.unlink()
@@ -0,0 +1,303 @@
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import math
+import time
+import numpy as np
+from local_search import fast_two_opt, neighbor_lists
+
+SAVINGS_NEIGHBORS = 30  # Savings pairs are only formed between a stop and its nearest stops
+IMPROVEMENT_EPSILON = 1e-10
+
+Cap = Union[None, int, float, Sequence[Optional[float]]]
+
+def _per_vehicle(cap: Cap, num_vehicles: int) -> List[float]:
+    """Expand a uniform or per-vehicle cap into one value per vehicle (inf = no cap)."""
+    if cap is None:
+        return [math.inf] * num_vehicles
+    if isinstance(cap, (int, float)):
+        return [float(cap)] * num_vehicles
+    caps = [math.inf if c is None else float(c) for c in cap]
+    if len(caps) != num_vehicles:
+        raise ValueError("Per-vehicle caps must have one entry per vehicle")
+    return caps
+
+class FleetPlanner:
+    """
+    Multi-vehicle route planner sharing one distance matrix across all vehicles.
+
+    Routes are built with the Clarke-Wright savings heuristic (savings pairs limited to
+    each stop's nearest neighbours), assigned to vehicles, then improved with inter-route
+    relocate and exchange moves and finally with 2-opt inside every route. Every route
+    starts at the depot and, with return_to_depot, ends there too. Per-vehicle caps on the
+    number of stops and on route distance are respected throughout; stops that cannot be
+    placed under the caps are reported as unassigned.
+    """
+
+    def __init__(self, dist_matrix: np.ndarray, depot: int, stops: List[int], num_vehicles: int,
+                 max_stops: Cap = None, max_distance: Cap = None, return_to_depot: bool = True):
+        if num_vehicles < 1:
+            raise ValueError("At least one vehicle is required")
+        self.dist_matrix = np.asarray(dist_matrix, dtype=float)
+        self.depot = depot
+        self.stops = list(stops)
+        self.num_vehicles = num_vehicles
+        self.return_to_depot = return_to_depot
+
+        if max_stops is None and max_distance is None:
+            # Without explicit caps, balance by giving every vehicle an equal share of stops
+            max_stops = math.ceil(len(self.stops) / num_vehicles) if self.stops else 0
+        self.stop_caps = _per_vehicle(max_stops, num_vehicles)
+        self.distance_caps = _per_vehicle(max_distance, num_vehicles)
+
+        nodes = [depot] + self.stops
+        sub = self.dist_matrix[np.ix_(nodes, nodes)]
+        if not return_to_depot:
+            # Open routes: the final leg back to the depot is free
+            sub[:, 0] = 0.0
+        self.dist = sub.tolist()
+        # Local ids: 0 is the depot, 1..n are the stops
+        self.neighbors = [[c for c in row if c != 0] for row in neighbor_lists(sub, SAVINGS_NEIGHBORS + 1)]
+        self.routes: List[List[int]] = [[] for _ in range(num_vehicles)]
+        self.lengths = [0.0] * num_vehicles
+        self.route_of: Dict[int, int] = {}
+        self.unassigned: List[int] = []
+
+    # Route bookkeeping
+
+    def route_length(self, route: List[int]) -> float:
+        if not route:
+            return 0.0
+        dist = self.dist
+        total = dist[0][route[0]] + dist[route[-1]][0]
+        for a, b in zip(route, route[1:]):
+            total += dist[a][b]
+        return total
+
+    def _set_route(self, vehicle: int, route: List[int]):
+        self.routes[vehicle] = route
+        self.lengths[vehicle] = self.route_length(route)
+        for stop in route:
+            self.route_of[stop] = vehicle
+
+    def _neighbors_in_route(self, route: List[int], index: int) -> Tuple[int, int]:
+        prev = route[index - 1] if index > 0 else 0
+        nxt = route[index + 1] if index + 1 < len(route) else 0
+        return prev, nxt
+
+    def _fits(self, vehicle: int, size: int, length: float) -> bool:
+        return size <= self.stop_caps[vehicle] and length <= self.distance_caps[vehicle] + 1e-9
+
+    # Construction
+
+    def _savings_routes(self) -> List[List[int]]:
+        """Clarke-Wright savings over nearest-neighbour pairs under the loosest vehicle caps."""
+        dist, n = self.dist, len(self.stops)
+        stop_cap = max(self.stop_caps)
+        distance_cap = max(self.distance_caps)
+
+        routes: Dict[int, List[int]] = {s: [s] for s in range(1, n + 1)}
+        owner = {s: s for s in range(1, n + 1)}
+        lengths = {s: dist[0][s] + dist[s][0] for s in range(1, n + 1)}
+
+        pairs = {(min(i, j), max(i, j)) for i in range(1, n + 1) for j in self.neighbors[i][:SAVINGS_NEIGHBORS]}
+        if not pairs:
+            return list(routes.values())
+        pair_array = np.array(sorted(pairs))
+        d = np.asarray(dist)
+        savings = d[0, pair_array[:, 0]] + d[pair_array[:, 1], 0] - d[pair_array[:, 0], pair_array[:, 1]]
+        order = np.argsort(-savings, kind='stable')
+
+        for idx in order.tolist():
+            saving = float(savings[idx])
+            if saving <= 0:
+                break
+            i, j = pair_array[idx].tolist()
+            ri, rj = owner[i], owner[j]
+            if ri == rj:
+                continue
+            a, b = routes[ri], routes[rj]
+            if i not in (a[0], a[-1]) or j not in (b[0], b[-1]):
+                continue
+            merged_length = lengths[ri] + lengths[rj] - saving
+            if len(a) + len(b) > stop_cap or merged_length > distance_cap + 1e-9:
+                continue
+
+            # Orient so the route of i ends with i and the route of j starts with j
+            if a[-1] != i:
+                a.reverse()
+            if b[0] != j:
+                b.reverse()
+            keep, drop = (ri, rj) if len(a) >= len(b) else (rj, ri)
+            routes[keep] = a + b
+            lengths[keep] = merged_length
+            for stop in routes[drop]:
+                owner[stop] = keep
+            for stop in routes[keep]:
+                owner[stop] = keep
+            del routes[drop], lengths[drop]
+
+        return list(routes.values())
+
+    def _reduce_route_count(self, routes: List[List[int]]) -> List[List[int]]:
+        """Concatenate routes until there is at most one per vehicle; leftovers become unassigned."""
+        stop_cap = max(self.stop_caps)
+        distance_cap = max(self.distance_caps)
+        routes = sorted(routes, key=len, reverse=True)
+        while len(routes) > self.num_vehicles:
+            smallest = routes.pop()
+            best, best_cost = None, math.inf
+            for k, route in enumerate(routes):
+                if len(route) + len(smallest) > stop_cap:
+                    continue
+                for candidate in (route + smallest, route + smallest[::-1]):
+                    length = self.route_length(candidate)
+                    cost = length - self.route_length(route)
+                    if length <= distance_cap + 1e-9 and cost < best_cost:
+                        best, best_cost = (k, candidate), cost
+            if best is None:
+                self.unassigned.extend(smallest)
+            else:
+                routes[best[0]] = best[1]
+            routes.sort(key=len, reverse=True)
+        return routes
+
+    def _assign_routes(self, routes: List[List[int]]):
+        """Give the largest routes to the vehicles with the largest caps, trimming any excess."""
+        vehicles = sorted(range(self.num_vehicles), key=lambda v: (self.stop_caps[v], self.distance_caps[v]), reverse=True)
+        routes = sorted(routes, key=len, reverse=True)
+        for vehicle, route in zip(vehicles, routes):
+            route = list(route)
+            while route and not self._fits(vehicle, len(route), self.route_length(route)):
+                # Drop the stop whose removal saves the most distance
+                gains = [
+                    self.dist[p][x] + self.dist[x][q] - self.dist[p][q]
+                    for k, x in enumerate(route)
+                    for p, q in [self._neighbors_in_route(route, k)]
+                ]
+                self.unassigned.append(route.pop(int(np.argmax(gains))))
+            self._set_route(vehicle, route)
+
+    def _insert_unassigned(self):
+        """Cheapest feasible insertion of unassigned stops into any route."""
+        remaining = []
+        for stop in self.unassigned:
+            best, best_cost = None, math.inf
+            for vehicle, route in enumerate(self.routes):
+                for k in range(len(route) + 1):
+                    p = route[k - 1] if k > 0 else 0
+                    q = route[k] if k < len(route) else 0
+                    cost = self.dist[p][stop] + self.dist[stop][q] - self.dist[p][q]
+                    if cost < best_cost and self._fits(vehicle, len(route) + 1, self.lengths[vehicle] + cost):
+                        best, best_cost = (vehicle, k), cost
+            if best is None:
+                remaining.append(stop)
+            else:
+                vehicle, k = best
+                self._set_route(vehicle, self.routes[vehicle][:k] + [stop] + self.routes[vehicle][k:])
+        self.unassigned = remaining
+
+    # Improvement
+
+    def _improve_inter_route(self, deadline: Optional[float]):
+        """Relocate and exchange stops between routes while any move shortens the total distance."""
+        dist = self.dist
+        improved = True
+        while improved and (deadline is None or time.perf_counter() < deadline):
+            improved = False
+            for x in range(1, len(self.stops) + 1):
+                if x not in self.route_of:
+                    continue
+                vx = self.route_of[x]
+                rx = self.routes[vx]
+                ix = rx.index(x)
+                px, nx = self._neighbors_in_route(rx, ix)
+                removal_gain = dist[px][x] + dist[x][nx] - dist[px][nx]
+
+                best_delta, best_move = -IMPROVEMENT_EPSILON, None
+                for c in self.neighbors[x]:
+                    vc = self.route_of.get(c)
+                    if vc is None or vc == vx:
+                        continue
+                    rc = self.routes[vc]
+                    ic = rc.index(c)
+                    pc, nc = self._neighbors_in_route(rc, ic)
+
+                    # Relocate x next to c (before or after it)
+                    if len(rc) + 1 <= self.stop_caps[vc]:
+                        for p, q, k in ((pc, c, ic), (c, nc, ic + 1)):
+                            insert_cost = dist[p][x] + dist[x][q] - dist[p][q]
+                            delta = insert_cost - removal_gain
+                            if delta < best_delta and self.lengths[vc] + insert_cost <= self.distance_caps[vc] + 1e-9:
+                                best_delta, best_move = delta, ('relocate', vc, k)
+
+                    # Exchange x and c
+                    x_side = dist[px][c] + dist[c][nx] - dist[px][x] - dist[x][nx]
+                    c_side = dist[pc][x] + dist[x][nc] - dist[pc][c] - dist[c][nc]
+                    delta = x_side + c_side
+                    if (delta < best_delta
+                            and self.lengths[vx] + x_side <= self.distance_caps[vx] + 1e-9
+                            and self.lengths[vc] + c_side <= self.distance_caps[vc] + 1e-9):
+                        best_delta, best_move = delta, ('exchange', vc, ic)
+
+                if best_move is None:
+                    continue
+                kind, vc, k = best_move
+                rc = list(self.routes[vc])
+                rx = list(rx)
+                if kind == 'relocate':
+                    rx.pop(ix)
+                    rc.insert(k, x)
+                else:
+                    rx[ix], rc[k] = rc[k], x
+                self._set_route(vx, rx)
+                self._set_route(vc, rc)
+                improved = True
+
+    def _improve_intra_route(self):
+        """2-opt inside every route, keeping the depot first."""
+        for vehicle, route in enumerate(self.routes):
+            if len(route) < 3:
+                continue
+            tour = fast_two_opt(self.dist_matrix, [self.depot] + [self.stops[s - 1] for s in route],
+                                closed=self.return_to_depot, fixed_end=False)
+            local = {self.stops[s - 1]: s for s in route}
+            improved = [local[node] for node in tour[1:]]
+            length = self.route_length(improved)
+            if length < self.lengths[vehicle] - IMPROVEMENT_EPSILON and self._fits(vehicle, len(improved), length):
+                self._set_route(vehicle, improved)
+
+    def solve(self, time_budget: Optional[float] = None) -> Tuple[List[List[int]], List[int]]:
+        """
+        Plan the routes. time_budget (seconds) bounds the inter-route improvement phase.
+        Returns (one list of stop indices per vehicle, unassigned stop indices), using the
+        indices of the original distance matrix; routes do not include the depot.
+        """
+        deadline = None if time_budget is None else time.perf_counter() + time_budget
+        self.routes = [[] for _ in range(self.num_vehicles)]
+        self.lengths = [0.0] * self.num_vehicles
+        self.route_of, self.unassigned = {}, []
+        if self.stops:
+            routes = self._reduce_route_count(self._savings_routes())
+            self._assign_routes(routes)
+            self._insert_unassigned()
+            while True:
+                before = sum(self.lengths)
+                self._improve_inter_route(deadline)
+                self._improve_intra_route()
+                self._insert_unassigned()
+                if sum(self.lengths) >= before - IMPROVEMENT_EPSILON or (deadline is not None and time.perf_counter() >= deadline):
+                    break
+
+        routes = [[self.stops[s - 1] for s in route] for route in self.routes]
+        return routes, sorted(self.stops[s - 1] for s in self.unassigned)
+
+def plan_fleet_routes(dist_matrix: np.ndarray, depot: int, stops: List[int], num_vehicles: int,
+                      max_stops: Cap = None, max_distance: Cap = None, return_to_depot: bool = True,
+                      time_budget: Optional[float] = None) -> Tuple[List[List[int]], List[int]]:
+    """
+    Split stops between num_vehicles routes from a shared depot and order each route.
+    max_stops and max_distance may be a single cap for every vehicle or one value per
+    vehicle; with neither, stops are shared out evenly.
+    Returns (one route of matrix indices per vehicle, unassigned stops).
+    """
+    planner = FleetPlanner(dist_matrix, depot, stops, num_vehicles, max_stops, max_distance, return_to_depot)
+    return planner.solve(time_budget)
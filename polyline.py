@@ -0,0 +1,68 @@
+from typing import Iterable, List, Tuple
+import math
+
+PRECISION = 5  # Decimal places kept, as in Google's encoded polylines (about 1 m)
+
+def _round(value: float) -> int:
+    # Round half away from zero like the reference encoder; round() rounds half to even
+    return int(math.copysign(math.floor(abs(value) + 0.5), value))
+
+def _encode_value(value: int, out: List[str]):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+def encode(points: Iterable[Tuple[float, float]], precision: int = PRECISION) -> str:
+    """
+    Encode (lat, lng) pairs with Google's encoded polyline algorithm: each coordinate is
+    stored as the difference from the previous point, a few ASCII characters per point.
+    """
+    factor = 10 ** precision
+    out: List[str] = []
+    previous_lat = previous_lng = 0
+    for lat, lng in points:
+        lat_value, lng_value = _round(float(lat) * factor), _round(float(lng) * factor)
+        _encode_value(lat_value - previous_lat, out)
+        _encode_value(lng_value - previous_lng, out)
+        previous_lat, previous_lng = lat_value, lng_value
+    return ''.join(out)
+
+def decode(text: str, precision: int = PRECISION) -> List[Tuple[float, float]]:
+    """Decode an encoded polyline into (lat, lng) pairs. Raises ValueError if it is malformed."""
+    factor = 10 ** precision
+    points = []
+    values = []
+    shift = result = 0
+    for char in text:
+        byte = ord(char) - 63
+        if not 0 <= byte < 64:
+            raise ValueError(f"Invalid character {char!r} in encoded polyline")
+        result |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(result >> 1) if result & 1 else result >> 1)
+            shift = result = 0
+    if shift or len(values) % 2:
+        raise ValueError("Encoded polyline ends in the middle of a point")
+
+    lat = lng = 0
+    for i in range(0, len(values), 2):
+        lat += values[i]
+        lng += values[i + 1]
+        points.append((lat / factor, lng / factor))
+    return points
+
+def parse_waypoints(text: str) -> List[Tuple[float, float]]:
+    """Parse the old "lat1,lng1;lat2,lng2" waypoint text. Raises ValueError if it is malformed."""
+    points = []
+    for waypoint in text.split(';'):
+        if not waypoint.strip():
+            continue
+        try:
+            lat, lng = waypoint.split(',')
+            points.append((float(lat), float(lng)))
+        except ValueError:
+            raise ValueError(f"Waypoint {waypoint.strip()!r} is not \"lat,lng\"")
+    return points
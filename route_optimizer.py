@@ -1,14 +1,32 @@
-from typing import Dict, List, Set, Tuple
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import heapq
 import math
+import time
 import requests
 import os
 from dotenv import load_dotenv
 import numpy as np
 from math import radians, sin, cos, sqrt, atan2
 from datetime import datetime, timedelta
+from maps_client import DistanceMatrixClient, get_default_client
+from leg_cache import get_default_cache
+from local_search import LocalSearchTour, anytime_optimize, fast_two_opt, lin_kernighan, neighbor_lists, or_opt
+from multi_vehicle import plan_fleet_routes
+from spatial_index import SpatialIndex, nearest_neighbor_route
+from time_windows import has_time_windows, solve_time_windows, window_arrays
+from multi_start import multi_start_optimize
+from metrics import OptimizationStats, count, record_optimization
 
 load_dotenv()
 
+EARTH_RADIUS_KM = 6371  # Earth's radius in kilometers
+AVERAGE_CITY_SPEED_KMH = 20  # Used to estimate travel time when no road data is available
+HELD_KARP_MAX_BYTES = 64 * 1024 * 1024  # Largest DP table the exact solver may allocate: 19 nodes, under a second
+DEFAULT_TIME_BUDGET = 0.3  # Seconds the anytime solver spends when no budget is given
+INCREMENTAL_WINDOW = 8  # Stops on each side of a change that incremental re-optimization may reorder
+METRIC_ROUNDING_UNITS = 8  # Machine epsilons of slack is_metric allows for rounding in the matrix's dtype
+MATRIX_DTYPE = np.float32  # RouteOptimizer's matrices; 4 bytes per entry keeps 2000 stops at 16 MB each
+
 class Graph:
     def __init__(self):
         self.vertices: Dict[str, Dict[str, float]] = {}
@@ -29,11 +47,103 @@ class Graph:
     def get_distance(self, from_vertex: str, to_vertex: str) -> float:
         return self.vertices[from_vertex][to_vertex]
 
+    def to_csr(self, coordinates: Optional[Dict[str, Tuple[float, float]]] = None) -> 'CSRGraph':
+        """Build a compact, read-only CSR snapshot of this graph for fast shortest-path queries."""
+        return CSRGraph.from_graph(self, coordinates)
+
+class CSRGraph:
+    """
+    Immutable compressed-sparse-row graph with integer vertex ids.
+    The neighbours of vertex v are targets[offsets[v]:offsets[v + 1]] with matching
+    weights; names maps ids back to vertex names and index maps names to ids.
+    Optional per-vertex coordinates (degrees) enable the A* Haversine heuristic.
+    """
+
+    def __init__(self, names: List[str], offsets: np.ndarray, targets: np.ndarray, weights: np.ndarray,
+                 lats: Optional[np.ndarray] = None, lons: Optional[np.ndarray] = None):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.lats = None if lats is None else np.asarray(lats, dtype=np.float64)
+        self.lons = None if lons is None else np.asarray(lons, dtype=np.float64)
+        for array in (self.offsets, self.targets, self.weights, self.lats, self.lons):
+            if array is not None:
+                array.flags.writeable = False
+        # Plain lists are much faster than NumPy scalars inside the Python search loops
+        self._offsets = self.offsets.tolist()
+        self._targets = self.targets.tolist()
+        self._weights = self.weights.tolist()
+
+    @classmethod
+    def from_edges(cls, names: List[str], sources, targets, weights, undirected: bool = True,
+                   coordinates: Optional[Dict[str, Tuple[float, float]]] = None) -> 'CSRGraph':
+        """
+        Build a graph in bulk from parallel arrays of source ids, target ids and weights.
+        Undirected edges are stored in both directions.
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+        if undirected:
+            sources, targets = np.concatenate([sources, targets]), np.concatenate([targets, sources])
+            weights = np.concatenate([weights, weights])
+
+        order = np.argsort(sources, kind='stable')
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(names)), out=offsets[1:])
+
+        lats = lons = None
+        if coordinates is not None:
+            points = np.array([coordinates[name] for name in names], dtype=np.float64).reshape(-1, 2)
+            lats, lons = points[:, 0], points[:, 1]
+        return cls(names, offsets, targets[order], weights[order], lats, lons)
+
+    @classmethod
+    def from_graph(cls, graph: Graph, coordinates: Optional[Dict[str, Tuple[float, float]]] = None) -> 'CSRGraph':
+        """Build a graph from the dict-of-dicts Graph (whose edges are already stored both ways)."""
+        names = list(graph.vertices)
+        index = {name: i for i, name in enumerate(names)}
+        sources, targets, weights = [], [], []
+        for name, edges in graph.vertices.items():
+            source = index[name]
+            for neighbor, distance in edges.items():
+                sources.append(source)
+                targets.append(index[neighbor])
+                weights.append(distance)
+        return cls.from_edges(names, sources, targets, weights, undirected=False, coordinates=coordinates)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def neighbors(self, vertex: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (neighbour ids, edge weights) of a vertex as read-only array views."""
+        start, end = self._offsets[vertex], self._offsets[vertex + 1]
+        return self.targets[start:end], self.weights[start:end]
+
+    def path_to(self, previous: np.ndarray, source: int, target: int) -> List[str]:
+        """Reconstruct the vertex names on the path from source to target from a predecessor array."""
+        if target != source and previous[target] == -1:
+            return []
+        path = []
+        vertex = target
+        while vertex != -1:
+            path.append(self.names[vertex])
+            vertex = int(previous[vertex])
+        return path[::-1]
+
 def get_google_maps_distance(origin: Tuple[float, float], destination: Tuple[float, float]) -> float:
     """
     Get the actual road distance between two points using Google Maps Distance Matrix API.
+    Legs already in the shared leg cache are answered without a network call.
     Returns distance in kilometers.
     """
+    cache = get_default_cache()
+    cached = cache.get(origin, destination, 'driving')
+    if cached is not None:
+        return cached[0]
+
     api_key = os.getenv('GOOGLE_MAPS_API_KEY')
     url = f"https://maps.googleapis.com/maps/api/distancematrix/json"
     
@@ -49,7 +159,11 @@ def get_google_maps_distance(origin: Tuple[float, float], destination: Tuple[flo
         data = response.json()
         
         if data['status'] == 'OK':
-            return data['rows'][0]['elements'][0]['distance']['value'] / 1000  # Convert meters to kilometers
+            element = data['rows'][0]['elements'][0]
+            distance_km = element['distance']['value'] / 1000  # Convert meters to kilometers
+            duration = element.get('duration_in_traffic') or element['duration']
+            cache.put(origin, destination, distance_km, duration['value'] / 3600, 'driving')
+            return distance_km
         else:
             # Fallback to Haversine if API fails
             return calculate_haversine_distance(origin, destination)
@@ -79,62 +193,248 @@ def calculate_haversine_distance(origin: Tuple[float, float], destination: Tuple
 def dijkstra(graph: Graph, start: str) -> Tuple[Dict[str, float], Dict[str, str]]:
     """
     Implementation of Dijkstra's algorithm for finding shortest paths.
+    Uses a binary heap with lazy deletion, so it runs in O((V + E) log V).
     Returns a tuple of (distances, previous_vertices).
     """
     distances = {vertex: float('infinity') for vertex in graph.vertices}
     distances[start] = 0
     previous = {vertex: None for vertex in graph.vertices}
-    unvisited: Set[str] = set(graph.vertices)
+    visited: Set[str] = set()
+    heap = [(0, start)]
     
-    while unvisited:
-        current = min(unvisited, key=lambda x: distances[x])
+    while heap:
+        distance, current = heapq.heappop(heap)
+        if current in visited:
+            continue
+        visited.add(current)
         
-        if distances[current] == float('infinity'):
-            break
-            
-        unvisited.remove(current)
-        
-        for neighbor in graph.get_neighbors(current):
-            if neighbor in unvisited:
-                distance = distances[current] + graph.get_distance(current, neighbor)
-                if distance < distances[neighbor]:
-                    distances[neighbor] = distance
-                    previous[neighbor] = current
+        for neighbor, weight in graph.vertices[current].items():
+            candidate = distance + weight
+            if candidate < distances[neighbor]:
+                distances[neighbor] = candidate
+                previous[neighbor] = current
+                heapq.heappush(heap, (candidate, neighbor))
     
     return distances, previous
 
-def floyd_warshall(locations: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+def csr_dijkstra(graph: CSRGraph, source: int, targets: Optional[Set[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Heap-based Dijkstra over a CSRGraph from the vertex id `source`.
+    If targets is given the search stops as soon as every target is settled, so
+    distances are only final for settled vertices.
+    Returns (distances, predecessors) arrays indexed by vertex id; unreached vertices
+    have distance inf and predecessor -1.
+    """
+    n = len(graph)
+    offsets, neighbors, weights = graph._offsets, graph._targets, graph._weights
+    distances = [math.inf] * n
+    previous = [-1] * n
+    settled = [False] * n
+    remaining = None if targets is None else set(targets)
+
+    distances[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        distance, current = heapq.heappop(heap)
+        if settled[current]:
+            continue
+        settled[current] = True
+        if remaining is not None:
+            remaining.discard(current)
+            if not remaining:
+                break
+
+        for k in range(offsets[current], offsets[current + 1]):
+            neighbor = neighbors[k]
+            candidate = distance + weights[k]
+            if candidate < distances[neighbor]:
+                distances[neighbor] = candidate
+                previous[neighbor] = current
+                heapq.heappush(heap, (candidate, neighbor))
+
+    return np.array(distances), np.array(previous, dtype=np.int64)
+
+def csr_astar(graph: CSRGraph, source: int, target: int) -> Tuple[float, np.ndarray]:
+    """
+    A* search from source to target over a CSRGraph with vertex coordinates.
+    The Haversine distance to the target is the heuristic; it is exact-safe as long as
+    every edge weight (km) is at least the straight-line distance between its ends.
+    Returns (distance, predecessors); the distance is inf if the target is unreachable.
+    """
+    if graph.lats is None or graph.lons is None:
+        raise ValueError("A* needs vertex coordinates; build the CSRGraph with coordinates")
+
+    n = len(graph)
+    offsets, neighbors, weights = graph._offsets, graph._targets, graph._weights
+
+    # Heuristic for every vertex at once: great-circle distance to the target
+    lat, lon = np.radians(graph.lats), np.radians(graph.lons)
+    a = (np.sin((lat - lat[target]) / 2) ** 2 +
+         np.cos(lat) * np.cos(lat[target]) * np.sin((lon - lon[target]) / 2) ** 2)
+    heuristic = (2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))).tolist()
+
+    distances = [math.inf] * n
+    previous = [-1] * n
+    settled = [False] * n
+    distances[source] = 0.0
+    heap = [(heuristic[source], source)]
+
+    while heap:
+        _, current = heapq.heappop(heap)
+        if settled[current]:
+            continue
+        if current == target:
+            break
+        settled[current] = True
+
+        distance = distances[current]
+        for k in range(offsets[current], offsets[current + 1]):
+            neighbor = neighbors[k]
+            candidate = distance + weights[k]
+            if candidate < distances[neighbor]:
+                distances[neighbor] = candidate
+                previous[neighbor] = current
+                heapq.heappush(heap, (candidate + heuristic[neighbor], neighbor))
+
+    return distances[target], np.array(previous, dtype=np.int64)
+
+def haversine_matrix(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Calculate great-circle distances between every pair of points at once.
+    Takes latitude and longitude arrays in degrees and returns an n x n matrix in kilometers.
+    """
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lon = np.radians(np.asarray(lons, dtype=float))
+
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    cos_lat = np.cos(lat)
+
+    a = np.sin(dlat / 2) ** 2 + cos_lat[:, None] * cos_lat[None, :] * np.sin(dlon / 2) ** 2
+    dist = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    np.fill_diagonal(dist, 0.0)
+    return dist
+
+def haversine_pairs(lats: np.ndarray, lons: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """
+    Calculate great-circle distances in kilometers from point rows[k] to point cols[k]
+    for each k, without building the full matrix.
+    """
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lon = np.radians(np.asarray(lons, dtype=float))
+    lat1, lat2 = lat[rows], lat[cols]
+
+    a = np.sin((lat1 - lat2) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon[rows] - lon[cols]) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def fill_missing_legs(lats: np.ndarray, lons: np.ndarray, distances: np.ndarray, times: np.ndarray) -> int:
+    """
+    Fill the NaN entries of a distance/time matrix pair in place with Haversine distances
+    and times at average city speed. Returns the number of entries filled.
+    """
+    rows, cols = np.nonzero(np.isnan(distances) | np.isnan(times))
+    if len(rows):
+        fallback = haversine_pairs(lats, lons, rows, cols)
+        distances[rows, cols] = fallback
+        times[rows, cols] = fallback / AVERAGE_CITY_SPEED_KMH
+    return len(rows)
+
+def location_coordinates(locations: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pull the latitude and longitude of every location into two float arrays.
+    """
+    n = len(locations)
+    lats = np.fromiter((float(loc['latitude']) for loc in locations), dtype=float, count=n)
+    lons = np.fromiter((float(loc['longitude']) for loc in locations), dtype=float, count=n)
+    return lats, lons
+
+def build_distance_matrix(locations: List[Dict]) -> np.ndarray:
+    """
+    Build the full Haversine distance matrix (in kilometers) for a list of locations.
+    Each location should be a dictionary with 'latitude' and 'longitude' keys.
+    """
+    if not locations:
+        return np.zeros((0, 0))
+    lats, lons = location_coordinates(locations)
+    return haversine_matrix(lats, lons)
+
+def route_length(dist: np.ndarray, route: List[int], closed: bool = False) -> float:
+    """
+    Sum the matrix distances along a route, optionally including the edge back to the start.
+    """
+    if len(route) < 2:
+        return 0.0
+    idx = np.asarray(route, dtype=int)
+    total = float(dist[idx[:-1], idx[1:]].sum())
+    if closed:
+        total += float(dist[idx[-1], idx[0]])
+    return total
+
+def is_metric(dist_matrix: np.ndarray, tolerance: float = 1e-9, max_pivots: Optional[int] = None,
+              seed: int = 0) -> bool:
+    """
+    Check whether a distance matrix already satisfies the triangle inequality, i.e. no
+    detour through a third point is shorter than the direct entry. Pivots are tried in a
+    random order and the check stops at the first violation; with max_pivots only that
+    many pivots are tried, which makes it a fast sampled test rather than a proof.
+    The tolerance is raised to a few units of rounding in the matrix's own precision, so
+    float32 matrices are not failed by rounding alone.
+    """
+    dist = np.asarray(dist_matrix)
+    if not np.issubdtype(dist.dtype, np.floating):
+        dist = dist.astype(float)
+    tolerance = max(tolerance, METRIC_ROUNDING_UNITS * float(np.finfo(dist.dtype).eps))
+    slack = tolerance * max(1.0, float(np.max(dist[np.isfinite(dist)], initial=0.0)))
+    limit = dist - slack
+    via = np.empty_like(dist)
+    shorter = np.empty(dist.shape, dtype=bool)
+    pivots = np.random.default_rng(seed).permutation(len(dist))[:max_pivots]
+    for k in pivots:
+        np.add(dist[:, k:k+1], dist[k:k+1, :], out=via)
+        np.less(via, limit, out=shorter)
+        if shorter.any():
+            return False
+    return True
+
+def floyd_warshall(locations: List[Dict], dist_matrix: Optional[np.ndarray] = None,
+                   assume_metric: Optional[bool] = None) -> Tuple[np.ndarray, np.ndarray]:
     """
     Implementation of Floyd-Warshall algorithm for all-pairs shortest paths.
+    Each pivot relaxes the whole matrix at once with broadcast row/column sums.
+    Relaxation is skipped entirely when the matrix is known to be metric: for Haversine
+    matrices built from locations, or when the caller passes assume_metric=True. Other
+    matrices, such as road distances, are always relaxed; checking them with is_metric
+    would cost as much as the relaxation itself, and a sampled check can miss the one
+    pivot that gives a shortcut.
     Returns a tuple of (distance matrix, next matrix).
     """
-    n = len(locations)
-    dist = np.full((n, n), float('inf'))
-    next_node = np.full((n, n), -1, dtype=int)
-    
-    # Initialize distance matrix
-    for i in range(n):
-        dist[i][i] = 0
-        for j in range(i + 1, n):
-            distance = calculate_haversine_distance(
-                (locations[i]['latitude'], locations[i]['longitude']),
-                (locations[j]['latitude'], locations[j]['longitude'])
-            )
-            dist[i][j] = distance
-            dist[j][i] = distance
-            next_node[i][j] = j
-            next_node[j][i] = i
-    
-    # Floyd-Warshall algorithm
-    for k in range(n):
-        for i in range(n):
-            for j in range(n):
-                if dist[i][j] > dist[i][k] + dist[k][j]:
-                    dist[i][j] = dist[i][k] + dist[k][j]
-                    next_node[i][j] = next_node[i][k]
-    
+    if dist_matrix is None:
+        dist_matrix = build_distance_matrix(locations)
+        if assume_metric is None:
+            assume_metric = True
+
+    dist = np.array(dist_matrix, dtype=float, copy=True)
+    n = len(dist)
+    next_node = np.tile(np.arange(n), (n, 1))
+    next_node[~np.isfinite(dist)] = -1
+    np.fill_diagonal(next_node, -1)
+
+    if not assume_metric:
+        _relax_all_pairs(dist, next_node)
     return dist, next_node
 
+def _relax_all_pairs(dist: np.ndarray, next_node: np.ndarray):
+    """The Floyd-Warshall relaxation, in place: one broadcast pass per pivot."""
+    via = np.empty_like(dist)
+    better = np.empty(dist.shape, dtype=bool)
+    for k in range(len(dist)):
+        np.add(dist[:, k:k+1], dist[k:k+1, :], out=via)
+        np.less(via, dist, out=better)
+        if better.any():
+            np.copyto(dist, via, where=better)
+            rows, cols = np.nonzero(better)
+            next_node[rows, cols] = next_node[rows, k]
+
 def get_path_floyd_warshall(next_node: np.ndarray, start: int, end: int) -> List[int]:
     """
     Reconstruct the path from start to end using the next_node matrix.
@@ -148,71 +448,128 @@ def get_path_floyd_warshall(next_node: np.ndarray, start: int, end: int) -> List
         path.append(start)
     return path
 
-def tsp_brute_force(locations: List[Dict]) -> List[int]:
+def tsp_brute_force(locations: List[Dict], dist_matrix: Optional[np.ndarray] = None) -> List[int]:
     """
-    Implementation of TSP using brute force (for small number of locations).
-    Returns the optimal route as a list of indices.
+    Exact TSP for small numbers of locations, returning the optimal closed tour as a list of indices.
+    Solved with Held-Karp dynamic programming rather than enumerating permutations,
+    so it falls back to a heuristic only when the DP table would not fit in memory.
     """
-    n = len(locations)
-    if n > 10:  # Brute force is too slow for more than 10 locations
-        return nearest_neighbor(locations)
-    
-    from itertools import permutations
-    
-    min_distance = float('inf')
-    best_route = None
-    
-    # Try all possible permutations
-    for route in permutations(range(n)):
-        distance = 0
-        for i in range(n - 1):
-            distance += calculate_haversine_distance(
-                (locations[route[i]]['latitude'], locations[route[i]]['longitude']),
-                (locations[route[i + 1]]['latitude'], locations[route[i + 1]]['longitude'])
-            )
-        distance += calculate_haversine_distance(
-            (locations[route[-1]]['latitude'], locations[route[-1]]['longitude']),
-            (locations[route[0]]['latitude'], locations[route[0]]['longitude'])
-        )
-        
-        if distance < min_distance:
-            min_distance = distance
-            best_route = route
-    
-    return list(best_route)
+    if dist_matrix is None:
+        dist_matrix = build_distance_matrix(locations)
+    if not locations:
+        return []
+    return held_karp(dist_matrix, start=0, return_to_start=True)
+
+def held_karp_memory(n: int) -> int:
+    """Estimate the bytes Held-Karp needs for n nodes (cost table plus parent table)."""
+    m = max(n - 1, 0)
+    return (1 << m) * m * (np.dtype(np.float64).itemsize + np.dtype(np.int8).itemsize)
+
+def held_karp(dist_matrix: np.ndarray, start: int = 0, end: Optional[int] = None,
+              return_to_start: bool = True, max_memory_bytes: int = HELD_KARP_MAX_BYTES) -> List[int]:
+    """
+    Exact shortest route by bitmask dynamic programming (Held-Karp) over a distance matrix.
+    The route always begins at `start`. With return_to_start the tour closes back at the start
+    (the start is not repeated in the result); otherwise the path is open and ends at `end`,
+    or wherever is cheapest when no end is given.
+    Falls back to nearest neighbor plus 2-opt when the 2^n table would exceed max_memory_bytes.
+    Returns the route as a list of indices.
+    """
+    n = len(dist_matrix)
+    if n == 0:
+        return []
+    if end == start:
+        end, return_to_start = None, True
+    if end is not None:
+        return_to_start = False
+
+    nodes = [i for i in range(n) if i != start and i != end]
+    m = len(nodes)
+    if m == 0:
+        return [start] if end is None else [start, end]
+    if held_karp_memory(m + 1) > max_memory_bytes:
+        return _heuristic_route(dist_matrix, start, end, return_to_start)
+
+    node_idx = np.asarray(nodes)
+    d = np.asarray(dist_matrix, dtype=np.float64)[np.ix_(node_idx, node_idx)]
+    full = (1 << m) - 1
+
+    # cost[mask, j]: shortest path leaving start, visiting exactly `mask`, ending at nodes[j]
+    cost = np.full((1 << m, m), np.inf)
+    parent = np.full((1 << m, m), -1, dtype=np.int8 if m < 127 else np.int16)
+    singles = 1 << np.arange(m)
+    cost[singles, np.arange(m)] = np.asarray(dist_matrix, dtype=np.float64)[start, node_idx]
+
+    masks = np.arange(1 << m)
+    popcount = np.zeros(1 << m, dtype=np.int8)
+    for b in range(m):
+        popcount += (masks >> b) & 1
+
+    for size in range(2, m + 1):
+        layer = masks[popcount == size]
+        for j in range(m):
+            bit = 1 << j
+            with_j = layer[(layer & bit) != 0]
+            candidates = cost[with_j ^ bit] + d[:, j]
+            best = np.argmin(candidates, axis=1)
+            cost[with_j, j] = candidates[np.arange(len(with_j)), best]
+            parent[with_j, j] = best
+
+    if return_to_start:
+        closing = np.asarray(dist_matrix, dtype=np.float64)[node_idx, start]
+    elif end is not None:
+        closing = np.asarray(dist_matrix, dtype=np.float64)[node_idx, end]
+    else:
+        closing = np.zeros(m)
+    last = int(np.argmin(cost[full] + closing))
+
+    # Walk the parent table back from the full set
+    order = []
+    mask = full
+    while last != -1:
+        order.append(nodes[last])
+        prev = int(parent[mask, last])
+        mask ^= 1 << last
+        last = prev
+
+    route = [start] + order[::-1]
+    if end is not None:
+        route.append(end)
+    return route
 
-def nearest_neighbor(locations: List[Dict]) -> List[int]:
+def _heuristic_route(dist_matrix: np.ndarray, start: int, end: Optional[int], return_to_start: bool) -> List[int]:
+    """Nearest neighbor plus 2-opt, honouring the same start/end rules as held_karp."""
+    route = _nearest_neighbor_path(dist_matrix, start, end)
+    return fast_two_opt(dist_matrix, route, closed=return_to_start, fixed_end=end is not None)
+
+def _nearest_neighbor_path(dist_matrix: np.ndarray, start: int, end: Optional[int]) -> List[int]:
+    n = len(dist_matrix)
+    unvisited = np.ones(n, dtype=bool)
+    unvisited[start] = False
+    if end is not None:
+        unvisited[end] = False
+    route = [start]
+    for _ in range(int(unvisited.sum())):
+        next_loc = int(np.argmin(np.where(unvisited, dist_matrix[route[-1]], np.inf)))
+        route.append(next_loc)
+        unvisited[next_loc] = False
+    if end is not None:
+        route.append(end)
+    return route
+
+def nearest_neighbor(locations: List[Dict], dist_matrix: Optional[np.ndarray] = None) -> List[int]:
     """
     Implementation of the Nearest Neighbor algorithm for TSP.
+    Without a distance matrix the route is built from a spatial index in O(n log n),
+    so no O(n^2) matrix is needed.
     Returns a list of indices representing the optimized route.
     """
     if not locations:
         return []
+    if dist_matrix is None:
+        return nearest_neighbor_route(SpatialIndex.from_locations(locations), 0)
     
-    n = len(locations)
-    visited = [False] * n
-    route = [0]  # Start with the first location
-    visited[0] = True
-    
-    for _ in range(n - 1):
-        current = route[-1]
-        min_dist = float('infinity')
-        next_loc = -1
-        
-        for i in range(n):
-            if not visited[i]:
-                dist = calculate_haversine_distance(
-                    (locations[current]['latitude'], locations[current]['longitude']),
-                    (locations[i]['latitude'], locations[i]['longitude'])
-                )
-                if dist < min_dist:
-                    min_dist = dist
-                    next_loc = i
-        
-        route.append(next_loc)
-        visited[next_loc] = True
-    
-    return route
+    return _nearest_neighbor_path(dist_matrix, 0, None)
 
 def two_opt_swap(route: List[int], i: int, j: int) -> List[int]:
     """
@@ -223,110 +580,179 @@ def two_opt_swap(route: List[int], i: int, j: int) -> List[int]:
     new_route.extend(route[j+1:])
     return new_route
 
-def two_opt(locations: List[Dict], initial_route: List[int]) -> List[int]:
+def two_opt(locations: List[Dict], initial_route: List[int], dist_matrix: Optional[np.ndarray] = None) -> List[int]:
     """
     Implementation of the 2-opt algorithm for improving an existing route.
+    The first and last stops of the route stay in place.
     """
-    n = len(initial_route)
-    best_route = initial_route.copy()
-    improved = True
-    
-    while improved:
-        improved = False
-        for i in range(1, n - 2):
-            for j in range(i + 1, n - 1):
-                # Calculate the change in distance
-                old_dist = (
-                    calculate_haversine_distance(
-                        (locations[best_route[i-1]]['latitude'], locations[best_route[i-1]]['longitude']),
-                        (locations[best_route[i]]['latitude'], locations[best_route[i]]['longitude'])
-                    ) +
-                    calculate_haversine_distance(
-                        (locations[best_route[j]]['latitude'], locations[best_route[j]]['longitude']),
-                        (locations[best_route[j+1]]['latitude'], locations[best_route[j+1]]['longitude'])
-                    )
-                )
-                
-                new_dist = (
-                    calculate_haversine_distance(
-                        (locations[best_route[i-1]]['latitude'], locations[best_route[i-1]]['longitude']),
-                        (locations[best_route[j]]['latitude'], locations[best_route[j]]['longitude'])
-                    ) +
-                    calculate_haversine_distance(
-                        (locations[best_route[i]]['latitude'], locations[best_route[i]]['longitude']),
-                        (locations[best_route[j+1]]['latitude'], locations[best_route[j+1]]['longitude'])
-                    )
-                )
-                
-                if new_dist < old_dist:
-                    best_route = two_opt_swap(best_route, i, j)
-                    improved = True
-    
-    return best_route
+    if dist_matrix is None:
+        dist_matrix = build_distance_matrix(locations)
+    return fast_two_opt(dist_matrix, initial_route, closed=False, fixed_end=True)
 
-def optimize_delivery_route(locations: List[Dict], use_google_maps: bool = True) -> List[Dict]:
+def optimize_delivery_route(locations: List[Dict], use_google_maps: bool = True,
+                            time_budget: Optional[float] = None,
+                            max_iterations: Optional[int] = None) -> List[Dict]:
     """
     Optimize the delivery route using a combination of algorithms.
     Each location should be a dictionary with 'id', 'latitude', and 'longitude' keys.
+    Without a budget the route is nearest neighbor plus 2-opt. With time_budget (seconds)
+    or max_iterations the anytime search keeps improving it and returns the best route
+    found when the budget runs out.
     Returns the optimized route as a list of locations.
     """
     if not locations:
         return []
     
+    # Build the distance matrix once and share it between both passes
+    dist_matrix = build_distance_matrix(locations)
+
     # First, get an initial route using Nearest Neighbor
-    initial_route = nearest_neighbor(locations)
+    initial_route = nearest_neighbor(locations, dist_matrix)
     
-    # Improve the route using 2-opt
-    optimized_route_indices = two_opt(locations, initial_route)
+    # Improve the route, letting the last stop change as well
+    if time_budget is None and max_iterations is None:
+        optimized_route_indices = fast_two_opt(dist_matrix, initial_route, closed=False, fixed_end=False)
+    else:
+        optimized_route_indices = anytime_optimize(
+            dist_matrix, initial_route, closed=False, fixed_end=False,
+            time_budget=time_budget, max_iterations=max_iterations
+        )
     
     # Convert indices back to location dictionaries
     return [locations[idx] for idx in optimized_route_indices]
 
+# Solvers registered for RouteOptimizer.optimize_route. Each takes
+# (dist_matrix, start, end, time_budget) and returns a route of matrix indices that
+# begins at start and, when end is given, finishes at end.
+SOLVERS: Dict[str, Callable[[np.ndarray, int, Optional[int], Optional[float]], List[int]]] = {}
+
+AUTO_EXACT_MAX_STOPS = 12          # Held-Karp answers in milliseconds up to here
+AUTO_EXACT_MAX_STOPS_SLOW = 16     # ...and within about a second up to here
+AUTO_LOCAL_SEARCH_MAX_STOPS = 5000  # Beyond this only plain 2-opt is affordable
+AUTO_MULTI_START_MIN_BUDGET = 2.0  # Seconds of budget that make parallel starts worth their startup cost
+
+def register_solver(name: str):
+    """Decorator that makes a solver selectable by name in RouteOptimizer.optimize_route."""
+    def decorator(func):
+        SOLVERS[name] = func
+        return func
+    return decorator
+
+def select_solver(num_stops: int, time_budget: Optional[float] = None, parallel: bool = True) -> str:
+    """
+    Pick a solver for the 'auto' mode from the number of stops to order and the latency budget.
+    Small routes are solved exactly, mid-sized routes get the anytime metaheuristic when
+    there is a budget to spend (run from several starts in parallel when the budget is
+    long, unless parallel is False because the caller already runs in a worker process),
+    and everything else gets heuristic local search.
+    """
+    if num_stops <= AUTO_EXACT_MAX_STOPS:
+        return 'held_karp'
+    if num_stops <= AUTO_EXACT_MAX_STOPS_SLOW and time_budget is not None and time_budget >= 1.0:
+        return 'held_karp'
+    if num_stops > AUTO_LOCAL_SEARCH_MAX_STOPS:
+        return 'two_opt'
+    if parallel and time_budget is not None and time_budget >= AUTO_MULTI_START_MIN_BUDGET:
+        return 'multi_start'
+    if time_budget is not None:
+        return 'anytime'
+    return 'local_search'
+
+@register_solver('nearest_neighbor')
+def _solve_nearest_neighbor(dist_matrix, start, end, time_budget):
+    return _nearest_neighbor_path(dist_matrix, start, end)
+
+@register_solver('two_opt')
+def _solve_two_opt(dist_matrix, start, end, time_budget):
+    route = _nearest_neighbor_path(dist_matrix, start, end)
+    return fast_two_opt(dist_matrix, route, closed=False, fixed_end=end is not None)
+
+@register_solver('local_search')
+def _solve_local_search(dist_matrix, start, end, time_budget):
+    route = _nearest_neighbor_path(dist_matrix, start, end)
+    return anytime_optimize(dist_matrix, route, closed=False, fixed_end=end is not None, time_budget=time_budget)
+
+@register_solver('anytime')
+def _solve_anytime(dist_matrix, start, end, time_budget):
+    route = _nearest_neighbor_path(dist_matrix, start, end)
+    return anytime_optimize(
+        dist_matrix, route, closed=False, fixed_end=end is not None,
+        time_budget=DEFAULT_TIME_BUDGET if time_budget is None else time_budget
+    )
+
+@register_solver('held_karp')
+def _solve_held_karp(dist_matrix, start, end, time_budget):
+    return held_karp(dist_matrix, start=start, end=end, return_to_start=False)
+
+@register_solver('floyd_warshall')
+def _solve_floyd_warshall(dist_matrix, start, end, time_budget):
+    # Route over shortest-path distances, which only differ from the matrix when it is not metric
+    shortest, _ = floyd_warshall(None, dist_matrix)
+    return _solve_two_opt(shortest, start, end, time_budget)
+
+@register_solver('multi_start')
+def _solve_multi_start(dist_matrix, start, end, time_budget):
+    return multi_start_optimize(dist_matrix, start, end,
+                                time_budget=DEFAULT_TIME_BUDGET if time_budget is None else time_budget)
+
+SOLVERS['brute_force'] = SOLVERS['held_karp']
+
 class RouteOptimizer:
-    def __init__(self, locations: List[Dict]):
+    def __init__(self, locations: List[Dict], matrix_client: Optional[DistanceMatrixClient] = None,
+                 fetch_concurrency: Optional[int] = None):
         """
         Initialize the route optimizer with a list of locations.
         Each location should be a dict with: id, latitude, longitude, address
+        The matrix client defaults to the shared Distance Matrix client; fetch_concurrency
+        overrides how many matrix requests it runs in parallel.
         """
-        self.locations = locations
-        self.distances = {}  # Cache for distances between points
-        self.times = {}      # Cache for travel times between points
-        self._calculate_distances()
+        self.matrix_client = matrix_client or get_default_client()
+        self.fetch_concurrency = fetch_concurrency
+        self._set_locations(locations)
+        self.dist_matrix = np.zeros((len(locations), len(locations)), dtype=MATRIX_DTYPE)  # By list position
+        self.time_matrix = np.zeros((len(locations), len(locations)), dtype=MATRIX_DTYPE)
+        self._stats = OptimizationStats()  # Matrix work not yet reported by an optimization
+        with self._stats.phase('matrix'):
+            self._calculate_distances()
 
-    def _get_google_maps_distance(self, origin: Tuple[float, float], destination: Tuple[float, float]) -> Tuple[float, float]:
+    def _set_locations(self, locations: List[Dict]):
         """
-        Get the actual road distance and time between two points using Google Maps Distance Matrix API.
-        Returns a tuple of (distance in km, time in hours).
+        Store the locations as parallel arrays (ids, lats, lons) by list position, plus
+        positions mapping each id to every position it occupies. An id can appear more
+        than once, e.g. the depot repeated at the end of a round trip.
         """
-        api_key = os.getenv('GOOGLE_MAPS_API_KEY')
-        if not api_key:
-            raise ValueError("Google Maps API key not found in environment variables")
+        self.locations = list(locations)
+        ids = [loc['id'] for loc in self.locations]
+        integer_ids = all(isinstance(i, (int, np.integer)) for i in ids)
+        self.ids = np.array(ids, dtype=np.int64 if integer_ids else object)
+        self.lats, self.lons = location_coordinates(self.locations)
+        self.positions: Dict[Any, List[int]] = {}
+        for i, location_id in enumerate(ids):
+            self.positions.setdefault(location_id, []).append(i)
 
-        url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-        params = {
-            'origins': f"{origin[0]},{origin[1]}",
-            'destinations': f"{destination[0]},{destination[1]}",
-            'key': api_key,
-            'mode': 'driving',
-            'traffic_model': 'best_guess',
-            'departure_time': 'now'
-        }
+    def _endpoints(self, start_location_id) -> Tuple[int, Optional[int]]:
+        """Matrix positions of the depot, and of its copy at the end if the route returns to it."""
+        copies = self.positions[start_location_id]
+        last = len(self.locations) - 1
+        return copies[0], (last if len(copies) > 1 and copies[-1] == last else None)
 
-        try:
-            response = requests.get(url, params=params)
-            data = response.json()
+    def _take_stats(self) -> OptimizationStats:
+        """Stats for the next optimization, starting with the matrix work done since the last one."""
+        stats, self._stats = self._stats, OptimizationStats()
+        return stats
 
-            if data['status'] == 'OK' and data['rows'][0]['elements'][0]['status'] == 'OK':
-                distance_km = data['rows'][0]['elements'][0]['distance']['value'] / 1000  # Convert meters to km
-                duration_hrs = data['rows'][0]['elements'][0]['duration_in_traffic']['value'] / 3600  # Convert seconds to hours
-                return distance_km, duration_hrs
-            else:
-                # Fallback to Haversine if API fails
-                return self._calculate_haversine_distance(origin, destination)
-        except Exception as e:
-            print(f"Error using Google Maps API: {e}")
-            # Fallback to Haversine if API fails
-            return self._calculate_haversine_distance(origin, destination)
+    def _finish_stats(self, stats: OptimizationStats, solver: str) -> Dict:
+        record_optimization(stats, solver)
+        return stats.as_dict()
+
+    def _fill_missing(self, distances: np.ndarray, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Convert to the compact matrix type and fill pairs the API could not answer with Haversine."""
+        distances = distances.astype(MATRIX_DTYPE, copy=False)
+        times = times.astype(MATRIX_DTYPE, copy=False)
+        filled = fill_missing_legs(self.lats, self.lons, distances, times)
+        if filled:
+            count('fallback_legs', filled)
+        return distances, times
 
     def _calculate_haversine_distance(self, origin: Tuple[float, float], destination: Tuple[float, float]) -> Tuple[float, float]:
         """
@@ -348,88 +774,335 @@ class RouteOptimizer:
         
         distance = R * c
         
-        # Estimate time based on average city speed (20 km/h)
-        time = distance / 20
+        # Estimate time based on average city speed
+        time = distance / AVERAGE_CITY_SPEED_KMH
         
         return distance, time
 
     def _calculate_distances(self):
-        """Calculate and cache distances and times between all pairs of locations."""
-        for i, loc1 in enumerate(self.locations):
-            for j, loc2 in enumerate(self.locations[i+1:], i+1):
-                origin = (float(loc1['latitude']), float(loc1['longitude']))
-                destination = (float(loc2['latitude']), float(loc2['longitude']))
-                
-                distance, time = self._get_google_maps_distance(origin, destination)
-                
-                # Cache both distance and time
-                self.distances[(loc1['id'], loc2['id'])] = distance
-                self.distances[(loc2['id'], loc1['id'])] = distance
-                self.times[(loc1['id'], loc2['id'])] = time
-                self.times[(loc2['id'], loc1['id'])] = time
+        """
+        Calculate distances and times between all pairs of locations.
+        The matrix is fetched in bulk; pairs the API could not answer fall back to Haversine.
+        """
+        if not self.locations:
+            return
+        if not self.matrix_client.api_key:
+            raise ValueError("Google Maps API key not found in environment variables")
+
+        points = list(zip(self.lats.tolist(), self.lons.tolist()))
+        distances, times = self.matrix_client.fetch_matrix(points, concurrency=self.fetch_concurrency,
+                                                           dtype=MATRIX_DTYPE)
+        self.dist_matrix, self.time_matrix = self._fill_missing(distances, times)
+
+    def _lookup(self, matrix: np.ndarray, location1_id, location2_id) -> float:
+        first = self.positions.get(location1_id)
+        second = self.positions.get(location2_id)
+        if first is None or second is None:
+            return 0
+        return float(matrix[first[0], second[0]])
 
     def get_distance(self, location1_id: int, location2_id: int) -> float:
         """Get the distance between two locations by their IDs."""
-        return self.distances.get((location1_id, location2_id), 0)
+        return self._lookup(self.dist_matrix, location1_id, location2_id)
 
     def get_time(self, location1_id: int, location2_id: int) -> float:
         """Get the travel time between two locations by their IDs."""
-        return self.times.get((location1_id, location2_id), 0)
+        return self._lookup(self.time_matrix, location1_id, location2_id)
+
+    def add_locations(self, new_locations: List[Dict]):
+        """
+        Append locations and fetch only the matrix rows and columns they need.
+        Existing entries are kept as they are.
+        """
+        if not new_locations:
+            return
+        with self._stats.phase('matrix'):
+            self._add_locations(new_locations)
+
+    def _add_locations(self, new_locations: List[Dict]):
+        if not self.matrix_client.api_key:
+            raise ValueError("Google Maps API key not found in environment variables")
+
+        old_points = list(zip(self.lats.tolist(), self.lons.tolist()))
+        new_points = [(float(loc['latitude']), float(loc['longitude'])) for loc in new_locations]
+        points = old_points + new_points
+        n, k = len(old_points), len(new_points)
+
+        # New rows (new -> everything) and new columns (old -> new)
+        rows_d, rows_t = self.matrix_client.fetch_rectangle(new_points, points, concurrency=self.fetch_concurrency,
+                                                         dtype=MATRIX_DTYPE)
+        if n:
+            cols_d, cols_t = self.matrix_client.fetch_rectangle(old_points, new_points, concurrency=self.fetch_concurrency,
+                                                             dtype=MATRIX_DTYPE)
+        else:
+            cols_d = cols_t = np.zeros((0, k))
+
+        distances = np.zeros((n + k, n + k), dtype=MATRIX_DTYPE)
+        times = np.zeros((n + k, n + k), dtype=MATRIX_DTYPE)
+        distances[:n, :n] = self.dist_matrix
+        times[:n, :n] = self.time_matrix
+        distances[n:, :] = rows_d
+        times[n:, :] = rows_t
+        distances[:n, n:] = cols_d
+        times[:n, n:] = cols_t
+
+        self._set_locations(self.locations + list(new_locations))
+        self.dist_matrix, self.time_matrix = self._fill_missing(distances, times)
+
+    def remove_locations(self, location_ids: List[int]):
+        """
+        Drop locations (and their matrix rows and columns) by id.
+        A location id repeated in the list of locations is removed everywhere.
+        """
+        removed = set(location_ids)
+        keep = [i for i, location_id in enumerate(self.ids.tolist()) if location_id not in removed]
+        self._set_locations([self.locations[i] for i in keep])
+        self.dist_matrix = self.dist_matrix[np.ix_(keep, keep)]
+        self.time_matrix = self.time_matrix[np.ix_(keep, keep)]
 
     def nearest_neighbor(self, start_location_id: int) -> Tuple[List[Dict], float, float]:
         """
         Implement the Nearest Neighbor algorithm for route optimization.
+        Only each stop's geographically nearest stops (from a spatial index) are compared
+        by road distance, instead of scanning every unvisited stop at each step.
         Returns a tuple of (ordered locations list, total distance, total time).
         """
-        unvisited = [loc for loc in self.locations if loc['id'] != start_location_id]
-        current = next(loc for loc in self.locations if loc['id'] == start_location_id)
-        route = [current]
-        total_distance = 0
-        total_time = 0
-
-        while unvisited:
-            # Find the nearest unvisited location
-            nearest = min(unvisited, 
-                        key=lambda x: self.get_distance(current['id'], x['id']))
-            
-            # Add to route and update total distance and time
-            total_distance += self.get_distance(current['id'], nearest['id'])
-            total_time += self.get_time(current['id'], nearest['id'])
-            route.append(nearest)
-            current = nearest
-            unvisited.remove(nearest)
+        start = self.positions[start_location_id][0]
+        stops = np.concatenate(([start], np.flatnonzero(self.ids != self.ids[start])))
+        index = SpatialIndex(self.lats[stops], self.lons[stops], self.ids[stops].tolist())
+        dist = self.dist_matrix
+        order = nearest_neighbor_route(index, 0, distance=lambda a, b: dist[stops[a], stops[b]])
+        route = stops[order].tolist()
 
-        return route, total_distance, total_time
+        return ([self.locations[i] for i in route], route_length(self.dist_matrix, route),
+                route_length(self.time_matrix, route))
 
-    def optimize_route(self, start_location_id: int, algorithm: str = 'nearest_neighbor') -> Dict:
+    def optimize_route(self, start_location_id: int, algorithm: str = 'nearest_neighbor',
+                       time_budget: Optional[float] = None) -> Dict:
         """
         Optimize the delivery route using the specified algorithm.
+        algorithm is any name in SOLVERS, or 'auto' to pick one from the number of stops
+        and the time budget (seconds); unknown names are treated as 'auto'.
+        If the depot is repeated as the last location the route is pinned to end there.
+        Locations may carry 'window_start'/'window_end' (hours after departure) and
+        'service_minutes'; the route then keeps every stop inside its window and stops that
+        cannot be served in time are returned under 'infeasible_locations'.
+        'metrics' holds the wall time of each phase (including fetching the matrix, if this
+        is the optimizer's first run) and counters of API calls, cache hits and misses,
+        Haversine fallbacks and local search moves.
         Returns a dictionary with the optimized route information.
         """
-        if algorithm == 'nearest_neighbor':
-            route, total_distance, total_time = self.nearest_neighbor(start_location_id)
-        else:
-            # Default to nearest neighbor if algorithm not implemented
-            route, total_distance, total_time = self.nearest_neighbor(start_location_id)
+        start, end = self._endpoints(start_location_id)
+
+        solver = algorithm
+        if solver not in SOLVERS:
+            stops = len(self.locations) - 1 - (end is not None)
+            solver = select_solver(stops, time_budget)
 
-        # Add time for stops:
-        # - 3 minutes for each stop in between
-        # - 5 minutes for loading at start
-        # - 5 minutes for unloading at end
+        stats = self._take_stats()
+        started = time.perf_counter()
+        with stats.phase('solve'):
+            route_indices = SOLVERS[solver](self.dist_matrix, start, end, time_budget)
+        schedule = None
+        infeasible = []
+        if has_time_windows(self.locations):
+            with stats.phase('time_windows'):
+                # 3 minutes per stop unless given, 5 minutes loading at the depot
+                earliest, latest, service = window_arrays(self.locations, start, 3 / 60, 5 / 60)
+                stops = [i for i in range(len(self.locations)) if i not in (start, end)]
+                route_indices, infeasible, schedule = solve_time_windows(
+                    self.dist_matrix, self.time_matrix, start, end, stops, earliest, latest, service,
+                    initial_route=route_indices
+                )
+            solver = 'time_windows'
+        solve_time = time.perf_counter() - started
+
+        route = [self.locations[i] for i in route_indices]
+        total_distance = route_length(self.dist_matrix, route_indices)
         num_stops = len(route) - 1  # Exclude starting point
-        stop_time = (num_stops * 3 + 10) / 60  # Convert minutes to hours
-        
-        # Total time including stops
-        total_time += stop_time
+
+        if schedule is not None:
+            # Travel, waiting and service from the schedule plus 5 minutes unloading at the end
+            total_time = schedule.end_time() + 5 / 60
+        else:
+            total_time = route_length(self.time_matrix, route_indices)
+
+            # Add time for stops:
+            # - 3 minutes for each stop in between
+            # - 5 minutes for loading at start
+            # - 5 minutes for unloading at end
+            stop_time = (num_stops * 3 + 10) / 60  # Convert minutes to hours
+            
+            # Total time including stops
+            total_time += stop_time
         
         # Convert to hours and minutes
         hours = int(total_time)
         minutes = int((total_time - hours) * 60)
         
-        return {
+        result = {
             'locations': route,
             'total_distance': round(total_distance, 2),
             'estimated_time': f"{hours}h {minutes}m",
             'algorithm_used': algorithm,
-            'num_stops': num_stops
-        } 
\ No newline at end of file
+            'solver_used': solver,
+            'solve_time_ms': round(solve_time * 1000, 2),
+            'tour_length_km': total_distance,
+            'num_stops': num_stops,
+            'metrics': self._finish_stats(stats, solver)
+        }
+        if schedule is not None:
+            result['schedule'] = [
+                {'id': self.locations[i]['id'], 'arrival': arrival, 'service_start': begin}
+                for i, arrival, begin in zip(schedule.route, schedule.arrival, schedule.begin)
+            ]
+            result['infeasible_locations'] = [self.locations[i] for i in infeasible]
+        return result
+
+    def optimize_fleet(self, start_location_id: int, delivery_boys: List[Dict],
+                       max_stops=None, max_distance=None, time_budget: Optional[float] = None) -> Dict:
+        """
+        Split the locations between several delivery boys, one route each, from the same depot.
+        All routes are planned on this optimizer's single distance matrix. max_stops and
+        max_distance (km) may be one cap for everyone or a list with one value per delivery
+        boy; with neither, stops are shared out evenly. If the depot is repeated as the last
+        location every route returns to it.
+        Returns a dictionary with one route per delivery boy and any unassigned locations.
+        """
+        start, end = self._endpoints(start_location_id)
+        stops = [i for i in range(len(self.locations)) if i not in (start, end)]
+
+        stats = self._take_stats()
+        started = time.perf_counter()
+        with stats.phase('solve'):
+            routes, unassigned = plan_fleet_routes(self.dist_matrix, start, stops, len(delivery_boys),
+                                                   max_stops, max_distance, end is not None, time_budget)
+        solve_time = time.perf_counter() - started
+
+        fleet_routes = []
+        for delivery_boy, stop_indices in zip(delivery_boys, routes):
+            route_indices = [start] + stop_indices + ([end] if end is not None and stop_indices else [])
+            total_distance = route_length(self.dist_matrix, route_indices)
+            total_time = route_length(self.time_matrix, route_indices)
+            if stop_indices:
+                # Same allowances as optimize_route: 3 minutes per stop, 10 for loading/unloading
+                total_time += (len(stop_indices) * 3 + 10) / 60
+            hours = int(total_time)
+            minutes = int((total_time - hours) * 60)
+            fleet_routes.append({
+                'delivery_boy': delivery_boy,
+                'locations': [self.locations[i] for i in route_indices],
+                'total_distance': round(total_distance, 2),
+                'estimated_time': f"{hours}h {minutes}m",
+                'num_stops': len(stop_indices)
+            })
+
+        return {
+            'routes': fleet_routes,
+            'unassigned': [self.locations[i] for i in unassigned],
+            'total_distance': round(sum(r['total_distance'] for r in fleet_routes), 2),
+            'solve_time_ms': round(solve_time * 1000, 2),
+            'metrics': self._finish_stats(stats, 'fleet')
+        }
+
+    def update_route(self, route_ids: List[int], added_locations: Optional[List[Dict]] = None,
+                     removed_ids: Optional[List[int]] = None, window: int = INCREMENTAL_WINDOW) -> Dict:
+        """
+        Re-optimize an existing route after stops were added or removed.
+        route_ids is the current order of location ids, starting at the depot (and ending
+        there if the route returns to it); the depot stays in place. The last stop of an
+        open route is an ordinary stop: it may be removed, and added stops may go after it.
+        Only the matrix rows and columns of added locations are fetched, each added stop
+        goes to its cheapest position, and local search runs only on the few stops around
+        each change, so the rest of the sequence is left as it was.
+        Raises ValueError, before changing anything, if the route has stops this optimizer
+        does not know, the depot is to be removed, or an added location is already on the
+        route.
+        Returns a dictionary like optimize_route's.
+        """
+        if not route_ids:
+            raise ValueError("The route is empty")
+        unknown = [i for i in route_ids if i not in self.positions]
+        if unknown:
+            raise ValueError(f"Unknown stops on the route: {unknown}")
+        returns_to_depot = len(route_ids) > 1 and route_ids[-1] == route_ids[0]
+        if route_ids[0] in set(removed_ids or []):
+            raise ValueError(f"The depot {route_ids[0]} cannot be removed from the route")
+        seen = set(route_ids)
+        duplicates = []
+        for loc in added_locations or []:
+            if loc['id'] in seen:
+                duplicates.append(loc['id'])
+            seen.add(loc['id'])
+        if duplicates:
+            raise ValueError(f"Stops added more than once or already on the route: {duplicates}")
+
+        started = time.perf_counter()
+        removed = set(removed_ids or [])
+        kept = [route_ids[0]]
+        junctions = set()  # Stops that are now followed by a different stop
+        for location_id in route_ids[1:]:
+            if location_id in removed:
+                junctions.add(kept[-1])
+            else:
+                kept.append(location_id)
+        route_ids = kept
+        if removed:
+            self.remove_locations(list(removed))
+        # Stops the optimizer already has (e.g. dropped from the route earlier) need no fetch
+        added = list(added_locations or [])
+        self.add_locations([loc for loc in added if loc['id'] not in self.positions])
+        stats = self._take_stats()
+
+        # Map ids to matrix positions; a depot repeated at the end maps to its last copy
+        route = [self.positions[i][0] for i in route_ids]
+        if returns_to_depot:
+            route[-1] = self.positions[route_ids[0]][-1]
+
+        dist = self.dist_matrix
+        changed = set()
+        for loc in added:
+            node = self.positions[loc['id']][0]
+            costs = dist[route[:-1], node] + dist[node, route[1:]] - dist[route[:-1], route[1:]]
+            if not returns_to_depot:
+                # An open route may also end at the new stop
+                costs = np.append(costs, dist[route[-1], node])
+            at = int(np.argmin(costs)) + 1
+            route.insert(at, node)
+            changed.add(node)
+        junction_nodes = {self.positions[i][0] for i in junctions}
+        changed_positions = [k for k, node in enumerate(route) if node in changed or node in junction_nodes]
+
+        # Local search on a window around each change, with both window ends fixed unless
+        # the window reaches the end of an open route
+        spans = sorted((max(0, k - window), min(len(route) - 1, k + window)) for k in changed_positions)
+        merged: List[List[int]] = []
+        for lo, hi in spans:
+            if merged and lo <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], hi)
+            else:
+                merged.append([lo, hi])
+        with stats.phase('solve'):
+            for lo, hi in merged:
+                if hi - lo >= 3:
+                    fixed_end = returns_to_depot or hi < len(route) - 1
+                    tour = LocalSearchTour(dist, route[lo:hi + 1], closed=False, fixed_end=fixed_end)
+                    tour.local_search()
+                    tour.record_moves()
+                    route[lo:hi + 1] = tour.route()
+        solve_time = time.perf_counter() - started
+
+        total_distance = route_length(dist, route)
+        total_time = route_length(self.time_matrix, route) + ((len(route) - 1) * 3 + 10) / 60
+        hours = int(total_time)
+        minutes = int((total_time - hours) * 60)
+        return {
+            'locations': [self.locations[i] for i in route],
+            'total_distance': round(total_distance, 2),
+            'estimated_time': f"{hours}h {minutes}m",
+            'solver_used': 'incremental',
+            'solve_time_ms': round(solve_time * 1000, 2),
+            'tour_length_km': total_distance,
+            'num_stops': len(route) - 1,
+            'metrics': self._finish_stats(stats, 'incremental')
+        }
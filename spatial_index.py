@@ -0,0 +1,264 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import heapq
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371  # Earth's radius in kilometers
+POINTS_PER_CELL = 8  # Target occupancy used to size grid cells automatically
+CANDIDATE_LIST_SIZE = 10  # Nearest stops remembered per stop by the nearest-neighbour construction
+
+def _to_cartesian(lats, lons) -> np.ndarray:
+    """Project latitude/longitude (degrees) onto a sphere of the Earth's radius, in km."""
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lon = np.radians(np.asarray(lons, dtype=float))
+    cos_lat = np.cos(lat)
+    return EARTH_RADIUS_KM * np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+def _chord_to_km(chord: float) -> float:
+    """Great-circle distance for a straight-line chord through the Earth."""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / (2 * EARTH_RADIUS_KM)))
+
+def _km_to_chord(distance_km: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.sin(min(math.pi / 2, distance_km / (2 * EARTH_RADIUS_KM)))
+
+class SpatialIndex:
+    """
+    Uniform grid over points on the Earth for k-nearest and radius queries.
+
+    Points are stored as 3D coordinates on the sphere, so straight-line (chord) distance
+    ranks points exactly as the Haversine distance does and queries need no projection
+    error allowance. Each query only visits the grid cells around the query point.
+    Results are (position, distance_km) pairs, where position indexes the points in the
+    order they were given and ids[position] is the caller's id for it.
+    Points can be removed, which is how the nearest-neighbour construction marks stops
+    as visited.
+    """
+
+    def __init__(self, lats: Sequence[float], lons: Sequence[float], ids: Optional[Sequence] = None,
+                 cell_km: Optional[float] = None):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.ids = list(ids) if ids is not None else list(range(len(self.lats)))
+        self.points = _to_cartesian(self.lats, self.lons).reshape(-1, 3)
+        n = len(self.points)
+
+        if cell_km is None:
+            cell_km = 1.0
+            if n > 1:
+                # The points lie on a surface, so size cells from the two widest spans
+                spans = np.sort(np.ptp(self.points, axis=0))[1:]
+                area = float(spans[0] * spans[1]) or float(spans[1]) ** 2
+                if area > 0:
+                    cell_km = max(math.sqrt(area * POINTS_PER_CELL / n), 1e-3)
+        self.cell_km = cell_km
+
+        keys = np.floor(self.points / cell_km).astype(np.int64)
+        self._keys = [tuple(k) for k in keys.tolist()]
+        self._cells: Dict[Tuple[int, int, int], List[int]] = {}
+        for position, key in enumerate(self._keys):
+            self._cells.setdefault(key, []).append(position)
+        self._lo = keys.min(axis=0).tolist() if n else [0, 0, 0]
+        self._hi = keys.max(axis=0).tolist() if n else [0, 0, 0]
+        self._xyz = self.points.tolist()
+        self._alive = np.ones(n, dtype=bool)
+        self._count = n
+
+    @classmethod
+    def from_locations(cls, locations: List[Dict], cell_km: Optional[float] = None) -> 'SpatialIndex':
+        """Build from location dictionaries with 'latitude', 'longitude' and optionally 'id'."""
+        return cls([loc['latitude'] for loc in locations], [loc['longitude'] for loc in locations],
+                   [loc.get('id', i) for i, loc in enumerate(locations)], cell_km)
+
+    @classmethod
+    def from_rows(cls, rows, cell_km: Optional[float] = None) -> 'SpatialIndex':
+        """Build from objects with id, latitude and longitude attributes, e.g. DeliveryLocation rows."""
+        rows = list(rows)
+        return cls([row.latitude for row in rows], [row.longitude for row in rows],
+                   [row.id for row in rows], cell_km)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def copy(self) -> 'SpatialIndex':
+        clone = object.__new__(SpatialIndex)
+        clone.__dict__.update(self.__dict__)
+        clone._cells = {key: list(members) for key, members in self._cells.items()}
+        clone._alive = self._alive.copy()
+        return clone
+
+    def remove(self, position: int):
+        """Drop a point from all later queries."""
+        if self._alive[position]:
+            self._alive[position] = False
+            self._count -= 1
+            self._cells[self._keys[position]].remove(position)
+
+    def distance(self, a: int, b: int) -> float:
+        """Great-circle distance in km between two indexed points."""
+        pa, pb = self._xyz[a], self._xyz[b]
+        return _chord_to_km(math.dist(pa, pb))
+
+    def _brute_force(self, q: Sequence[float], k: Optional[int], chord: Optional[float],
+                     exclude: Optional[int]) -> List[Tuple[int, float]]:
+        alive = np.flatnonzero(self._alive)
+        if exclude is not None:
+            alive = alive[alive != exclude]
+        d = np.sqrt(((self.points[alive] - np.asarray(q)) ** 2).sum(axis=1))
+        if chord is not None:
+            keep = d <= chord
+            alive, d = alive[keep], d[keep]
+        order = np.argsort(d, kind='stable')
+        if k is not None:
+            order = order[:k]
+        return [(int(alive[i]), _chord_to_km(float(d[i]))) for i in order]
+
+    def _shell(self, center: Tuple[int, int, int], r: int):
+        """Yield the occupied cells at Chebyshev distance exactly r from center."""
+        cx, cy, cz = center
+        cells = self._cells
+        for dx in range(-r, r + 1):
+            edge_x = abs(dx) == r
+            for dy in range(-r, r + 1):
+                if edge_x or abs(dy) == r:
+                    dzs = range(-r, r + 1)
+                else:
+                    dzs = (-r, r) if r else (0,)
+                for dz in dzs:
+                    members = cells.get((cx + dx, cy + dy, cz + dz))
+                    if members:
+                        yield members
+
+    def _nearest(self, q: Sequence[float], k: int, exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        available = self._count - (exclude is not None and bool(self._alive[exclude]))
+        k = min(k, available)
+        if k <= 0:
+            return []
+        c = self.cell_km
+        center = tuple(math.floor(v / c) for v in q)
+        max_r = max(max(center[a] - self._lo[a], self._hi[a] - center[a]) for a in range(3))
+        heap: List[Tuple[float, int]] = []  # (-squared chord, position), worst on top
+        xyz = self._xyz
+        qx, qy, qz = q
+        r = 0
+        while r <= max(max_r, 0):
+            shell_cells = (2 * r + 1) ** 3 - (2 * r - 1) ** 3 if r else 1
+            if shell_cells > self._count + 27:
+                # Sparse neighbourhood: scanning the remaining points is cheaper than the shell
+                return self._brute_force(q, k, None, exclude)
+            for members in self._shell(center, r):
+                for position in members:
+                    if position == exclude:
+                        continue
+                    px, py, pz = xyz[position]
+                    d2 = (px - qx) ** 2 + (py - qy) ** 2 + (pz - qz) ** 2
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-d2, position))
+                    elif d2 < -heap[0][0]:
+                        heapq.heapreplace(heap, (-d2, position))
+            # Anything beyond this shell is at least r cells away along some axis
+            if len(heap) == k and -heap[0][0] <= (r * c) ** 2:
+                break
+            r += 1
+        return [(position, _chord_to_km(math.sqrt(-d2))) for d2, position in sorted(heap, reverse=True)]
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> List[Tuple[int, float]]:
+        """The k indexed points closest to (lat, lon), closest first."""
+        return self._nearest(_to_cartesian(lat, lon).tolist(), k)
+
+    def neighbors_of(self, position: int, k: int) -> List[Tuple[int, float]]:
+        """The k indexed points closest to an indexed point, excluding the point itself."""
+        return self._nearest(self._xyz[position], k, exclude=position)
+
+    def neighbor_lists(self, k: int) -> List[List[int]]:
+        """
+        Positions of the k nearest other points of every indexed point, closest first.
+        Each cell is handled in one vectorized step against the 27 cells around it; the
+        rare points whose k-th neighbour could lie further out get an individual query.
+        """
+        n = len(self._xyz)
+        result: List[List[int]] = [[] for _ in range(n)]
+        if n < 2 or k <= 0:
+            return result
+        limit = self.cell_km ** 2
+        for (cx, cy, cz), members in self._cells.items():
+            block = [position
+                     for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+                     for position in self._cells.get((cx + dx, cy + dy, cz + dz), ())]
+            block = np.array(block)
+            kk = min(k, len(block) - 1)
+            if kk <= 0:
+                for position in members:
+                    result[position] = [p for p, _ in self.neighbors_of(position, k)]
+                continue
+            d2 = ((self.points[members][:, None, :] - self.points[block][None, :, :]) ** 2).sum(axis=2)
+            d2[block[None, :] == np.array(members)[:, None]] = np.inf
+            nearest = np.argpartition(d2, kk - 1, axis=1)[:, :kk]
+            nearest_d2 = np.take_along_axis(d2, nearest, axis=1)
+            order = np.argsort(nearest_d2, axis=1, kind='stable')
+            nearest = np.take_along_axis(nearest, order, axis=1)
+            worst = nearest_d2.max(axis=1)
+            for row, position in enumerate(members):
+                if kk == min(k, self._count - 1) and worst[row] <= limit:
+                    result[position] = block[nearest[row]].tolist()
+                else:
+                    result[position] = [p for p, _ in self.neighbors_of(position, k)]
+        return result
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[int, float]]:
+        """All indexed points within radius_km of (lat, lon), closest first."""
+        q = _to_cartesian(lat, lon).tolist()
+        chord = _km_to_chord(radius_km)
+        c = self.cell_km
+        lo = [max(math.floor((v - chord) / c), self._lo[a]) for a, v in enumerate(q)]
+        hi = [min(math.floor((v + chord) / c), self._hi[a]) for a, v in enumerate(q)]
+        volume = max(0, hi[0] - lo[0] + 1) * max(0, hi[1] - lo[1] + 1) * max(0, hi[2] - lo[2] + 1)
+        if volume > self._count + 27:
+            return self._brute_force(q, None, chord, None)
+
+        found = []
+        chord2 = chord * chord
+        for x in range(lo[0], hi[0] + 1):
+            for y in range(lo[1], hi[1] + 1):
+                for z in range(lo[2], hi[2] + 1):
+                    for position in self._cells.get((x, y, z), ()):
+                        d2 = sum((a - b) ** 2 for a, b in zip(self._xyz[position], q))
+                        if d2 <= chord2:
+                            found.append((d2, position))
+        found.sort()
+        return [(position, _chord_to_km(math.sqrt(d2))) for d2, position in found]
+
+def nearest_neighbor_route(index: SpatialIndex, start: int = 0, end: Optional[int] = None,
+                           distance: Optional[Callable[[int, int], float]] = None,
+                           k: int = CANDIDATE_LIST_SIZE) -> List[int]:
+    """
+    Nearest-neighbour construction driven by candidate lists from the spatial index.
+    From each stop only its k geographically nearest stops are compared with distance
+    (default: great-circle km); when all of them are visited, the nearest unvisited stop
+    is found with a grid query. Runs in O(n log n) for typical stop distributions instead
+    of the O(n^2) full scan, and with the default distance it picks exactly the stops the
+    full scan would. The index itself is left untouched.
+    Returns positions in the index, starting at start and ending at end if given.
+    """
+    n = len(index.ids)
+    if n == 0:
+        return []
+    distance = distance or index.distance
+    remaining = index.copy()
+    candidates = index.neighbor_lists(k)
+
+    remaining.remove(start)
+    if end is not None:
+        remaining.remove(end)
+    route = [start]
+    while len(remaining):
+        current = route[-1]
+        alive = [c for c in candidates[current] if remaining._alive[c]]
+        if alive:
+            next_stop = min(alive, key=lambda c: distance(current, c))
+        else:
+            next_stop = remaining._nearest(index._xyz[current], 1)[0][0]
+        route.append(next_stop)
+        remaining.remove(next_stop)
+    if end is not None and end != start:
+        route.append(end)
+    return route
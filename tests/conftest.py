@@ -1 +1,50 @@
- 
\ No newline at end of file
+import random
+
+import pytest
+from werkzeug.security import generate_password_hash
+from benchmarks.mock_distance_matrix import FakeDistanceMatrixServer, HaversineMatrixClient
+
+def make_locations(n, seed=0, first_id=1, spread=0.1):
+    """n seeded random stops within spread degrees of a point in Bangalore, with ids from first_id."""
+    rng = random.Random(seed)
+    return [
+        {'id': first_id + i, 'latitude': 12.9 + rng.uniform(-spread, spread),
+         'longitude': 77.5 + rng.uniform(-spread, spread), 'address': f'Stop {first_id + i}'}
+        for i in range(n)
+    ]
+
+@pytest.fixture
+def haversine_client():
+    return HaversineMatrixClient()
+
+@pytest.fixture
+def matrix_server():
+    with FakeDistanceMatrixServer() as server:
+        yield server
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Flask test client on a fresh database in tmp_path."""
+    monkeypatch.setenv('GOOGLE_MAPS_API_KEY', 'test-key')
+    from app import app, db
+    monkeypatch.setitem(app.config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setitem(app.config, 'TESTING', True)
+    with app.app_context():
+        db.create_all()
+    yield app.test_client()
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+@pytest.fixture
+def admin_client(client):
+    """Test client logged in as a confirmed delivery boy (id 1), which the admin pages require."""
+    from app import app, db, DeliveryBoy
+    with app.app_context():
+        db.session.add(DeliveryBoy(name='Admin', email='admin@example.com', password=generate_password_hash('admin'),
+                                   verification_code='ADMIN', status='Confirmed'))
+        db.session.commit()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    return client
@@ -0,0 +1,85 @@
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+from batch_optimizer import problem_matrices, solve_batch
+from tests.conftest import HaversineMatrixClient
+
+def make_problem(problem_id, n, seed, shared=None):
+    rng = random.Random(seed)
+    stops = [
+        {'id': f'{problem_id}-{i}', 'latitude': 12.9 + rng.uniform(-0.05, 0.05),
+         'longitude': 77.5 + rng.uniform(-0.05, 0.05)}
+        for i in range(n)
+    ]
+    return {
+        'id': problem_id,
+        'depot': {'id': 'depot', 'latitude': 12.9, 'longitude': 77.5} if shared is None else shared,
+        'stops': stops,
+        'algorithm': 'auto'
+    }
+
+@pytest.fixture(scope='module')
+def executor():
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        yield pool
+
+def test_problems_sharing_a_depot_get_their_own_matrices(executor):
+    """Test a shared depot does not merge problems into one matrix over all their points"""
+    depot = {'id': 'depot', 'latitude': 13.0, 'longitude': 77.6}
+    problems = [make_problem(f'zone-{i}', 5, i, depot) for i in range(4)]
+    client = HaversineMatrixClient()
+    results = list(solve_batch(problems, client, executor=executor))
+    assert sorted(result['id'] for result in results) == [f'zone-{i}' for i in range(4)]
+    assert client.elements == 4 * 6 * 6
+
+def test_problem_matrices_repeat_the_depot_and_fill_missing_legs():
+    """Test the returning depot copies row and column 0, and only unanswered legs are estimated"""
+    problem = make_problem('zone', 4, seed=1)
+    problem['stops'].append(dict(problem['stops'][0], id='again'))
+    expected, _ = problem_matrices(problem)
+    distances, times = problem_matrices(problem, HaversineMatrixClient(missing=[(1, 2)]))
+
+    assert distances.dtype == np.float32 and distances.shape == (7, 7)
+    assert np.allclose(distances, expected, rtol=1e-5) and np.allclose(times, distances / 20, rtol=1e-5)
+    assert np.array_equal(distances[-1], distances[0]) and np.array_equal(distances[:, -1], distances[:, 0])
+    assert np.array_equal(distances[5], distances[1])
+
+    problem['stops'].pop()
+    distances, _ = problem_matrices(problem)
+    assert distances.shape == (6, 6) and np.array_equal(distances[-1], distances[0])
+
+def test_batch_solves_every_problem(executor):
+    """Test each problem comes back once with a route starting and ending at its depot"""
+    problems = [make_problem(f'zone-{i}', 6 + i, seed=i) for i in range(6)]
+    problems[3]['return_to_depot'] = False
+    results = {result['id']: result for result in solve_batch(problems, executor=executor)}
+
+    assert set(results) == {f'zone-{i}' for i in range(6)}
+    for i, problem in enumerate(problems):
+        route = results[problem['id']]['route']
+        assert route[0] == 'depot'
+        assert sorted(route[1:-1] if i != 3 else route[1:]) == sorted(stop['id'] for stop in problem['stops'])
+        assert (route[-1] == 'depot') == (i != 3)
+        assert results[problem['id']]['total_distance'] > 0
+
+def test_invalid_problems_report_errors(executor):
+    """Test a malformed problem yields an error without stopping the others"""
+    problems = [make_problem('good', 5, 1), {'id': 'bad', 'stops': []},
+                make_problem('far', 3, 2)]
+    problems[2]['stops'][0]['latitude'] = 123.0
+    results = {result['id']: result for result in solve_batch(problems, executor=executor)}
+    assert 'error' in results['bad'] and 'error' in results['far']
+    assert 'route' in results['good']
+
+def test_batch_problems_do_not_open_nested_pools(executor):
+    """Test long-budget problems search in their worker instead of starting a pool per worker"""
+    problems = [make_problem('auto', 30, 1), make_problem('explicit', 30, 2)]
+    problems[0]['time_budget'] = 2.0
+    problems[1].update(algorithm='multi_start', time_budget=0.3)
+    results = {result['id']: result for result in solve_batch(problems, executor=executor)}
+    assert results['auto']['solver_used'] == 'anytime'
+    for problem in problems:
+        route = results[problem['id']]['route']
+        assert sorted(route[1:-1]) == sorted(stop['id'] for stop in problem['stops'])
@@ -0,0 +1,27 @@
+from benchmarks.bench_route_optimizer import compare, run_suite
+from benchmarks.synthetic_cities import LAYOUTS
+
+def test_synthetic_cities_are_reproducible():
+    """Test each layout gives the same instance for the same seed and a new one for another seed"""
+    for layout, generate in LAYOUTS.items():
+        city = generate(30, seed=1)
+        assert len(city) == 31 and city[0]['id'] == 0
+        assert [loc['id'] for loc in city] == list(range(31))
+        assert city == generate(30, seed=1)
+        assert city != generate(30, seed=2)
+
+def test_regression_mode_flags_slower_and_longer_solvers():
+    """Test comparing against a baseline reports slowdowns and longer routes but not noise"""
+    report = run_suite(['uniform'], [10], seed=0, repeat=1)
+    solvers = {r['solver'] for r in report['results']}
+    assert {'build_matrix', 'nearest_neighbor', 'two_opt', 'anytime', 'held_karp'} <= solvers
+    assert min(r['gap'] for r in report['results'] if 'gap' in r) == 0
+    assert compare(report, report) == []
+
+    baseline = {'results': [dict(r) for r in report['results']]}
+    for r in baseline['results']:
+        if r['solver'] == 'two_opt':
+            r['seconds'] = r['seconds'] / 10 - 1
+            r['length'] = r['length'] * 0.9
+    regressions = compare(report, baseline)
+    assert len(regressions) == 2 and all('two_opt' in message for message in regressions)
@@ -0,0 +1,94 @@
+import pytest
+
+@pytest.fixture
+def bulk_client(admin_client):
+    """Admin client with two delivery locations (ids 1 and 2)."""
+    from app import app, db, DeliveryLocation
+    with app.app_context():
+        db.session.add_all([DeliveryLocation(address=f'{i} Test St', latitude=12.9 + i / 100, longitude=77.5)
+                            for i in (1, 2)])
+        db.session.commit()
+    return admin_client
+
+def make_rows(n, **fields):
+    return [{'delivery_boy_id': 1, 'location_id': 1 + i % 2, 'customer_name': f'Customer {i}', **fields}
+            for i in range(n)]
+
+def stored_order_numbers():
+    from app import app, Delivery
+    with app.app_context():
+        return sorted(delivery.order_number for delivery in Delivery.query.all())
+
+def test_bulk_rows_are_inserted_in_batches(bulk_client, monkeypatch):
+    """Test rows spanning several insert batches are all created with consecutive generated numbers"""
+    import app as app_module
+    monkeypatch.setattr(app_module, 'BULK_INSERT_BATCH', 3)
+    rows = make_rows(7)
+    rows[2]['order_number'] = 'SHOP-1'
+    response = bulk_client.post('/admin/deliveries/bulk', json={'deliveries': rows})
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['created'] == 7
+    assert data['order_numbers'] == ['ORD-00000001', 'ORD-00000002', 'SHOP-1', 'ORD-00000003',
+                                     'ORD-00000004', 'ORD-00000005', 'ORD-00000006']
+    assert stored_order_numbers() == sorted(data['order_numbers'])
+
+def test_generated_order_numbers_are_reserved(bulk_client):
+    """Test later requests continue the sequence and supplied numbers cannot claim it or repeat"""
+    first = bulk_client.post('/admin/deliveries/bulk', json=make_rows(2)).get_json()['order_numbers']
+    second = bulk_client.post('/admin/deliveries/bulk', json=make_rows(2)).get_json()['order_numbers']
+    assert first + second == ['ORD-00000001', 'ORD-00000002', 'ORD-00000003', 'ORD-00000004']
+
+    rows = make_rows(3)
+    rows[0]['order_number'] = 'ORD-00000005'
+    rows[1]['order_number'] = ' ORD-123456789 '
+    rows[2]['order_number'] = 'ORD-5'
+    response = bulk_client.post('/admin/deliveries/bulk', json=rows)
+    assert response.status_code == 400
+    assert [error['row'] for error in response.get_json()['errors']] == [0, 1]
+
+    rows = make_rows(3)
+    rows[0]['order_number'] = rows[2]['order_number'] = 'SHOP-7'
+    response = bulk_client.post('/admin/deliveries/bulk', json=rows)
+    assert response.get_json()['errors'] == [{'row': 2, 'error': 'Order number SHOP-7 is already used'}]
+
+    assert bulk_client.post('/admin/deliveries/bulk', json=make_rows(1, order_number='SHOP-7')).status_code == 200
+    response = bulk_client.post('/admin/deliveries/bulk', json=make_rows(1, order_number='SHOP-7'))
+    assert response.get_json()['errors'] == [{'row': 0, 'error': 'Order number SHOP-7 is already used'}]
+    assert bulk_client.post('/admin/deliveries/bulk', json=make_rows(1)).get_json()['order_numbers'] == ['ORD-00000005']
+
+def test_bulk_errors_are_reported_per_row(bulk_client):
+    """Test every invalid row is reported and none of the request is created"""
+    rows = make_rows(9)
+    rows[1]['delivery_boy_id'] = True
+    rows[2]['location_id'] = 1.5
+    rows[3]['location_id'] = 1.0
+    rows[4]['customer_name'] = '   '
+    rows[5] = 'not an object'
+    rows[6]['customer_phone'] = '1' * 21
+    rows[7]['location_id'] = 99
+    del rows[8]['delivery_boy_id']
+    response = bulk_client.post('/admin/deliveries/bulk', json=rows)
+
+    assert response.status_code == 400
+    errors = response.get_json()['errors']
+    assert [error['row'] for error in errors] == [1, 2, 3, 4, 5, 6, 8]
+    assert errors[0]['error'] == 'delivery_boy_id must be an integer'
+    assert errors[-1]['error'] == 'delivery_boy_id is required'
+    assert stored_order_numbers() == []
+
+    rows = make_rows(2)
+    rows[0]['location_id'] = '2'
+    rows[1]['location_id'] = 99
+    response = bulk_client.post('/admin/deliveries/bulk', json=rows)
+    assert response.get_json()['errors'] == [{'row': 1, 'error': 'Unknown location 99'}]
+
+def test_bulk_request_size_is_capped(bulk_client, monkeypatch):
+    """Test a request over MAX_BULK_DELIVERIES rows is refused before any row is read"""
+    import app as app_module
+    monkeypatch.setattr(app_module, 'MAX_BULK_DELIVERIES', 5)
+    response = bulk_client.post('/admin/deliveries/bulk', json=make_rows(6))
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'At most 5 deliveries per request'
+    assert bulk_client.post('/admin/deliveries/bulk', json=make_rows(5)).get_json()['created'] == 5
@@ -0,0 +1,42 @@
+import re
+from datetime import datetime, timedelta
+
+STATUSES = ['Pending', 'pending', 'PENDING', ' Pending ', 'In Progress', 'in_progress', 'in progress ',
+            'IN PROGRESS', 'Completed', 'completed', ' COMPLETED', 'Cancelled']
+
+def add_deliveries(statuses, delivery_boy_id=1):
+    from app import app, db, Delivery, DeliveryLocation
+    with app.app_context():
+        if DeliveryLocation.query.get(1) is None:
+            db.session.add(DeliveryLocation(id=1, address='1 Test St', latitude=12.9, longitude=77.5))
+        start = datetime(2024, 1, 1)
+        db.session.add_all([
+            Delivery(delivery_boy_id=delivery_boy_id, location_id=1, status=status, order_number=f'T-{delivery_boy_id}-{i}',
+                     customer_name='Customer', created_at=start + timedelta(minutes=i))
+            for i, status in enumerate(statuses)
+        ])
+        db.session.commit()
+
+def dashboard_numbers(client):
+    """Total, active, pending and earnings as rendered on the dashboard cards."""
+    page = client.get('/dashboard').get_data(as_text=True)
+    return [int(value.replace(',', '')) for value in re.findall(r'<h2 class="mb-0">\$?([\d,]+)</h2>', page)]
+
+def per_status_counts(statuses):
+    """The old dashboard's one count per status, over the statuses spelled any way they are stored."""
+    spelled = [status.strip().lower().replace(' ', '_') for status in statuses]
+    return [len(statuses), spelled.count('in_progress'), spelled.count('pending'), spelled.count('completed') * 10]
+
+def test_dashboard_counts_match_per_status_counts(admin_client):
+    """Test the grouped counts equal the old per-status counts for the canonical spellings"""
+    statuses = ['Pending'] * 3 + ['In Progress'] * 2 + ['Completed'] * 4
+    add_deliveries(statuses)
+    assert dashboard_numbers(admin_client) == [9, 2, 3, 40]
+
+def test_dashboard_counts_every_spelling_of_a_status(admin_client):
+    """Test mixed-case and padded statuses are grouped with their status, and other boys' rows are ignored"""
+    add_deliveries(STATUSES)
+    add_deliveries(['Pending', 'Completed'], delivery_boy_id=2)
+    numbers = dashboard_numbers(admin_client)
+    assert numbers == per_status_counts(STATUSES)
+    assert numbers == [12, 4, 4, 30]
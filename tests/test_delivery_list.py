@@ -0,0 +1,87 @@
+import html
+import re
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+STATUSES = ['pending', 'Pending', 'completed', 'In Progress']
+
+@pytest.fixture
+def deliveries(admin_client, monkeypatch):
+    """
+    Admin client over 14 deliveries for two delivery boys, created three to a timestamp so
+    page boundaries fall inside ties. Pages hold 4 deliveries.
+    """
+    import app as app_module
+    from app import app, db, Delivery, DeliveryBoy, DeliveryLocation
+    monkeypatch.setattr(app_module, 'DELIVERIES_PER_PAGE', 4)
+    start = datetime(2024, 1, 1, 9)
+    with app.app_context():
+        db.session.add(DeliveryBoy(name='Second', email='second@example.com', password='x',
+                                   verification_code='SECOND', status='Confirmed'))
+        db.session.add(DeliveryLocation(address='1 Test St', latitude=12.9, longitude=77.5))
+        db.session.add_all([
+            Delivery(delivery_boy_id=1 + i % 2, location_id=1, status=STATUSES[i % 4], order_number=f'D-{i:02d}',
+                     customer_name='Customer', created_at=start + timedelta(minutes=i // 3))
+            for i in range(14)
+        ])
+        db.session.commit()
+    return admin_client
+
+def expected_order(status=None, delivery_boy_id=None):
+    """Order numbers newest first by (created_at, id), the order the list pages through."""
+    rows = [(i // 3, i + 1, f'D-{i:02d}') for i in range(14)
+            if (status is None or STATUSES[i % 4].lower().replace(' ', '_') == status)
+            and (delivery_boy_id is None or 1 + i % 2 == delivery_boy_id)]
+    return [number for _, _, number in sorted(rows, reverse=True)]
+
+def links(page):
+    return {label: html.unescape(href) for href, label in re.findall(r'href="([^"]*)">(Newest|Older)</a>', page)}
+
+def walk(client, url):
+    """Follow the Older links from url; returns the order numbers and the links of every page."""
+    numbers, pages = [], []
+    while url:
+        page = client.get(url).get_data(as_text=True)
+        numbers += re.findall(r'<td>(D-\d+)</td>', page)
+        pages.append(links(page))
+        url = pages[-1].get('Older')
+    return numbers, pages
+
+def test_pages_continue_across_tied_timestamps(deliveries):
+    """Test following the cursor visits every delivery once, in order, when pages split a tie"""
+    numbers, pages = walk(deliveries, '/admin/assign-delivery')
+    assert numbers == expected_order()
+    assert len(pages) == 4
+
+def test_status_and_delivery_boy_filters_combine(deliveries):
+    """Test paging with both filters merges the status spellings and keeps only that boy's deliveries"""
+    numbers, pages = walk(deliveries, '/admin/assign-delivery?status=pending&delivery_boy_id=1')
+    assert numbers == expected_order('pending', 1)
+    assert numbers == ['D-12', 'D-08', 'D-04', 'D-00']
+    assert len(pages) == 1
+
+    numbers, pages = walk(deliveries, '/admin/assign-delivery?status=completed&delivery_boy_id=1')
+    assert numbers == expected_order('completed', 1) == ['D-10', 'D-06', 'D-02']
+    numbers, _ = walk(deliveries, '/admin/assign-delivery?status=pending')
+    assert numbers == expected_order('pending')
+
+def test_newest_and_older_links(deliveries):
+    """Test only later pages link back to the newest, only full pages link on, and both keep the filters"""
+    _, pages = walk(deliveries, '/admin/assign-delivery?delivery_boy_id=2')
+    assert len(pages) == 2
+    assert set(pages[0]) == {'Older'} and set(pages[1]) == {'Newest'}
+
+    older = parse_qs(urlparse(pages[0]['Older']).query)
+    assert older['delivery_boy_id'] == ['2'] and older['before'] == ['2024-01-01T09:02:00_8']
+    assert parse_qs(urlparse(pages[1]['Newest']).query) == {'delivery_boy_id': ['2']}
+
+    _, pages = walk(deliveries, '/admin/assign-delivery?status=pending')
+    assert set(pages[0]) == {'Older'} and set(pages[-1]) == {'Newest'}
+    assert all(parse_qs(urlparse(url).query)['status'] == ['pending'] for page in pages for url in page.values())
+
+def test_unreadable_cursor_shows_the_first_page(deliveries):
+    """Test a malformed before= value is ignored rather than failing the page"""
+    page = deliveries.get('/admin/assign-delivery?before=yesterday').get_data(as_text=True)
+    assert re.findall(r'<td>(D-\d+)</td>', page) == expected_order()[:4]
@@ -0,0 +1,99 @@
+import time
+
+import numpy as np
+import pytest
+from route_optimizer import RouteOptimizer
+from tests.conftest import HaversineMatrixClient, make_locations
+
+def make_route(n, return_to_depot=True):
+    locations = make_locations(n)
+    if return_to_depot:
+        locations.append(dict(locations[0]))
+    client = HaversineMatrixClient()
+    optimizer = RouteOptimizer(locations, matrix_client=client)
+    result = optimizer.optimize_route(1, 'two_opt')
+    return optimizer, client, [loc['id'] for loc in result['locations']]
+
+def test_added_stops_fetch_only_new_rows_and_columns():
+    """Test adding stops requests only their rows and columns and keeps the matrix consistent"""
+    optimizer, client, route = make_route(40)
+    client.elements = 0
+    added = make_locations(2, seed=5, first_id=1000)
+    result = optimizer.update_route(route, added)
+
+    n = 41  # 40 stops plus the depot repeated at the end
+    assert client.elements == 2 * (n + 2) + n * 2
+    full = HaversineMatrixClient().fetch_matrix([(l['latitude'], l['longitude']) for l in optimizer.locations])[0]
+    assert np.allclose(optimizer.dist_matrix, full)
+
+    ids = [loc['id'] for loc in result['locations']]
+    assert ids[0] == 1 and ids[-1] == 1
+    assert sorted(ids[1:-1]) == list(range(2, 41)) + [1000, 1001]
+    assert optimizer.get_distance(1000, 2) > 0
+
+def test_update_only_touches_stops_near_the_change():
+    """Test a late order leaves the rest of the sequence in its original order"""
+    optimizer, _, route = make_route(200)
+    result = optimizer.update_route(route, make_locations(1, seed=9, first_id=500), window=5)
+    ids = [loc['id'] for loc in result['locations']]
+    at = ids.index(500)
+    assert ids[:max(0, at - 6)] == route[:max(0, at - 6)]
+    assert ids[at + 7:] == route[at + 6:]
+
+def test_removed_stops_are_dropped():
+    """Test removing stops shortens the route and drops their matrix entries"""
+    optimizer, _, route = make_route(30)
+    result = optimizer.update_route(route, removed_ids=[route[3], route[10]])
+    ids = [loc['id'] for loc in result['locations']]
+    assert route[3] not in ids and route[10] not in ids
+    assert len(ids) == len(route) - 2
+    assert optimizer.dist_matrix.shape == (len(route) - 2, len(route) - 2)
+    assert result['total_distance'] > 0
+
+def test_late_order_is_absorbed_quickly():
+    """Test one added stop on a 300-stop route is handled in tens of milliseconds"""
+    optimizer, _, route = make_route(300)
+    start = time.perf_counter()
+    optimizer.update_route(route, make_locations(1, seed=12, first_id=900))
+    assert time.perf_counter() - start < 0.1
+
+def test_invalid_updates_are_rejected_before_any_change():
+    """Test unknown route stops and stops added twice raise without touching the optimizer"""
+    optimizer, client, route = make_route(20)
+    elements = client.elements
+    with pytest.raises(ValueError, match='Unknown stops'):
+        optimizer.update_route(route[:5] + [12345] + route[5:], make_locations(1, seed=3, first_id=700))
+    with pytest.raises(ValueError, match='already on the route'):
+        optimizer.update_route(route, [dict(optimizer.locations[3])])
+    assert client.elements == elements and len(optimizer.locations) == 21
+
+    # A stop dropped from the route earlier is re-inserted from the matrix it is still in
+    dropped = route[4]
+    result = optimizer.update_route(route[:4] + route[5:], [dict(optimizer.locations[optimizer.positions[dropped][0]])])
+    assert dropped in [loc['id'] for loc in result['locations']]
+    assert client.elements == elements
+
+def test_open_route_tail_can_be_removed_or_extended():
+    """Test the last stop of an open route is removable and a new stop can become the last one"""
+    optimizer, _, route = make_route(30, return_to_depot=False)
+    tail = route[-1]
+    result = optimizer.update_route(route, removed_ids=[tail])
+    ids = [loc['id'] for loc in result['locations']]
+    assert tail not in ids and sorted(ids) == sorted(route[:-1])
+
+    # A stop far beyond the current end is cheapest as the new end
+    last = optimizer.locations[optimizer.positions[ids[-1]][0]]
+    beyond = {'id': 800, 'latitude': last['latitude'] + 2 * (last['latitude'] - 12.9),
+              'longitude': last['longitude'] + 2 * (last['longitude'] - 77.5), 'address': 'Stop 800'}
+    result = optimizer.update_route(ids, [beyond])
+    extended = [loc['id'] for loc in result['locations']]
+    assert extended[0] == 1 and extended[-1] == 800
+    assert sorted(extended) == sorted(ids + [800])
+
+def test_removing_the_depot_is_rejected():
+    """Test the depot cannot be removed from open or closed routes"""
+    for return_to_depot in (True, False):
+        optimizer, _, route = make_route(10, return_to_depot)
+        with pytest.raises(ValueError, match='depot'):
+            optimizer.update_route(route, removed_ids=[route[0], route[4]])
+        assert len(optimizer.locations) == len(route)
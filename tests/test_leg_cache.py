@@ -0,0 +1,100 @@
+import time
+
+import numpy as np
+import pytest
+import leg_cache
+from leg_cache import LegCache
+
+ORIGIN = (12.971599, 77.594566)
+DESTINATION = (12.935192, 77.624480)
+
+@pytest.fixture
+def cache(tmp_path):
+    return LegCache(path=str(tmp_path / 'legs.db'))
+
+def test_cache_round_trip_counts_hits_and_misses(cache):
+    """Test stored legs are returned and counted as hits"""
+    assert cache.get(ORIGIN, DESTINATION) is None
+    cache.put(ORIGIN, DESTINATION, 5.2, 0.3)
+    assert cache.get(ORIGIN, DESTINATION) == pytest.approx((5.2, 0.3))
+    assert cache.get(DESTINATION, ORIGIN) is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 2
+
+def test_cache_quantizes_coordinates_and_separates_modes(cache):
+    """Test nearly identical coordinates share an entry but travel modes do not"""
+    cache.put(ORIGIN, DESTINATION, 5.2, 0.3, mode='driving')
+    nudged = (ORIGIN[0] + 1e-7, ORIGIN[1] - 1e-7)
+    assert cache.get(nudged, DESTINATION, mode='driving') == pytest.approx((5.2, 0.3))
+    assert cache.get(ORIGIN, DESTINATION, mode='bicycling') is None
+
+def test_expired_legs_are_misses(tmp_path):
+    """Test legs older than the TTL are not returned"""
+    cache = LegCache(path=str(tmp_path / 'legs.db'), ttl_seconds=0.05)
+    cache.put(ORIGIN, DESTINATION, 5.2, 0.3)
+    time.sleep(0.1)
+    assert cache.get(ORIGIN, DESTINATION) is None
+
+def test_least_recently_used_legs_are_evicted(tmp_path):
+    """Test the cache stays within its bound by dropping the oldest used legs"""
+    cache = LegCache(path=str(tmp_path / 'legs.db'), max_entries=2)
+    cache.put(ORIGIN, (13.0, 77.0), 1.0, 0.1)
+    time.sleep(0.01)
+    cache.put(ORIGIN, (13.1, 77.1), 2.0, 0.2)
+    time.sleep(0.01)
+    assert cache.get(ORIGIN, (13.0, 77.0)) is not None
+    time.sleep(0.01)
+    cache.put(ORIGIN, (13.2, 77.2), 3.0, 0.3)
+
+    assert len(cache) == 2
+    assert cache.get(ORIGIN, (13.1, 77.1)) is None
+    assert cache.get(ORIGIN, (13.0, 77.0)) is not None
+    assert cache.stats()['evictions'] == 1
+
+def test_cache_is_shared_between_connections(tmp_path):
+    """Test a second process-style connection sees legs written by the first"""
+    path = str(tmp_path / 'legs.db')
+    LegCache(path=path).put(ORIGIN, DESTINATION, 5.2, 0.3)
+    assert LegCache(path=path).get(ORIGIN, DESTINATION) == pytest.approx((5.2, 0.3))
+
+def test_get_many_returns_hits_by_position(cache):
+    """Test a batched lookup reports each cached pair at its position in the request"""
+    points = [(12.9 + i * 0.001, 77.5 + i * 0.001) for i in range(30)]
+    cache.put_many([(a, b, 1.0 + i, 0.1) for i, (a, b) in enumerate(zip(points, points[1:])) if i % 3 == 0])
+    pairs = list(zip(points, points[1:])) + [(points[1], points[0])]
+    found = cache.get_many(pairs)
+    assert sorted(found) == [i for i in range(len(pairs) - 1) if i % 3 == 0]
+    assert found[3] == pytest.approx((4.0, 0.1))
+    assert cache.stats()['hits'] == len(found)
+    assert cache.stats()['misses'] == len(pairs) - len(found)
+    assert cache.get_many([]) == {}
+
+def test_expired_legs_are_purged_periodically(tmp_path):
+    """Test expired legs stay in the table until the eviction interval has passed"""
+    cache = LegCache(path=str(tmp_path / 'legs.db'), ttl_seconds=0.05, eviction_interval=3600)
+    cache.put(ORIGIN, DESTINATION, 5.2, 0.3)
+    time.sleep(0.1)
+    cache.put(DESTINATION, ORIGIN, 5.4, 0.3)
+    assert len(cache) == 2
+    cache.eviction_interval = 0
+    cache.put(ORIGIN, (13.0, 77.0), 1.0, 0.1)
+    assert len(cache) == 2
+    assert cache.get(DESTINATION, ORIGIN) is not None
+
+def test_fill_matrix_fills_only_missing_entries(cache, monkeypatch):
+    """Test a matrix is filled in batches from stored blocks, skipping unanswered and self legs"""
+    monkeypatch.setattr(leg_cache, 'LOOKUP_BATCH_LEGS', 8)
+    points = [(12.9 + i * 0.001, 77.5 + i * 0.002) for i in range(6)]
+    stored = np.arange(36, dtype=float).reshape(6, 6)
+    stored[2, 3] = np.nan
+    cache.put_blocks([(points[:3], points, stored[:3], stored[:3] / 10), (points[3:], points, stored[3:], stored[3:] / 10)])
+    assert len(cache) == 6 * 5 - 1
+
+    distances = np.full((6, 6), np.nan)
+    distances[0, 1] = -1.0
+    times = distances.copy()
+    assert cache.fill_matrix(points, points, distances, times) == 6 * 5 - 2
+    assert distances[0, 1] == -1.0 and times[0, 1] == -1.0
+    assert np.isnan(distances[2, 3]) and np.isnan(np.diag(distances)).all()
+    assert distances[4, 1] == 25.0 and times[4, 1] == pytest.approx(2.5)
+    assert cache.stats()['hits'] == 28 and cache.stats()['misses'] == 35 - 28
@@ -0,0 +1,68 @@
+import random
+import time
+
+import numpy as np
+import pytest
+from local_search import NEIGHBOR_BLOCK_ROWS, anytime_optimize, fast_two_opt, lin_kernighan, neighbor_lists, or_opt
+from route_optimizer import build_distance_matrix, nearest_neighbor, optimize_delivery_route, route_length
+
+ROUTE_SHAPES = [
+    {'closed': True, 'fixed_end': True},
+    {'closed': False, 'fixed_end': True},
+    {'closed': False, 'fixed_end': False},
+]
+
+def make_instance(n, seed=3):
+    rng = random.Random(seed)
+    locations = [{'id': i, 'latitude': rng.random(), 'longitude': rng.random()} for i in range(n)]
+    dist = build_distance_matrix(locations)
+    return locations, dist, nearest_neighbor(locations, dist)
+
+@pytest.mark.parametrize('shape', ROUTE_SHAPES)
+@pytest.mark.parametrize('improve', [fast_two_opt, or_opt, lin_kernighan])
+def test_moves_keep_route_valid_and_never_worse(improve, shape):
+    """Test each move type returns a shorter-or-equal permutation with the same endpoints"""
+    for n in (4, 9, 60):
+        _, dist, initial = make_instance(n)
+        route = improve(dist, initial, **shape)
+        assert sorted(route) == list(range(n))
+        assert route[0] == initial[0]
+        if not shape['closed'] and shape['fixed_end']:
+            assert route[-1] == initial[-1]
+        closed = shape['closed']
+        assert route_length(dist, route, closed) <= route_length(dist, initial, closed) + 1e-9
+
+def test_anytime_search_respects_deadline():
+    """Test the anytime driver returns within its time budget"""
+    _, dist, initial = make_instance(400)
+    start = time.perf_counter()
+    route = anytime_optimize(dist, initial, closed=True, time_budget=0.3, seed=1)
+    assert time.perf_counter() - start < 0.45
+    assert sorted(route) == list(range(400))
+
+def test_anytime_search_improves_with_more_iterations():
+    """Test spending more iterations never gives a longer route"""
+    _, dist, initial = make_instance(150)
+    descent = anytime_optimize(dist, initial, closed=True)
+    short = anytime_optimize(dist, initial, closed=True, max_iterations=20, seed=7)
+    long = anytime_optimize(dist, initial, closed=True, max_iterations=300, seed=7)
+    assert route_length(dist, short, True) <= route_length(dist, descent, True) + 1e-9
+    assert route_length(dist, long, True) <= route_length(dist, short, True) + 1e-9
+    assert route_length(dist, descent, True) < route_length(dist, fast_two_opt(dist, initial, closed=True), True)
+
+def test_optimize_delivery_route_with_time_budget():
+    """Test the budgeted route keeps the first stop and visits everything"""
+    locations, _, _ = make_instance(50)
+    route = optimize_delivery_route(locations, time_budget=0.1)
+    assert route[0] is locations[0]
+    assert sorted(loc['id'] for loc in route) == list(range(50))
+
+def test_neighbor_lists_and_moves_work_in_float32():
+    """Test neighbor lists ranked in row blocks and 2-opt agree between float32 and float64 matrices"""
+    _, dist, initial = make_instance(NEIGHBOR_BLOCK_ROWS + 50)
+    single = dist.astype(np.float32)
+    expected = [[j for j in np.argsort(row, kind='stable') if j != i][:5] for i, row in enumerate(single)]
+    assert neighbor_lists(single, 5) == expected
+    route = fast_two_opt(single, initial, closed=False, fixed_end=True)
+    assert sorted(route) == sorted(initial)
+    assert route_length(dist, route) <= route_length(dist, initial)
@@ -0,0 +1,44 @@
+import io
+import json
+
+import pytest
+from location_import import chunked, import_format, location_key, parse_locations, validate_location
+
+def test_csv_rows_are_validated_one_by_one():
+    """Test valid CSV rows are parsed and bad rows come back as per-line errors"""
+    text = ("\ufeffAddress, Lat ,Lng\n"
+            "MG Road 1,12.97,77.59\n"
+            "Out of range,91,77.59\n"
+            ",12.9,77.5\n"
+            "Not a number,abc,77.5\n"
+            '"Brigade Rd, 4",12.971,77.607\n')
+    rows = list(parse_locations(io.BytesIO(text.encode()), 'csv'))
+    assert [(line, error is None) for line, _, error in rows] == [(2, True), (3, False), (4, False), (5, False), (6, True)]
+    assert rows[0][1] == {'address': 'MG Road 1', 'latitude': 12.97, 'longitude': 77.59}
+    assert rows[4][1]['address'] == 'Brigade Rd, 4'
+    assert 'outside -90..90' in rows[1][2]
+    assert rows[2][2] == 'Missing address'
+
+def test_ndjson_rows_survive_malformed_lines():
+    """Test a malformed NDJSON line is reported without stopping the rest of the stream"""
+    lines = [json.dumps({'address': 'A', 'latitude': 1.5, 'longitude': 2.5}), '{oops', '',
+             json.dumps({'Address': 'B', 'lat': '3', 'lon': '4'}), json.dumps({'address': 'C', 'latitude': 1e999, 'longitude': 0})]
+    rows = list(parse_locations(io.BytesIO('\n'.join(lines).encode()), 'ndjson'))
+    assert [line for line, _, _ in rows] == [1, 2, 4, 5]
+    assert rows[0][1] == {'address': 'A', 'latitude': 1.5, 'longitude': 2.5}
+    assert rows[1][1] is None and rows[1][2]
+    assert rows[2][1] == {'address': 'B', 'latitude': 3.0, 'longitude': 4.0}
+    assert rows[3][1] is None
+
+def test_helpers_for_format_dedupe_and_chunking():
+    """Test format detection, duplicate keys and chunking of the row stream"""
+    assert import_format('CSV') == 'csv'
+    assert import_format('xml') is None
+    assert import_format(None, 'drops.jsonl') == 'ndjson'
+    assert import_format(None, None, 'text/csv') == 'csv'
+    assert import_format(None, 'drops.txt', 'text/plain') is None
+    assert location_key(' Stop 1 ', 12.9000000001, 77.5) == location_key('Stop 1', 12.9, 77.5)
+    assert location_key('Stop 1', 12.9001, 77.5) != location_key('Stop 1', 12.9, 77.5)
+    assert [len(chunk) for chunk in chunked(range(1201), 500)] == [500, 500, 201]
+    with pytest.raises(ValueError):
+        validate_location({'address': 'x' * 256, 'latitude': 0, 'longitude': 0})
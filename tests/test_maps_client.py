@@ -0,0 +1,111 @@
+import time
+
+import numpy as np
+import pytest
+from leg_cache import LegCache
+from maps_client import DistanceMatrixClient, TokenBucket
+from route_optimizer import RouteOptimizer, calculate_haversine_distance
+from tests.conftest import make_locations
+
+def make_client(server, **kwargs):
+    return DistanceMatrixClient(api_key='test-key', base_url=server.url, **kwargs)
+
+def test_chunks_respect_element_limits():
+    """Test every block stays within the per-request limits and covers the matrix once"""
+    client = DistanceMatrixClient(api_key='test-key')
+    covered = set()
+    for origins, destinations in client.chunks(40, 40):
+        assert len(origins) <= 25 and len(destinations) <= 25
+        assert len(origins) * len(destinations) <= 100
+        for i in origins:
+            for j in destinations:
+                assert (i, j) not in covered
+                covered.add((i, j))
+    assert len(covered) == 40 * 40
+
+def test_matrix_is_fetched_in_batches(matrix_server):
+    """Test a 40-stop matrix takes a handful of requests instead of one per pair"""
+    client = make_client(matrix_server)
+    locations = make_locations(40)
+    optimizer = RouteOptimizer(locations, matrix_client=client)
+
+    assert len(matrix_server.calls) == 16
+    assert all(o * d <= 100 for o, d in matrix_server.calls)
+    first, second = [(loc['latitude'], loc['longitude']) for loc in locations[:2]]
+    expected = round(calculate_haversine_distance(first, second) * 1000) / 1000
+    assert optimizer.get_distance(1, 2) == pytest.approx(expected)
+    assert optimizer.get_time(1, 2) == pytest.approx((expected * 1000 // 8) / 3600)
+
+def test_duplicate_points_are_requested_once(matrix_server):
+    """Test the depot appended for return_to_depot does not add extra elements"""
+    client = make_client(matrix_server)
+    locations = make_locations(5)
+    client.fetch_matrix([(loc['latitude'], loc['longitude']) for loc in locations + locations[:1]])
+    assert sum(o * d for o, d in matrix_server.calls) == 25
+
+def test_matrices_are_filled_in_the_requested_dtype(matrix_server):
+    """Test a float32 matrix is allocated once and filled without a float64 copy"""
+    client = make_client(matrix_server)
+    points = [(loc['latitude'], loc['longitude']) for loc in make_locations(30)]
+    expected, _ = client.fetch_matrix(points)
+    distances, times = client.fetch_matrix(points, dtype=np.float32)
+    assert distances.dtype == times.dtype == np.float32
+    assert np.allclose(distances, expected, rtol=1e-6)
+
+def test_failed_requests_fall_back_to_haversine():
+    """Test unreachable APIs leave the optimizer with Haversine estimates"""
+    client = DistanceMatrixClient(api_key='test-key', base_url='http://127.0.0.1:9/json', timeout=0.5)
+    locations = make_locations(3)
+    optimizer = RouteOptimizer(locations, matrix_client=client)
+    first, second = [(loc['latitude'], loc['longitude']) for loc in locations[:2]]
+    expected = calculate_haversine_distance(first, second)
+    assert optimizer.get_distance(1, 2) == pytest.approx(expected)
+
+def test_cached_legs_skip_the_network(matrix_server, tmp_path):
+    """Test a repeated optimization is answered from the leg cache"""
+    cache = LegCache(path=str(tmp_path / 'legs.db'))
+    locations = make_locations(12)
+    RouteOptimizer(locations, matrix_client=make_client(matrix_server, cache=cache))
+    first_calls = len(matrix_server.calls)
+
+    optimizer = RouteOptimizer(locations, matrix_client=make_client(matrix_server, cache=cache))
+    assert len(matrix_server.calls) == first_calls
+    assert cache.stats()['hits'] == 12 * 11
+    assert optimizer.get_distance(1, 2) > 0
+
+def test_cache_writes_stop_at_its_size_bound(matrix_server, tmp_path):
+    """Test a matrix larger than the cache stores no more legs than the cache can hold"""
+    cache = LegCache(path=str(tmp_path / 'legs.db'), max_entries=50)
+    locations = make_locations(12)
+    RouteOptimizer(locations, matrix_client=make_client(matrix_server, cache=cache))
+    assert 0 < len(cache) <= 50
+
+def test_concurrent_fetch_overlaps_slow_requests(matrix_server):
+    """Test one-pair-per-request fetching takes about as long as a few calls when run concurrently"""
+    matrix_server.latency = 0.05
+    points = [(loc['latitude'], loc['longitude']) for loc in make_locations(6)]
+
+    client = make_client(matrix_server, max_elements=1, concurrency=30)
+    start = time.perf_counter()
+    distances, _ = client.fetch_matrix(points)
+    elapsed = time.perf_counter() - start
+
+    assert len(matrix_server.calls) == 30
+    assert elapsed < 30 * 0.05 / 3
+    assert not (distances != distances).any()
+
+def test_optimizer_concurrency_option(matrix_server):
+    """Test RouteOptimizer can override the client's concurrency for its own fetch"""
+    matrix_server.latency = 0.05
+    client = make_client(matrix_server, max_elements=1)
+    start = time.perf_counter()
+    RouteOptimizer(make_locations(5), matrix_client=client, fetch_concurrency=20)
+    assert time.perf_counter() - start < 20 * 0.05 / 3
+
+def test_token_bucket_limits_request_rate():
+    """Test the token bucket spaces out acquisitions beyond its burst capacity"""
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.perf_counter()
+    for _ in range(11):
+        bucket.acquire()
+    assert time.perf_counter() - start >= 10 / 50 * 0.9
@@ -0,0 +1,53 @@
+import threading
+
+from metrics import MetricsRegistry, OptimizationStats, count, record_optimization
+from route_optimizer import RouteOptimizer
+from tests.conftest import HaversineMatrixClient, make_locations
+
+def test_counts_only_reach_the_active_phase_in_this_thread():
+    """Test count() adds to the stats whose phase is running in the same thread only"""
+    stats = OptimizationStats()
+    count('api_calls')
+    with stats.phase('solve'):
+        count('api_calls', 2)
+        thread = threading.Thread(target=count, args=('api_calls', 5))
+        thread.start()
+        thread.join()
+    count('api_calls')
+    assert stats.counters == {'api_calls': 2}
+    assert stats.phases['solve'] >= 0
+    assert stats.as_dict()['counters']['moves_evaluated'] == 0
+
+def test_optimize_route_reports_phases_and_counters():
+    """Test the result carries matrix and solve timings, the fallback leg and local search moves"""
+    optimizer = RouteOptimizer(make_locations(30), matrix_client=HaversineMatrixClient(missing=[(0, 1)]))
+    first = optimizer.optimize_route(1, 'two_opt')['metrics']
+    assert set(first['phases_ms']) == {'matrix', 'solve'}
+    assert first['counters']['fallback_legs'] == 1
+    assert first['counters']['moves_evaluated'] >= first['counters']['moves_accepted'] > 0
+
+    # The matrix was only fetched once, so only the first run reports it
+    second = optimizer.optimize_route(1, 'nearest_neighbor')['metrics']
+    assert set(second['phases_ms']) == {'solve'}
+    assert second['counters']['fallback_legs'] == 0
+
+def test_registry_renders_prometheus_text():
+    """Test counters and cumulative histogram buckets in the Prometheus text format"""
+    registry = MetricsRegistry()
+    stats = OptimizationStats()
+    stats.phases['solve'] = 0.02
+    stats.add('api_calls', 3)
+    record_optimization(stats, 'two_opt', registry)
+    registry.observe('http_request_duration_seconds', 0.2, endpoint='dashboard', method='GET', status=200)
+    registry.observe('http_request_duration_seconds', 3.0, endpoint='dashboard', method='GET', status=200)
+
+    text = registry.render()
+    assert '# TYPE route_optimizer_api_calls_total counter' in text
+    assert 'route_optimizer_api_calls_total 3' in text
+    assert 'route_optimizer_runs_total{solver="two_opt"} 1' in text
+    assert 'route_optimizer_phase_seconds_bucket{phase="solve",le="0.025"} 1' in text
+    labels = 'endpoint="dashboard",method="GET",status="200"'
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.25"}} 1' in text
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f'http_request_duration_seconds_count{{{labels}}} 2' in text
+    assert f'http_request_duration_seconds_sum{{{labels}}} 3.2' in text
@@ -0,0 +1,47 @@
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import pytest
+from local_search import fast_two_opt
+from multi_start import _run_start, multi_start_optimize, randomized_nearest_neighbor
+from route_optimizer import _nearest_neighbor_path, build_distance_matrix, route_length
+from tests.conftest import make_locations
+
+@pytest.fixture(scope='module')
+def executor():
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        yield pool
+
+def test_randomized_construction_varies_by_seed():
+    """Test randomized starts are valid tours that differ between seeds"""
+    dist = build_distance_matrix(make_locations(60))
+    routes = [randomized_nearest_neighbor(dist, 0, 59, random.Random(seed)) for seed in range(4)]
+    for route in routes:
+        assert route[0] == 0 and route[-1] == 59 and sorted(route) == list(range(60))
+    assert len({tuple(route) for route in routes}) > 1
+    assert randomized_nearest_neighbor(dist, 0, None, random.Random(0), 1) == _nearest_neighbor_path(dist, 0, None)
+
+def test_multi_start_beats_single_descent(executor):
+    """Test the best of several starts is a valid route no longer than nearest neighbour + 2-opt"""
+    dist = build_distance_matrix(make_locations(120))
+    baseline = fast_two_opt(dist, _nearest_neighbor_path(dist, 0, 119), closed=False, fixed_end=True)
+    route = multi_start_optimize(dist, 0, 119, starts=4, seed=1, executor=executor)
+    assert route[0] == 0 and route[-1] == 119 and sorted(route) == list(range(120))
+    assert route_length(dist, route) <= route_length(dist, baseline) + 1e-9
+
+def test_multi_start_respects_time_budget(executor):
+    """Test a timed run returns close to its wall-clock budget"""
+    dist = build_distance_matrix(make_locations(300))
+    started = time.perf_counter()
+    route = multi_start_optimize(dist, 0, None, time_budget=0.5, executor=executor)
+    assert time.perf_counter() - started < 1.5
+    assert sorted(route) == list(range(300))
+
+def test_start_after_its_call_returned_does_nothing():
+    """Test a start that runs only after its call unlinked the shared matrix returns at once"""
+    segment = shared_memory.SharedMemory(create=True, size=8 * 16)
+    segment.close()
+    segment.unlink()
+    assert _run_start(segment.name, (4, 4), 0, None, 0, True, None) is None
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+from multi_vehicle import FleetPlanner, plan_fleet_routes
+from route_optimizer import RouteOptimizer, build_distance_matrix, route_length
+from tests.conftest import make_locations
+
+def total_length(dist, routes):
+    return sum(route_length(dist, [0] + route, closed=True) for route in routes if route)
+
+def test_every_stop_is_routed_exactly_once():
+    """Test the fleet covers all stops with one balanced route per vehicle"""
+    dist = build_distance_matrix(make_locations(101))
+    routes, unassigned = plan_fleet_routes(dist, 0, list(range(1, 101)), 4)
+    assert len(routes) == 4 and not unassigned
+    assert sorted(s for route in routes for s in route) == list(range(1, 101))
+    assert all(len(route) <= 25 for route in routes)
+
+def test_improvement_beats_plain_savings():
+    """Test relocate, exchange and 2-opt shorten the savings routes"""
+    dist = build_distance_matrix(make_locations(151))
+    planner = FleetPlanner(dist, 0, list(range(1, 151)), 5, max_stops=40)
+    planner._assign_routes(planner._reduce_route_count(planner._savings_routes()))
+    planner._insert_unassigned()
+    savings = sum(planner.lengths)
+    routes, unassigned = planner.solve()
+    assert not unassigned
+    assert total_length(dist, routes) < savings
+
+def test_per_vehicle_caps_are_respected():
+    """Test stop and distance caps per vehicle, with overflow reported as unassigned"""
+    dist = build_distance_matrix(make_locations(61))
+    routes, unassigned = plan_fleet_routes(dist, 0, list(range(1, 61)), 3, max_stops=[5, 10, 15])
+    assert sorted(len(route) for route in routes) == [5, 10, 15]
+    assert len(unassigned) == 30
+
+    routes, unassigned = plan_fleet_routes(dist, 0, list(range(1, 61)), 3, max_distance=25)
+    assert all(route_length(dist, [0] + route, closed=True) <= 25 + 1e-9 for route in routes)
+    assert sorted(unassigned + [s for route in routes for s in route]) == list(range(1, 61))
+
+def test_thousands_of_stops_within_seconds():
+    """Test a 2000-stop, 15-vehicle plan finishes in a few seconds"""
+    dist = build_distance_matrix(make_locations(2001, seed=9))
+    start = time.perf_counter()
+    routes, unassigned = plan_fleet_routes(dist, 0, list(range(1, 2001)), 15)
+    assert time.perf_counter() - start < 5.0
+    assert not unassigned and sum(len(route) for route in routes) == 2000
+
+def test_optimizer_plans_one_route_per_delivery_boy(haversine_client):
+    """Test RouteOptimizer.optimize_fleet starts and ends every route at the depot"""
+    locations = make_locations(30)
+    locations.append(dict(locations[0]))
+    optimizer = RouteOptimizer(locations, matrix_client=haversine_client)
+    riders = [{'id': 7, 'name': 'A'}, {'id': 8, 'name': 'B'}, {'id': 9, 'name': 'C'}]
+    result = optimizer.optimize_fleet(1, riders, max_stops=12)
+
+    assert [r['delivery_boy']['id'] for r in result['routes']] == [7, 8, 9]
+    visited = []
+    for route in result['routes']:
+        ids = [loc['id'] for loc in route['locations']]
+        assert ids[0] == 1 and ids[-1] == 1
+        assert route['num_stops'] <= 12
+        visited.extend(ids[1:-1])
+    assert sorted(visited) == list(range(2, 31))
+    assert not result['unassigned']
+    assert result['total_distance'] == pytest.approx(sum(r['total_distance'] for r in result['routes']))
+
+def test_fleet_endpoint_rejects_missing_start(admin_client):
+    """Test the fleet endpoint answers bad input with a 400 instead of a server error"""
+    for body in ({}, {'start_location': 'depot'}, {'start_location': 1, 'delivery_points': 5}, None):
+        response = admin_client.post('/admin/optimize-fleet', json=body)
+        assert response.status_code == 400
+        assert response.get_json()['success'] is False
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+JOB = {'start_location': 1, 'delivery_points': [2, 3], 'algorithm': 'auto', 'return_to_depot': True}
+
+@pytest.fixture
+def jobs(admin_client, monkeypatch):
+    """Admin client whose jobs run a stand-in optimization that waits for `release` after its first phase."""
+    import app as app_module
+    started, release = threading.Event(), threading.Event()
+
+    def run_route_optimization(params, progress):
+        progress(0.1, 'Fetching distance matrix')
+        started.set()
+        release.wait(10)
+        progress(0.7, 'Solving route')
+        return {'route': params['delivery_points']}
+
+    monkeypatch.setattr(app_module, 'run_route_optimization', run_route_optimization)
+    admin_client.started, admin_client.release = started, release
+    yield admin_client
+    release.set()
+
+def wait_for(client, job_id, statuses, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = client.get(f'/admin/optimize-route/jobs/{job_id}').get_json()
+        if status['status'] in statuses:
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f'job {job_id} never reached {statuses}')
+
+def add_queued_job():
+    import json
+    from app import app, db, OptimizationJob
+    with app.app_context():
+        db.session.add(OptimizationJob(id='queued-job', status='queued', message='Queued', params=json.dumps(JOB)))
+        db.session.commit()
+    return 'queued-job'
+
+def test_submitted_job_reports_progress_and_result(jobs):
+    """Test a submitted job runs in the background and its result is served once it completes"""
+    response = jobs.post('/admin/optimize-route/jobs', json=JOB)
+    assert response.status_code == 202
+    job = response.get_json()
+
+    assert jobs.started.wait(10)
+    status = wait_for(jobs, job['job_id'], {'running'})
+    assert status['progress'] == 0.1 and status['message'] == 'Fetching distance matrix'
+    assert jobs.get(job['result_url']).status_code == 409
+
+    jobs.release.set()
+    status = wait_for(jobs, job['job_id'], {'completed', 'failed'})
+    assert status['status'] == 'completed' and status['progress'] == 1.0
+    assert jobs.get(job['result_url']).get_json()['optimized_route'] == {'route': [2, 3]}
+
+def test_cancelled_job_reports_cancelling_until_it_stops(jobs):
+    """Test cancelling a running job is stored in its row and the runner stops at its next check"""
+    job = jobs.post('/admin/optimize-route/jobs', json=JOB).get_json()
+    assert jobs.started.wait(10)
+
+    response = jobs.post(f"{job['status_url']}/cancel").get_json()
+    assert response['success'] and response['status'] == 'cancelling'
+    assert jobs.post(f"{job['status_url']}/cancel").get_json()['status'] == 'cancelling'
+    assert wait_for(jobs, job['job_id'], {'running', 'cancelling'})['status'] == 'cancelling'
+
+    jobs.release.set()
+    status = wait_for(jobs, job['job_id'], {'cancelled', 'completed', 'failed'})
+    assert status['status'] == 'cancelled' and status['finished_at']
+    assert jobs.get(job['result_url']).status_code == 409
+    assert jobs.post(f"{job['status_url']}/cancel").get_json() == {'success': False, 'message': 'Job is already cancelled'}
+
+def test_queued_job_is_cancelled_before_it_starts(jobs):
+    """Test a queued job is cancelled at once and its runner then leaves it alone"""
+    from app import run_optimization_job
+    job_id = add_queued_job()
+    response = jobs.post(f'/admin/optimize-route/jobs/{job_id}/cancel').get_json()
+    assert response['success'] and response['status'] == 'cancelled'
+
+    run_optimization_job(job_id)
+    assert not jobs.started.is_set()
+    assert wait_for(jobs, job_id, {'cancelled'})['started_at'] is None
+
+def test_active_jobs_are_capped(jobs, monkeypatch):
+    """Test submissions are refused with a 429 while the active job limit is reached"""
+    import app as app_module
+    monkeypatch.setattr(app_module, 'MAX_ACTIVE_JOBS', 1)
+    add_queued_job()
+    response = jobs.post('/admin/optimize-route/jobs', json=JOB)
+    assert response.status_code == 429
+    assert response.get_json()['success'] is False
+    assert not jobs.started.is_set()
@@ -0,0 +1,36 @@
+import random
+
+import pytest
+from polyline import decode, encode, parse_waypoints
+
+def test_encode_matches_reference_example():
+    """Test the example from Google's encoded polyline documentation"""
+    points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    assert encode(points) == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+    assert decode('_p~iF~ps|U_ulLnnqC_mqNvxq`@') == points
+
+def test_round_trip_keeps_five_decimals():
+    """Test a long route decodes to its points rounded to about a metre"""
+    rng = random.Random(0)
+    points = [(rng.uniform(12.8, 13.1), rng.uniform(77.4, 77.8)) for _ in range(500)]
+    decoded = decode(encode(points))
+    assert len(decoded) == len(points)
+    assert all(abs(a - c) <= 5e-6 and abs(b - d) <= 5e-6 for (a, b), (c, d) in zip(points, decoded))
+    assert len(encode(points)) < len(';'.join(f'{lat},{lng}' for lat, lng in points)) / 3
+
+def test_empty_and_malformed_polylines():
+    """Test an empty route round-trips and truncated or invalid text is rejected"""
+    assert encode([]) == ''
+    assert decode('') == []
+    with pytest.raises(ValueError):
+        decode('_p~iF~ps|U_')
+    with pytest.raises(ValueError):
+        decode('_p~iF')
+    with pytest.raises(ValueError):
+        decode('abc def')
+
+def test_parse_waypoints_reads_old_text_format():
+    """Test the old "lat,lng;lat,lng" waypoint text is parsed and bad text raises"""
+    assert parse_waypoints('12.97,77.59;12.98,77.6;') == [(12.97, 77.59), (12.98, 77.6)]
+    with pytest.raises(ValueError):
+        parse_waypoints('12.97;77.59')
@@ -0,0 +1,309 @@
+import random
+import time
+from itertools import permutations
+
+import numpy as np
+import pytest
+import route_optimizer
+from route_optimizer import (
+    HELD_KARP_MAX_BYTES,
+    SOLVERS,
+    CSRGraph,
+    Graph,
+    RouteOptimizer,
+    build_distance_matrix,
+    calculate_haversine_distance,
+    csr_astar,
+    csr_dijkstra,
+    dijkstra,
+    floyd_warshall,
+    get_path_floyd_warshall,
+    fast_two_opt,
+    held_karp,
+    held_karp_memory,
+    is_metric,
+    nearest_neighbor,
+    route_length,
+    select_solver,
+    tsp_brute_force,
+    two_opt,
+)
+from tests.conftest import HaversineMatrixClient, make_locations
+
+def make_optimizer(n, return_to_depot=True):
+    locations = make_locations(n)
+    if return_to_depot:
+        locations.append(dict(locations[0]))
+    return RouteOptimizer(locations, matrix_client=HaversineMatrixClient())
+
+def test_distance_matrix_matches_scalar_haversine():
+    """Test the vectorized matrix against the scalar Haversine formula"""
+    locations = make_locations(25)
+    dist = build_distance_matrix(locations)
+    assert dist.shape == (25, 25)
+    assert np.allclose(dist, dist.T)
+    assert np.all(np.diag(dist) == 0)
+    for i in range(0, 25, 6):
+        for j in range(25):
+            expected = calculate_haversine_distance(
+                (locations[i]['latitude'], locations[i]['longitude']),
+                (locations[j]['latitude'], locations[j]['longitude'])
+            )
+            assert dist[i][j] == pytest.approx(expected, abs=1e-9)
+
+def test_nearest_neighbor_visits_every_location_once():
+    """Test nearest neighbor returns a permutation starting at index 0"""
+    locations = make_locations(40)
+    route = nearest_neighbor(locations)
+    assert route[0] == 0
+    assert sorted(route) == list(range(40))
+
+def test_two_opt_does_not_lengthen_route():
+    """Test 2-opt never makes the initial route longer"""
+    locations = make_locations(60)
+    dist = build_distance_matrix(locations)
+    initial = nearest_neighbor(locations, dist)
+    improved = two_opt(locations, initial, dist)
+    assert sorted(improved) == list(range(60))
+    assert route_length(dist, improved) <= route_length(dist, initial) + 1e-9
+
+def test_brute_force_is_optimal_for_small_instances():
+    """Test brute force finds a tour no longer than the heuristic one"""
+    locations = make_locations(7)
+    dist = build_distance_matrix(locations)
+    exact = tsp_brute_force(locations, dist)
+    heuristic = nearest_neighbor(locations, dist)
+    assert route_length(dist, exact, closed=True) <= route_length(dist, heuristic, closed=True) + 1e-9
+
+def test_held_karp_matches_exhaustive_search():
+    """Test Held-Karp finds the optimum for closed tours, open paths and fixed ends"""
+    dist = build_distance_matrix(make_locations(8))
+    inner = range(1, 8)
+
+    closed = min(route_length(dist, [0, *p], closed=True) for p in permutations(inner))
+    assert route_length(dist, held_karp(dist), closed=True) == pytest.approx(closed)
+
+    open_path = min(route_length(dist, [0, *p]) for p in permutations(inner))
+    assert route_length(dist, held_karp(dist, return_to_start=False)) == pytest.approx(open_path)
+
+    fixed_end = min(route_length(dist, [0, *p, 7]) for p in permutations(range(1, 7)))
+    route = held_karp(dist, end=7)
+    assert route[0] == 0 and route[-1] == 7
+    assert route_length(dist, route) == pytest.approx(fixed_end)
+
+def test_held_karp_solves_eighteen_stops():
+    """Test the exact solver handles 18 stops"""
+    dist = build_distance_matrix(make_locations(18))
+    route = held_karp(dist)
+    assert route[0] == 0
+    assert sorted(route) == list(range(18))
+
+def test_held_karp_memory_guard_falls_back_to_heuristic():
+    """Test a table that would not fit triggers the heuristic instead"""
+    dist = build_distance_matrix(make_locations(30))
+    route = held_karp(dist, end=29, max_memory_bytes=1024)
+    assert route[0] == 0 and route[-1] == 29
+    assert sorted(route) == list(range(30))
+    # The default cap keeps a web request under about a second of exact search
+    assert held_karp_memory(19) <= HELD_KARP_MAX_BYTES < held_karp_memory(20)
+
+def test_fast_two_opt_respects_route_shape():
+    """Test the 2-opt engine keeps the start, and the end when it is fixed"""
+    locations = make_locations(80, seed=42)
+    dist = build_distance_matrix(locations)
+    initial = nearest_neighbor(locations, dist)
+
+    fixed = fast_two_opt(dist, initial, closed=False, fixed_end=True)
+    assert fixed[0] == 0 and fixed[-1] == initial[-1]
+    assert route_length(dist, fixed) <= route_length(dist, initial) + 1e-9
+
+    free = fast_two_opt(dist, initial, closed=False, fixed_end=False)
+    assert free[0] == 0 and sorted(free) == list(range(80))
+    assert route_length(dist, free) <= route_length(dist, fixed) + 1e-9
+
+    tour = fast_two_opt(dist, initial, closed=True)
+    assert tour[0] == 0 and sorted(tour) == list(range(80))
+    assert route_length(dist, tour, closed=True) <= route_length(dist, initial, closed=True) + 1e-9
+
+def test_fast_two_opt_handles_five_hundred_stops_quickly():
+    """Test a 500-stop route is improved well under a second"""
+    locations = make_locations(500, seed=5)
+    dist = build_distance_matrix(locations)
+    initial = nearest_neighbor(locations, dist)
+    start = time.perf_counter()
+    tour = fast_two_opt(dist, initial, closed=True)
+    assert time.perf_counter() - start < 1.0
+    assert route_length(dist, tour, closed=True) < route_length(dist, initial, closed=True)
+
+def test_select_solver_scales_with_size_and_budget():
+    """Test auto mode picks exact, metaheuristic or heuristic solvers"""
+    assert select_solver(8) == 'held_karp'
+    assert select_solver(15) == 'local_search'
+    assert select_solver(15, time_budget=2.0) == 'held_karp'
+    assert select_solver(200, time_budget=0.3) == 'anytime'
+    assert select_solver(200, time_budget=5.0) == 'multi_start'
+    assert select_solver(200, time_budget=5.0, parallel=False) == 'anytime'
+    assert select_solver(20000) == 'two_opt'
+
+@pytest.mark.parametrize('algorithm', sorted(SOLVERS))
+def test_optimize_route_runs_every_registered_solver(algorithm):
+    """Test each solver starts and ends at the depot and reports what ran"""
+    optimizer = make_optimizer(12)
+    result = optimizer.optimize_route(1, algorithm, time_budget=0.05)
+    ids = [loc['id'] for loc in result['locations']]
+    assert ids[0] == 1 and ids[-1] == 1
+    assert sorted(ids[1:-1]) == list(range(2, 13))
+    assert result['solver_used'] == algorithm
+    assert result['solve_time_ms'] >= 0
+    assert result['tour_length_km'] == pytest.approx(result['total_distance'], abs=0.01)
+
+def test_optimize_route_auto_beats_nearest_neighbor():
+    """Test auto mode never returns a longer route than nearest neighbor"""
+    optimizer = make_optimizer(10)
+    auto = optimizer.optimize_route(1, 'auto')
+    greedy = optimizer.optimize_route(1, 'nearest_neighbor')
+    assert auto['solver_used'] == 'held_karp'
+    assert auto['tour_length_km'] <= greedy['tour_length_km'] + 1e-9
+
+def test_optimizer_keeps_compact_arrays_with_repeated_depot():
+    """Test the depot repeated for a round trip keeps both positions and id lookups still work"""
+    optimizer = make_optimizer(30)
+    assert optimizer.dist_matrix.dtype == np.float32 and optimizer.time_matrix.dtype == np.float32
+    assert optimizer.ids.tolist() == list(range(1, 31)) + [1]
+    assert optimizer.positions[1] == [0, 30]
+    assert np.allclose(optimizer.lats, [loc['latitude'] for loc in optimizer.locations])
+
+    dist = build_distance_matrix(optimizer.locations)
+    assert optimizer.get_distance(3, 7) == pytest.approx(dist[2][6], rel=1e-6)
+    assert optimizer.get_time(3, 7) == pytest.approx(dist[2][6] / 20, rel=1e-6)
+    assert optimizer.get_distance(1, 1) == 0
+    assert optimizer.get_distance(1, 999) == 0
+
+    route, total_distance, _ = optimizer.nearest_neighbor(1)
+    assert [loc['id'] for loc in route][0] == 1 and len(route) == 30
+    optimizer.remove_locations([5])
+    assert optimizer.positions[1] == [0, 29] and 5 not in optimizer.positions
+
+def test_optimizer_matrix_memory_for_two_thousand_stops(haversine_client):
+    """Test a 2000-stop optimizer holds its distance and time matrices in tens of MB"""
+    optimizer = RouteOptimizer(make_locations(2000), matrix_client=haversine_client)
+    assert optimizer.dist_matrix.nbytes + optimizer.time_matrix.nbytes == 2 * 2000 * 2000 * 4
+
+def make_road_graph(n=300, seed=11):
+    """Random road network whose edges are 0-40% longer than the straight line."""
+    rng = random.Random(seed)
+    locations = make_locations(n, seed=seed)
+    coordinates = {str(loc['id']): (loc['latitude'], loc['longitude']) for loc in locations}
+    dist = build_distance_matrix(locations)
+    graph = Graph()
+    for i in range(n):
+        for j in np.argsort(dist[i])[1:5]:
+            graph.add_edge(str(i + 1), str(int(j) + 1), float(dist[i][j]) * rng.uniform(1.0, 1.4))
+    return graph, coordinates
+
+def test_csr_dijkstra_matches_dict_dijkstra():
+    """Test the CSR search agrees with the dict-based implementation"""
+    graph, _ = make_road_graph()
+    expected, _ = dijkstra(graph, '1')
+    csr = graph.to_csr()
+    distances, previous = csr_dijkstra(csr, csr.index['1'])
+    for name, distance in expected.items():
+        assert distances[csr.index[name]] == pytest.approx(distance)
+    reachable = next(name for name in expected if name != '1' and expected[name] < float('inf'))
+    path = csr.path_to(previous, csr.index['1'], csr.index[reachable])
+    assert path[0] == '1' and path[-1] == reachable
+
+def test_csr_dijkstra_stops_at_targets():
+    """Test early exit still settles the requested targets exactly"""
+    graph, _ = make_road_graph()
+    csr = graph.to_csr()
+    full, _ = csr_dijkstra(csr, 0)
+    targets = {5, 17}
+    partial, _ = csr_dijkstra(csr, 0, targets)
+    for target in targets:
+        assert partial[target] == pytest.approx(full[target])
+
+def test_astar_finds_shortest_paths():
+    """Test A* with the Haversine heuristic returns Dijkstra's distances"""
+    graph, coordinates = make_road_graph()
+    csr = CSRGraph.from_graph(graph, coordinates)
+    full, _ = csr_dijkstra(csr, 0)
+    for target in (3, 42, 150, 299):
+        distance, previous = csr_astar(csr, 0, target)
+        assert distance == pytest.approx(full[target])
+        if np.isfinite(distance):
+            assert csr.path_to(previous, 0, target)[-1] == csr.names[target]
+
+def floyd_warshall_reference(dist):
+    """The original element-by-element triple loop."""
+    n = len(dist)
+    dist = dist.copy()
+    next_node = np.tile(np.arange(n), (n, 1))
+    next_node[~np.isfinite(dist)] = -1
+    np.fill_diagonal(next_node, -1)
+    for k in range(n):
+        for i in range(n):
+            for j in range(n):
+                if dist[i][j] > dist[i][k] + dist[k][j]:
+                    dist[i][j] = dist[i][k] + dist[k][j]
+                    next_node[i][j] = next_node[i][k]
+    return dist, next_node
+
+def test_vectorized_floyd_warshall_matches_triple_loop():
+    """Test the broadcast relaxation gives the same distances and paths as the triple loop"""
+    rng = np.random.default_rng(0)
+    dist = rng.uniform(1, 10, (40, 40))
+    dist = (dist + dist.T) / 2
+    dist[rng.random((40, 40)) < 0.6] = np.inf
+    np.fill_diagonal(dist, 0)
+    assert not is_metric(dist)
+
+    result, next_node = floyd_warshall(None, dist)
+    expected, expected_next = floyd_warshall_reference(dist)
+    assert np.allclose(result, expected)
+    assert (next_node == expected_next).all()
+
+    path = get_path_floyd_warshall(next_node, 0, 39)
+    if np.isfinite(result[0][39]):
+        assert path[0] == 0 and path[-1] == 39
+        assert sum(dist[a][b] for a, b in zip(path, path[1:])) == pytest.approx(result[0][39])
+
+def test_floyd_warshall_skips_metric_matrices():
+    """Test Haversine matrices come back unchanged with direct next hops"""
+    locations = make_locations(30)
+    assert is_metric(build_distance_matrix(locations))
+    result, next_node = floyd_warshall(locations)
+    assert np.allclose(result, build_distance_matrix(locations))
+    assert get_path_floyd_warshall(next_node, 3, 17) == [3, 17]
+
+def test_floyd_warshall_fast_path_is_taken_for_haversine_matrices(monkeypatch):
+    """Test a matrix the caller declares metric skips the relaxation"""
+    def relax(dist, next_node):
+        raise AssertionError("relaxation ran on a metric matrix")
+
+    locations = make_locations(300)
+    dist = build_distance_matrix(locations)
+    monkeypatch.setattr(route_optimizer, '_relax_all_pairs', relax)
+    result, next_node = floyd_warshall(None, dist, assume_metric=True)
+    assert np.array_equal(result, dist)
+    assert get_path_floyd_warshall(next_node, 3, 17) == [3, 17]
+
+    # float32 rounding is not mistaken for a detour
+    assert is_metric(dist.astype(np.float32))
+
+    # A matrix with detours cheaper than the direct legs fails the check early
+    detours = dist * np.random.default_rng(0).uniform(1.0, 1.5, dist.shape)
+    assert not is_metric(detours, max_pivots=8)
+
+def test_floyd_warshall_finds_a_shortcut_through_a_single_pivot():
+    """Test a matrix whose only violation goes through one pivot is still relaxed"""
+    n = 300
+    for k in (7, 150, 299):
+        dist = np.full((n, n), 3.0)
+        np.fill_diagonal(dist, 0)
+        dist[0, 1] = dist[1, 0] = 5.0
+        dist[0, k] = dist[k, 0] = dist[k, 1] = dist[1, k] = 0.1
+        assert not is_metric(dist)
+        result, next_node = floyd_warshall(None, dist)
+        assert result[0, 1] == pytest.approx(0.2)
+        assert get_path_floyd_warshall(next_node, 0, 1) == [0, k, 1]
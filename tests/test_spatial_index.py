@@ -0,0 +1,55 @@
+import time
+
+import numpy as np
+import pytest
+from route_optimizer import _nearest_neighbor_path, build_distance_matrix, haversine_matrix
+from spatial_index import SpatialIndex, nearest_neighbor_route
+from tests.conftest import make_locations
+
+def test_k_nearest_matches_haversine_ranking():
+    """Test k-nearest queries return the same stops and distances as a full Haversine scan"""
+    locations = make_locations(500, first_id=100)
+    index = SpatialIndex.from_locations(locations)
+    dist = build_distance_matrix(locations)
+    for position in (0, 17, 250, 499):
+        result = index.neighbors_of(position, 8)
+        assert [p for p, _ in result] == np.argsort(dist[position])[1:9].tolist()
+        assert [d for _, d in result] == pytest.approx(np.sort(dist[position])[1:9].tolist())
+    assert index.ids[index.nearest(12.9, 77.5, 1)[0][0]] >= 100
+
+def test_radius_query_finds_every_stop_in_range():
+    """Test radius queries return exactly the stops within the radius, closest first"""
+    locations = make_locations(800, first_id=100)
+    index = SpatialIndex.from_locations(locations)
+    lats = np.array([12.95] + [loc['latitude'] for loc in locations])
+    lons = np.array([77.45] + [loc['longitude'] for loc in locations])
+    expected = np.flatnonzero(haversine_matrix(lats, lons)[0, 1:] <= 2.0)
+    result = index.within(12.95, 77.45, 2.0)
+    assert sorted(p for p, _ in result) == expected.tolist()
+    assert [d for _, d in result] == sorted(d for _, d in result)
+
+def test_removed_points_are_skipped():
+    """Test removed points no longer appear in query results"""
+    index = SpatialIndex.from_locations(make_locations(50, first_id=100))
+    first = index.nearest(12.9, 77.5, 1)[0][0]
+    index.remove(first)
+    assert len(index) == 49
+    assert all(p != first for p, _ in index.nearest(12.9, 77.5, 49))
+
+def test_candidate_nearest_neighbor_matches_full_scan():
+    """Test the candidate-list construction picks the same stops as the O(n^2) scan"""
+    locations = make_locations(400, first_id=100)
+    route = nearest_neighbor_route(SpatialIndex.from_locations(locations), 0)
+    assert route == _nearest_neighbor_path(build_distance_matrix(locations), 0, None)
+
+    route = nearest_neighbor_route(SpatialIndex.from_locations(locations), 0, end=399)
+    assert route[0] == 0 and route[-1] == 399 and sorted(route) == list(range(400))
+
+def test_construction_scales_to_large_instances():
+    """Test 20000 stops are ordered in a few seconds without a distance matrix"""
+    rng = np.random.default_rng(3)
+    index = SpatialIndex(rng.uniform(12.8, 13.0, 20000), rng.uniform(77.4, 77.6, 20000))
+    start = time.perf_counter()
+    route = nearest_neighbor_route(index, 0)
+    assert time.perf_counter() - start < 5.0
+    assert sorted(route) == list(range(20000))
@@ -0,0 +1,76 @@
+import random
+
+import numpy as np
+from route_optimizer import RouteOptimizer, build_distance_matrix
+from tests.conftest import make_locations
+from time_windows import TimeWindowSchedule, solve_time_windows
+
+def simulate(time_matrix, route, earliest, latest, service):
+    """Full re-simulation of a route, for checking the constant-time answers."""
+    t = 0.0
+    for prev, node in zip([None] + route[:-1], route):
+        if prev is not None:
+            t += service[prev] + time_matrix[prev][node]
+        t = max(t, earliest[node])
+        if t > latest[node] + 1e-9:
+            return False
+    return True
+
+def test_slack_check_matches_full_simulation():
+    """Test every constant-time insertion check agrees with re-simulating the route"""
+    rng = random.Random(4)
+    n = 9
+    time_matrix = build_distance_matrix(make_locations(n, spread=0.05)) / 20
+    checked = 0
+    for _ in range(200):
+        earliest = [0.0] + [rng.uniform(0, 0.5) for _ in range(n - 1)]
+        latest = [np.inf] + [e + rng.uniform(0.1, 1.5) for e in earliest[1:]]
+        service = [0.0] + [0.05] * (n - 1)
+        route = [0] + rng.sample(range(1, n), 4)
+        schedule = TimeWindowSchedule(time_matrix, route, earliest, latest, service)
+        if not schedule.feasible():
+            continue
+        for node in set(range(1, n)) - set(route):
+            for position in range(1, len(route) + 1):
+                candidate = route[:position] + [node] + route[position:]
+                assert schedule.can_insert(node, position) == simulate(time_matrix, candidate, earliest, latest, service)
+                checked += 1
+    assert checked > 100
+
+def test_solver_meets_every_window():
+    """Test routed stops start service inside their windows and impossible ones are reported"""
+    n = 25
+    locations = make_locations(n, spread=0.05)
+    dist = build_distance_matrix(locations)
+    time_matrix = dist / 20
+    rng = random.Random(8)
+    earliest = [0.0] + [rng.uniform(0, 1.5) for _ in range(n - 1)]
+    latest = [np.inf] + [e + 0.5 for e in earliest[1:]]
+    latest[5] = -1.0  # already missed
+    service = [0.0] + [0.05] * (n - 1)
+
+    route, infeasible, schedule = solve_time_windows(dist, time_matrix, 0, None, list(range(1, n)),
+                                                     earliest, latest, service)
+    assert 5 in infeasible and 5 not in route
+    assert sorted(route[1:] + infeasible) == list(range(1, n))
+    assert simulate(time_matrix, route, earliest, latest, service)
+    for node, begin in zip(schedule.route, schedule.begin):
+        assert earliest[node] - 1e-9 <= begin <= latest[node] + 1e-9
+
+def test_optimize_route_respects_windows(haversine_client):
+    """Test windows in the locations switch optimize_route to the time-window solver"""
+    locations = make_locations(8, spread=0.05)
+    locations[3]['window_start'] = 1.0
+    locations[3]['window_end'] = 1.2
+    locations[5]['window_end'] = 0.0
+    locations[6]['service_minutes'] = 15
+    locations.append(dict(locations[0]))
+    optimizer = RouteOptimizer(locations, matrix_client=haversine_client)
+    result = optimizer.optimize_route(1, 'auto')
+
+    assert result['solver_used'] == 'time_windows'
+    assert [loc['id'] for loc in result['infeasible_locations']] == [6]
+    ids = [loc['id'] for loc in result['locations']]
+    assert ids[0] == 1 and ids[-1] == 1 and 6 not in ids
+    stop = next(s for s in result['schedule'] if s['id'] == 4)
+    assert 1.0 <= stop['service_start'] <= 1.2
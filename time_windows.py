@@ -0,0 +1,187 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import math
+
+IMPROVEMENT_EPSILON = 1e-10
+MAX_RELOCATE_PASSES = 50
+
+class TimeWindowSchedule:
+    """
+    Service schedule of one route under time windows, with forward time slack.
+
+    route lists matrix indices starting at the depot. Times are hours after departure:
+    a stop is reached at arrival, service starts at max(arrival, earliest) and must start
+    no later than latest, then lasts service hours. slack[i] is how far service at
+    position i can be pushed back without any later stop missing its window (waiting
+    further down the route absorbs part of a push), so inserting a stop before position i
+    is feasible exactly when its own window is met and the push it causes at i is at
+    most slack[i]. That makes every insertion check constant time.
+    """
+
+    def __init__(self, time_matrix, route: List[int], earliest: Sequence[float], latest: Sequence[float],
+                 service: Sequence[float], start_time: float = 0.0):
+        self.time = time_matrix.tolist() if hasattr(time_matrix, 'tolist') else time_matrix
+        self.earliest = earliest
+        self.latest = latest
+        self.service = service
+        self.start_time = start_time
+        self.route = list(route)
+        self.update()
+
+    def update(self):
+        """Recompute arrivals, service starts and slack after the route changed."""
+        route, time = self.route, self.time
+        m = len(route)
+        self.arrival = [0.0] * m
+        self.begin = [0.0] * m
+        self.arrival[0] = self.begin[0] = max(self.start_time, self.earliest[route[0]])
+        for i in range(1, m):
+            prev, node = route[i - 1], route[i]
+            self.arrival[i] = self.begin[i - 1] + self.service[prev] + time[prev][node]
+            self.begin[i] = max(self.arrival[i], self.earliest[node])
+
+        self.slack = [0.0] * m
+        if m:
+            self.slack[m - 1] = self.latest[route[m - 1]] - self.begin[m - 1]
+            for i in range(m - 2, -1, -1):
+                wait = self.begin[i + 1] - self.arrival[i + 1]
+                self.slack[i] = min(self.latest[route[i]] - self.begin[i], wait + self.slack[i + 1])
+
+    def feasible(self) -> bool:
+        return all(b <= self.latest[node] + 1e-9 for node, b in zip(self.route, self.begin))
+
+    def can_insert(self, node: int, position: int) -> bool:
+        """Whether node can be visited just before route[position] (or last, if position == len)."""
+        route, time = self.route, self.time
+        prev = route[position - 1]
+        arrival = self.begin[position - 1] + self.service[prev] + time[prev][node]
+        begin = max(arrival, self.earliest[node])
+        if begin > self.latest[node] + 1e-9:
+            return False
+        if position == len(route):
+            return True
+        following = route[position]
+        pushed = max(begin + self.service[node] + time[node][following], self.earliest[following])
+        return pushed - self.begin[position] <= self.slack[position] + 1e-9
+
+    def end_time(self) -> float:
+        """When service at the last stop finishes."""
+        if not self.route:
+            return self.start_time
+        return self.begin[-1] + self.service[self.route[-1]]
+
+def _insertion_cost(dist, route: List[int], node: int, position: int) -> float:
+    prev = route[position - 1]
+    if position == len(route):
+        return dist[prev][node]
+    following = route[position]
+    return dist[prev][node] + dist[node][following] - dist[prev][following]
+
+def solve_time_windows(dist_matrix, time_matrix, start: int, end: Optional[int], stops: List[int],
+                       earliest: Sequence[float], latest: Sequence[float], service: Sequence[float],
+                       initial_route: Optional[List[int]] = None) -> Tuple[List[int], List[int], TimeWindowSchedule]:
+    """
+    Route stops from start (and to end, if given) so every service starts within its window.
+    Stops are placed by cheapest feasible insertion, tightest deadline first, then moved
+    around by relocate moves while that shortens the route. Every candidate position is
+    checked in constant time against the schedule's forward slack. If initial_route
+    (e.g. from a distance-only solver) already meets every window it is used as the
+    starting point instead.
+    Returns (route, stops that fit in no feasible position, schedule of the route).
+    """
+    dist = dist_matrix.tolist() if hasattr(dist_matrix, 'tolist') else dist_matrix
+    fixed = [start] + ([end] if end is not None else [])
+    schedule = None
+    unplaced: List[int] = []
+
+    if initial_route is not None:
+        candidate = TimeWindowSchedule(time_matrix, initial_route, earliest, latest, service)
+        if candidate.feasible():
+            schedule = candidate
+
+    if schedule is None:
+        schedule = TimeWindowSchedule(time_matrix, fixed, earliest, latest, service)
+        if not schedule.feasible():
+            return fixed, sorted(stops), schedule
+        limit_offset = 1 if end is not None else 0
+        for node in sorted(stops, key=lambda s: (latest[s], earliest[s])):
+            route = schedule.route
+            best, best_cost = None, math.inf
+            for position in range(1, len(route) + 1 - limit_offset):
+                cost = _insertion_cost(dist, route, node, position)
+                if cost < best_cost and schedule.can_insert(node, position):
+                    best, best_cost = position, cost
+            if best is None:
+                unplaced.append(node)
+            else:
+                route.insert(best, node)
+                schedule.update()
+
+    _relocate(schedule, dist, end is not None)
+    return schedule.route, sorted(unplaced), schedule
+
+def _relocate(schedule: TimeWindowSchedule, dist, fixed_end: bool):
+    """Move single stops to cheaper feasible positions until no move helps."""
+    for _ in range(MAX_RELOCATE_PASSES):
+        improved = False
+        last = len(schedule.route) - (2 if fixed_end else 1)
+        for i in range(1, last + 1):
+            route = schedule.route
+            if i > len(route) - (2 if fixed_end else 1):
+                break
+            node = route[i]
+            prev = route[i - 1]
+            following = route[i + 1] if i + 1 < len(route) else None
+            gain = dist[prev][node] - (dist[prev][following] if following is not None else 0)
+            if following is not None:
+                gain += dist[node][following]
+
+            best, best_delta = None, -IMPROVEMENT_EPSILON
+            for position in range(1, len(route) + (0 if fixed_end else 1)):
+                if position in (i, i + 1):
+                    continue
+                delta = _insertion_cost(dist, route, node, position) - gain
+                # Removing a stop only makes the rest of the route earlier, so the current
+                # slack is a safe bound for the route without it
+                if delta < best_delta and schedule.can_insert(node, position):
+                    best, best_delta = position, delta
+            if best is None:
+                continue
+
+            previous_route = list(route)
+            route.pop(i)
+            route.insert(best - 1 if best > i else best, node)
+            schedule.update()
+            if not schedule.feasible():
+                # Only possible when travel times break the triangle inequality
+                schedule.route = previous_route
+                schedule.update()
+                continue
+            improved = True
+        if not improved:
+            return
+
+def window_arrays(locations: List[Dict], start: int, default_service_hours: float,
+                  depot_service_hours: float = 0.0) -> Tuple[List[float], List[float], List[float]]:
+    """
+    Read optional 'window_start'/'window_end' (hours after departure) and
+    'service_minutes' from location dictionaries into per-index lists.
+    """
+    earliest, latest, service = [], [], []
+    for i, loc in enumerate(locations):
+        earliest.append(loc.get('window_start') or 0.0)
+        window_end = loc.get('window_end')
+        latest.append(math.inf if window_end is None else window_end)
+        if loc.get('service_minutes') is not None:
+            service.append(loc['service_minutes'] / 60)
+        elif i == start or loc.get('is_depot'):
+            service.append(depot_service_hours if i == start else 0.0)
+        else:
+            service.append(default_service_hours)
+    return earliest, latest, service
+
+def has_time_windows(locations: List[Dict]) -> bool:
+    return any(
+        loc.get(key) is not None
+        for loc in locations
+        for key in ('window_start', 'window_end', 'service_minutes')
+    )